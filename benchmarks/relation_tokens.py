@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""
+Builds fixtures with a million M2M links and reports the peak memory use of
+the process. No database is needed, nothing gets loaded.
+
+Run from the source checkout::
+
+    python benchmarks/relation_tokens.py [number_of_links]
+"""
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Configures the same settings as the test suite
+import class_fixtures.tests.runtests
+from class_fixtures.models import Fixture
+from class_fixtures.tests.models import Band, Roadie
+
+LINKS_PER_ROADIE = 10
+
+
+def main(links=1000000):
+    start = time.time()
+    bands = Fixture(Band)
+    for pk in xrange(1, 101):
+        bands.add(pk, name='Band %d' % pk)
+    roadies = Fixture(Roadie)
+    for pk in xrange(1, links // LINKS_PER_ROADIE + 1):
+        # Half of the links point to Fixture-defined bands, half to
+        # pre-existing ones by primary key.
+        hauls_for = [bands.m2m((pk + i) % 100 + 1) for i in xrange(LINKS_PER_ROADIE // 2)]
+        hauls_for += [(pk + i) % 100 + 101 for i in xrange(LINKS_PER_ROADIE // 2)]
+        roadies.add(pk, name='Roadie %d' % pk, hauls_for=hauls_for)
+    elapsed = time.time() - start
+
+    # ru_maxrss is in kilobytes on Linux, bytes on OS X
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    print '%d M2M links in %.1f s, peak memory %.1f MB' % (links, elapsed,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / float(divisor))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,11 @@
+from class_fixtures.serializer import Serializer as ClassSerializer
+from class_fixtures.utils.serialization import dump_columnar_class_fixtures
+
+class Serializer(ClassSerializer):
+    """
+    Serialize a QuerySet (or just a list of objects) into a complete
+    class-based fixture module that uses the compact, columnar
+    ``Fixture.add_rows`` form. Used through ``dumpdata --format=class_columnar``.
+    """
+    def end_serialization(self):
+        dump_columnar_class_fixtures(self.objects, self.stream, **self.options)
@@ -0,0 +1,54 @@
+"""
+A dumpdata variant that dumps a handful of objects and everything they refer
+to, instead of whole apps or models.
+"""
+from optparse import make_option
+
+from django.core import serializers
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import get_model
+
+from class_fixtures.utils.serialization import collect_subset
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--format', default='class', dest='format',
+            help='Specifies the output serialization format for fixtures. '
+                'Defaults to "class".'),
+        make_option('--indent', default=None, dest='indent', type='int',
+            help='Specifies the indent level to use when pretty-printing output'),
+        make_option('--database', action='store', dest='database',
+            default=DEFAULT_DB_ALIAS, help='Nominates a specific database to dump '
+                'fixtures from. Defaults to the "default" database.'),
+        make_option('-n', '--natural', action='store_true', dest='use_natural_keys', default=False,
+            help='Use natural keys if they are available.'),
+    )
+    help = ('Output the given objects and all the objects they refer to, '
+        'directly or through other objects, as a fixture of the given format. '
+        'Without primary keys, all the objects of the model are used.')
+    args = 'appname.ModelName [pk pk ...]'
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError('Enter the model to start from, as appname.ModelName.')
+        label, pks = args[0], args[1:]
+        try:
+            app_label, model_name = label.split('.')
+        except ValueError:
+            raise CommandError('Models are given as appname.ModelName, not "%s".' % label)
+        model = get_model(app_label, model_name)
+        if model is None:
+            raise CommandError('Unknown model: %s' % label)
+        using = options.get('database')
+        format = options.get('format')
+        if format not in serializers.get_public_serializer_formats():
+            raise CommandError('Unknown serialization format: %s' % format)
+
+        if pks:
+            objects = collect_subset(model, pks, using=using)
+        else:
+            objects = collect_subset(model._default_manager.using(using).all())
+        self.stdout.write(serializers.serialize(format, objects,
+            indent=options.get('indent'), use_natural_keys=options.get('use_natural_keys')))
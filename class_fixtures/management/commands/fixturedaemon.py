@@ -0,0 +1,43 @@
+"""
+Keeps fixture modules imported and their load plans prepared, for test
+processes to fetch over a Unix socket. See ``class_fixtures.utils.daemon``.
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from class_fixtures.exceptions import FixtureUsageError
+from class_fixtures.utils.daemon import FixtureDaemon
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--socket', action='store', dest='socket', default=None,
+            help='The Unix socket to listen on. Defaults to the '
+                'CLASS_FIXTURES_DAEMON_SOCKET setting or a file in a '
+                'directory of your own in the temporary directory.'),
+    )
+    help = ('Serves the load plans of class-based fixtures to test processes '
+        'over a Unix socket until interrupted. The plans of the given fixture '
+        'labels are prepared up front.')
+    args = '[fixture ...]'
+
+    def handle(self, *fixture_labels, **options):
+        verbosity = int(options.get('verbosity', 1))
+        try:
+            daemon = FixtureDaemon(options.get('socket'), stdout=self.stdout, verbosity=verbosity)
+        except FixtureUsageError, e:
+            raise CommandError(str(e))
+        try:
+            daemon.bind()
+            if fixture_labels:
+                daemon.get_plan(fixture_labels)
+        except FixtureUsageError, e:
+            daemon.close()
+            raise CommandError(str(e))
+        if verbosity >= 1:
+            self.stdout.write('Serving fixtures on %s, quit with CONTROL-C.\n' % daemon.socket_path)
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
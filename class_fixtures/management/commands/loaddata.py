@@ -3,32 +3,177 @@ Overridden loaddata command for class-based fixtures, with a fallback to the
 original command for traditional file-based fixtures.
 """
 import sys
-from pkgutil import walk_packages
+import time
+import traceback
+from collections import defaultdict
+from optparse import make_option
 from StringIO import StringIO
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 from django.core.management.commands.loaddata import Command as OriginalCommand
 from django.core.management.color import no_style
-from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db import connections, router, transaction, DEFAULT_DB_ALIAS
+from django.utils.importlib import import_module
 
-from class_fixtures.utils.loaddata import (associate_handlers,
-    get_fixtures_from_module, gather_initial_data_fixtures,
-    process_django_output)
+from class_fixtures.utils import get_load_order
+from class_fixtures.utils.db import (DeferredIndexes, FastLoadProfile,
+    get_auto_through_tables)
+from class_fixtures.utils.loaddata import (associate_handlers, ChunkedCommits,
+    collect_class_fixtures, delete_replaced_objects, get_class_fixtures,
+    LoadCheckpoint, process_django_output)
 
 DjangoLoaddata = OriginalCommand()
 
+# How often --watch checks the fixture modules for changes, in seconds
+WATCH_INTERVAL = 1
+
 class Command(BaseCommand):
     help = 'Installs the named fixture(s) in the database. These can be '\
         'file names, names of apps, or "appname.fixture_name" references.'
     args = DjangoLoaddata.args
-    option_list = DjangoLoaddata.option_list
+    option_list = DjangoLoaddata.option_list + (
+        make_option('--lean', action='store_true', dest='lean', default=False,
+            help='Do not keep the loaded objects of class-based fixtures in '
+                'memory until the end of the run. Can also be enabled with '
+                'the CLASS_FIXTURES_LEAN_LOADING setting.'),
+        make_option('--force', action='store_true', dest='force', default=False,
+            help='Load class-based fixtures even if class_fixtures.markers '
+                'says they have already been loaded unchanged.'),
+        make_option('--upsert', action='store_true', dest='upsert', default=False,
+            help='Compare class-based fixtures against the existing objects '
+                'and only write the new objects and the changed fields.'),
+        make_option('--assume-empty', action='store_true', dest='assume_empty', default=False,
+            help='Insert the objects of class-based fixtures without checking '
+                'whether their tables are empty first.'),
+        make_option('--replace', type='choice', choices=['all', 'stale'], dest='replace', default=None,
+            help='Before loading class-based fixtures, delete either all the '
+                'existing objects of their models ("all") or those not '
+                'present in the fixtures ("stale").'),
+        make_option('--fast-load', action='store_true', dest='fast_load', default=False,
+            help='Defer constraint checks and relax durability settings of the '
+                'database for the duration of the load, where supported.'),
+        make_option('--defer-indexes', action='store_true', dest='defer_indexes', default=False,
+            help='Drop the non-unique indexes of the models of class-based '
+                'fixtures before loading and rebuild them afterwards.'),
+        make_option('--commit-every', dest='commit_every', default=None,
+            help='Commit after every N objects written, or after each fixture '
+                'if "fixture" is given, instead of once at the end.'),
+        make_option('--resume', action='store_true', dest='resume', default=False,
+            help='Commit after each fixture and record the progress in a '
+                'checkpoint file, so that running the same command again '
+                'after a failure continues from the fixture that failed.'),
+        make_option('--shard', dest='shard', default=None,
+            help='Load the objects of class-based fixtures into the databases '
+                'that the database routers ("router") or the function at the '
+                'given dotted path (called with the model and primary key of '
+                'each object) choose for them, instead of --database.'),
+        make_option('--provision', dest='provision', default=None,
+            help='Load class-based fixtures into each of the given comma-'
+                'separated SQLite database files, creating their tables, in '
+                'parallel worker processes, instead of --database.'),
+        make_option('--watch', action='store_true', dest='watch', default=False,
+            help='After loading, keep watching the modules of class-based '
+                'fixtures and apply the changes to the database as they are '
+                'saved, until interrupted.'),
+    )
 
     def handle(self, *fixture_labels, **options):
+        if options.get('shard'):
+            return self.handle_sharded(*fixture_labels, **options)
+        if options.get('provision'):
+            return self.handle_provision(*fixture_labels, **options)
         using = options.get('database', DEFAULT_DB_ALIAS)
         connection = connections[using]
         self.style = no_style()
         show_traceback = options.get('traceback', False)
         commit = options.get('commit', True)
+        lean = options.get('lean') or getattr(settings, 'CLASS_FIXTURES_LEAN_LOADING', False)
+        replace = options.get('replace')
+        # Replacing deletes objects that markers say are in place
+        force = options.get('force', False) or bool(replace)
+        upsert = options.get('upsert', False)
+        # (model, using) tuples as keys, booleans telling whether the table
+        # is still empty as values. Shared by all the loads of this run.
+        if options.get('assume_empty', False):
+            empty_tables = defaultdict(lambda: True)
+        else:
+            empty_tables = {}
+
+        def require_own_transaction(option):
+            if not commit:
+                raise CommandError('%s can only be used when loaddata '
+                    'manages its own transaction.' % option)
+
+        resume = options.get('resume', False)
+        commit_every = options.get('commit_every')
+        if resume:
+            require_own_transaction('--resume')
+            if commit_every is None:
+                commit_every = 'fixture'
+        if commit_every is not None:
+            require_own_transaction('--commit-every')
+            if commit_every != 'fixture':
+                try:
+                    commit_every = int(commit_every)
+                except ValueError:
+                    commit_every = 0
+                if commit_every < 1:
+                    raise CommandError('--commit-every takes a positive number '
+                        'of objects or "fixture".')
+        watch = options.get('watch', False)
+        if watch:
+            require_own_transaction('--watch')
+        if watch and [label for label in fixture_labels if isinstance(label, basestring) and ':' in label]:
+            # See associate_selection_handlers
+            raise CommandError('--watch can\'t be used with selections of objects.')
+        if options.get('defer_indexes', False):
+            require_own_transaction('--defer-indexes')
+        if options.get('fast_load', False):
+            require_own_transaction('--fast-load')
+        if 'class_fixtures.markers' in settings.INSTALLED_APPS:
+            from class_fixtures.markers.models import FixtureMarker
+            markers = FixtureMarker.objects.db_manager(using)
+        else:
+            markers = None
+
+        def reset_sequences(verbosity=0):
+            # Like Django's loaddata, reset the sequences of the tables that
+            # objects with explicit primary keys were written to. Django's
+            # loaddata takes care of the serialized fixtures itself.
+            if written_models:
+                sequence_sql = connection.ops.sequence_reset_sql(self.style, list(written_models))
+                if sequence_sql:
+                    if verbosity >= 2:
+                        self.stdout.write("Resetting sequences\n")
+                    for line in sequence_sql:
+                        cursor.execute(line)
+
+        def written_table_names():
+            # Only the tables written to need to be checked for constraint
+            # violations, not the whole database.
+            table_names = set()
+            for model in written_models:
+                table_names.add(model._meta.db_table)
+                for through, fieldname in get_auto_through_tables(model):
+                    table_names.add(through._meta.db_table)
+            return sorted(table_names)
+
+        def report_progress():
+            if chunked_commits is not None:
+                self.stderr.write(chunked_commits.progress() + '\n')
+
+        def abort():
+            # Undo what can be undone after a failure, and tell what was
+            # committed already.
+            if commit:
+                transaction.rollback(using=using)
+                transaction.leave_transaction_management(using=using)
+            if deferred_indexes is not None:
+                deferred_indexes.restore()
+            if profile is not None:
+                profile.restore()
+            report_progress()
 
         # I'm sure there is a valid reason why Django's loaddata does this,
         # so I'm just going to replicate its behaviour.
@@ -39,8 +184,21 @@ class Command(BaseCommand):
             transaction.enter_transaction_management(using=using)
             transaction.managed(True, using=using)
 
+        if options.get('fast_load', False):
+            profile = FastLoadProfile(connection)
+            profile.enable()
+        else:
+            profile = None
+
         total_object_count = 0
         total_fixture_count = 0
+        skipped_fixture_count = 0
+        # (model, pk) tuples as keys, the outcomes of upserts as values
+        upsert_outcomes = {}
+        django_total_object_count = 0
+        # Models of the objects saved from class-based fixtures, for
+        # resetting sequences once all fixtures have been loaded.
+        written_models = set()
         do_initial_data = False
         captured_outputs = []
         original_verbosity = int(options.get('verbosity'))
@@ -53,8 +211,87 @@ class Command(BaseCommand):
             # Build a list of (label, handler, type, resolved_object) tuples.
             fixture_handlers = associate_handlers(fixture_labels)
 
+        # Discover all the class-based fixtures up front, so that everything
+        # that is going to be loaded is known before writing anything.
+        handler_fixtures = []
         for label, handler, type_, obj in fixture_handlers:
-            if handler in ['django', 'both_for_initial']:
+            if handler in ['class_fixtures', 'both_for_initial']:
+                handler_fixtures.append(get_class_fixtures(label, type_, obj))
+            else:
+                handler_fixtures.append([])
+
+        if options.get('defer_indexes', False):
+            index_models = []
+            for fixtures in handler_fixtures:
+                for loaded in get_load_order(fixtures):
+                    if router.allow_syncdb(using, loaded.model):
+                        for model in [loaded.model] + list(loaded.model._meta.get_parent_list()):
+                            if model not in index_models:
+                                index_models.append(model)
+            deferred_indexes = DeferredIndexes(connection, index_models)
+            deferred_indexes.drop()
+        else:
+            deferred_indexes = None
+
+        if resume:
+            # Identify the steps of the plan by the fixture labels only
+            steps = []
+            for (label, handler, type_, obj), fixtures in zip(fixture_handlers, handler_fixtures):
+                if handler in ['django', 'both_for_initial']:
+                    steps.append('django:%s' % label)
+                for fixture in fixtures:
+                    step_label = fixture.label or 'fixture:%s.%s' % (
+                        fixture.model._meta.app_label, fixture.model._meta.object_name)
+                    if type_ == 'selection':
+                        step_label += ' in %s' % label
+                    steps.append(step_label)
+            checkpoint = LoadCheckpoint(steps, using)
+        else:
+            checkpoint = None
+        # The position of the fixture being loaded in the plan
+        step = 0
+        resumed_fixture_count = 0
+
+        if commit_every is not None:
+            def before_commit():
+                reset_sequences()
+                if profile is not None:
+                    profile.check(written_table_names())
+            def after_commit():
+                if profile is not None:
+                    profile.renew()
+                if deferred_indexes is not None:
+                    # The drops can't be rolled back any more
+                    deferred_indexes.transaction_committed()
+            chunked_commits = ChunkedCommits(using, commit_every,
+                before_commit=before_commit, after_commit=after_commit,
+                checkpoint=checkpoint)
+            on_batch = chunked_commits.objects_written
+        else:
+            chunked_commits = None
+            on_batch = None
+
+        # Replace the objects of all the labels at once, before anything is
+        # written, so that the objects of one label aren't deleted as stale
+        # by another. A resumed run has already done so.
+        if replace and not (checkpoint is not None and checkpoint.is_done(0)):
+            all_fixtures = []
+            for fixtures in handler_fixtures:
+                all_fixtures.extend(fixtures)
+            try:
+                emptied = delete_replaced_objects(all_fixtures, using=using,
+                    stale_only=(replace == 'stale'))
+            except Exception:
+                abort()
+                raise
+            for model in emptied:
+                empty_tables[(model, using)] = True
+
+        for (label, handler, type_, obj), fixtures in zip(fixture_handlers, handler_fixtures):
+            if handler in ['django', 'both_for_initial'] and checkpoint is not None and checkpoint.is_done(step):
+                resumed_fixture_count += 1
+                step += 1
+            elif handler in ['django', 'both_for_initial']:
                 captured_stdout = StringIO()
                 # Need to assign manually; normally available to handle() via
                 # BaseCommand.execute(), but not when we're using it this way.
@@ -76,59 +313,55 @@ class Command(BaseCommand):
                         options.update({'database': using})
                     DjangoLoaddata.handle(label, **options)
                 except Exception:
-                    if commit:
-                        transaction.rollback(using=using)
-                        transaction.leave_transaction_management(using=using)
+                    abort()
                     raise
                 django_object_count, django_fixture_count, other_msgs = process_django_output(captured_stdout.getvalue())
                 captured_stdout.close()
                 total_object_count += django_object_count
+                django_total_object_count += django_object_count
                 total_fixture_count += django_fixture_count
                 captured_outputs.extend(other_msgs)
+                if chunked_commits is not None:
+                    chunked_commits.objects_written(django_object_count)
+                    chunked_commits.fixture_done(label, step)
+                step += 1
 
             if handler in ['class_fixtures', 'both_for_initial']:
-                if type_ == 'instance':
-                    fixtures = [label]
-                elif type_ == 'module':
-                    fixtures = get_fixtures_from_module(label)
-                elif type_ == 'submodule_name':
-                    # obj is a reference to an individual submodule of
-                    # the fixtures package of some app.
-                    fixtures = get_fixtures_from_module(obj)
-                elif type_ == 'app_label':
-                    # obj is a reference to the fixtures package of the
-                    # app named in the label. Load all the fixture modules
-                    # contained within, excluding initial_data.
-                    fixtures = []
-                    for importer, module_name, is_pkg in walk_packages(obj.__path__):
-                        if module_name == 'initial_data':
-                            continue
-                        submodule = importer.find_module(module_name).load_module(module_name)
-                        submod_fixtures = get_fixtures_from_module(submodule)
-                        for submod_fixture in submod_fixtures:
-                            # In case the user has a deeper submodule hierarchy in place
-                            # with fixtures imported from submodule to submodule, make sure no fixture
-                            # is included in the list twice through submodule discovery.
-                            if submod_fixture not in fixtures:
-                                fixtures.append(submod_fixture)
-                elif type_ is None and label == 'initial_data':
-                    fixtures = gather_initial_data_fixtures()
-
+                # The primary keys of the objects to load if the label
+                # selects only some, see Fixture.load
+                selected_pks = obj[-1] if type_ == 'selection' else None
                 try:
                     saved_set = set()
                     for fixture in fixtures:
-                        saved_objects = fixture.load(using=using)
+                        fixture_step = step
+                        step += 1
+                        if checkpoint is not None and checkpoint.is_done(fixture_step):
+                            resumed_fixture_count += 1
+                            continue
+                        content_hash = None
+                        if markers is not None and fixture.label is not None and selected_pks is None:
+                            content_hash = fixture.content_hash()
+                            if not force and markers.is_current(fixture.label, content_hash):
+                                skipped_fixture_count += 1
+                                continue
+                        for loaded in get_load_order([fixture]):
+                            if router.allow_syncdb(using, loaded.model):
+                                written_models.add(loaded.model)
+                                written_models.update(loaded.model._meta.get_parent_list())
+                        saved_objects = fixture.load(using=using, lean=lean,
+                            upsert=upsert, outcomes=upsert_outcomes,
+                            empty_tables=empty_tables, on_batch=on_batch, pks=selected_pks)
                         for obj in saved_objects.items():
                             saved_set.add(obj)
                         total_fixture_count += 1
+                        if content_hash is not None:
+                            markers.record(fixture.label, content_hash)
+                        if chunked_commits is not None:
+                            chunked_commits.fixture_done(fixture.label or repr(fixture), fixture_step)
                     total_object_count += len(saved_set)
                 except (SystemExit, KeyboardInterrupt):
                     raise
                 except Exception:
-                    import traceback
-                    if commit:
-                        transaction.rollback(using=using)
-                        transaction.leave_transaction_management(using=using)
                     if show_traceback:
                         traceback.print_exc()
                     else:
@@ -136,17 +369,42 @@ class Command(BaseCommand):
                             self.style.ERROR("Problem installing class-based fixtures: %s" %
                             ''.join(traceback.format_exception(sys.exc_type,
                                  sys.exc_value, sys.exc_traceback))))
+                    abort()
                     return
+
+        reset_sequences(original_verbosity)
+
+        try:
+            if profile is not None:
+                profile.check(written_table_names())
+            if deferred_indexes is not None and not deferred_indexes.commits_implicitly:
+                deferred_indexes.rebuild()
+        except Exception:
+            abort()
+            raise
+
         if commit:
             transaction.commit(using=using)
             transaction.leave_transaction_management(using=using)
+        if deferred_indexes is not None and deferred_indexes.dropped:
+            # The CREATE INDEX statements would have committed the objects
+            # before everything else had been checked, see DeferredIndexes.
+            deferred_indexes.rebuild()
+        if profile is not None:
+            profile.restore()
+        if checkpoint is not None:
+            checkpoint.clear()
 
         # Same MySQL workaround as in Django's loaddata
         if commit:
             connection.close()
 
+        if original_verbosity >= 1 and resumed_fixture_count:
+            self.stdout.write("Resumed after %d fixture(s) loaded by a previous run\n" % resumed_fixture_count)
+        if original_verbosity >= 1 and skipped_fixture_count:
+            self.stdout.write("Skipped %d unchanged fixture(s)\n" % skipped_fixture_count)
         if total_fixture_count == 0:
-            if original_verbosity >= 1:
+            if original_verbosity >= 1 and not (skipped_fixture_count or resumed_fixture_count):
                 self.stdout.write("No fixtures found.\n")
         else:
             if original_verbosity >= 2 and captured_outputs:
@@ -160,5 +418,115 @@ class Command(BaseCommand):
                 # The original loaddata has another possible output format
                 # used when less objects were loaded than were present in the
                 # fixtures, but I don't care enough to implement it.
-                self.stdout.write("Installed %d object(s) from %d fixture(s)\n" %
-                    (total_object_count, total_fixture_count))
+                if upsert:
+                    outcomes = upsert_outcomes.values()
+                    # Django saves the objects of its fixtures regardless,
+                    # so count them as updated.
+                    updated = django_total_object_count + outcomes.count('updated')
+                    self.stdout.write("Inserted %d, updated %d and left %d unchanged object(s) from %d fixture(s)\n" %
+                        (outcomes.count('inserted'), updated, outcomes.count('unchanged'), total_fixture_count))
+                else:
+                    self.stdout.write("Installed %d object(s) from %d fixture(s)\n" %
+                        (total_object_count, total_fixture_count))
+
+        if watch:
+            self.watch(handler_fixtures, using, original_verbosity)
+
+    def watch(self, handler_fixtures, using, verbosity):
+        """
+        Applies the edits of the modules that the class-based fixtures came
+        from to the database as they're saved, with
+        ``class_fixtures.utils.watch``, until interrupted.
+        """
+        from class_fixtures.utils.watch import FixtureWatcher
+        modules = []
+        for fixtures in handler_fixtures:
+            for fixture in fixtures:
+                if fixture.label and '.' in fixture.label:
+                    module = sys.modules.get(fixture.label.rsplit('.', 1)[0])
+                    if module is not None and module not in modules:
+                        modules.append(module)
+        if not modules:
+            raise CommandError('No fixture modules to watch.')
+        watcher = FixtureWatcher(modules, using=using)
+        if verbosity >= 1:
+            self.stdout.write("Watching %d fixture module(s) for changes, quit with CONTROL-C.\n" % len(modules))
+        try:
+            while True:
+                time.sleep(WATCH_INTERVAL)
+                try:
+                    changes = watcher.poll()
+                except Exception:
+                    self.stderr.write(self.style.ERROR("Problem reloading class-based fixtures: %s" %
+                        traceback.format_exc()))
+                    continue
+                if changes is not None and verbosity >= 1:
+                    module_names, inserted, updated, deleted = changes
+                    self.stdout.write("Reloaded %s: inserted %d, updated %d and deleted %d object(s)\n" %
+                        (', '.join(module_names), inserted, updated, deleted))
+        except KeyboardInterrupt:
+            pass
+
+    def handle_sharded(self, *fixture_labels, **options):
+        """
+        Loads class-based fixtures with ``class_fixtures.utils.sharding``,
+        each database in a thread and transaction of its own.
+        """
+        from class_fixtures.utils.sharding import load_sharded, router_shard
+        self.style = no_style()
+        fixtures = self.get_class_fixtures_only(fixture_labels, 'shard', options)
+        shard = options['shard']
+        if shard == 'router':
+            shard_for = router_shard
+        else:
+            try:
+                module_path, function_name = shard.rsplit('.', 1)
+                shard_for = getattr(import_module(module_path), function_name)
+            except (ValueError, ImportError, AttributeError):
+                raise CommandError('--shard takes "router" or the dotted path '
+                    'of a function, not "%s".' % shard)
+
+        lean = options.get('lean') or getattr(settings, 'CLASS_FIXTURES_LEAN_LOADING', False)
+        object_counts = load_sharded(fixtures, shard_for, lean=lean)
+        if int(options.get('verbosity', 1)) >= 1:
+            if not fixtures:
+                self.stdout.write("No fixtures found.\n")
+            else:
+                self.stdout.write("Installed %d object(s) from %d fixture(s) into %d database(s)\n" %
+                    (sum(object_counts.values()), len(fixtures), len(object_counts)))
+
+    def handle_provision(self, *fixture_labels, **options):
+        """
+        Loads class-based fixtures into several SQLite database files with
+        ``class_fixtures.utils.provisioning``.
+        """
+        from class_fixtures.utils.provisioning import provision_sqlite_databases
+        self.style = no_style()
+        fixtures = self.get_class_fixtures_only(fixture_labels, 'provision', options)
+        paths = [path.strip() for path in options['provision'].split(',') if path.strip()]
+        if not paths:
+            raise CommandError('--provision takes a comma-separated list of database files.')
+        object_counts = provision_sqlite_databases(fixtures, paths)
+        if int(options.get('verbosity', 1)) >= 1:
+            if not fixtures:
+                self.stdout.write("No fixtures found.\n")
+            else:
+                self.stdout.write("Installed %d object(s) from %d fixture(s) into each of %d database(s)\n" %
+                    (object_counts[0], len(fixtures), len(paths)))
+
+    def get_class_fixtures_only(self, fixture_labels, mode, options):
+        """
+        Returns the class-based fixtures for ``fixture_labels`` in the
+        ``--shard`` and ``--provision`` modes, which don't support serialized
+        fixtures nor the options that change how objects are written.
+        """
+        for option in ['upsert', 'replace', 'resume', 'commit_every', 'fast_load', 'defer_indexes', 'watch']:
+            if options.get(option):
+                raise CommandError('--%s can\'t be used with --%s.' % (option.replace('_', '-'), mode))
+        if not options.get('commit', True):
+            raise CommandError('--%s can only be used when loaddata '
+                'manages its own transactions.' % mode)
+        fixtures, serialized_labels = collect_class_fixtures(fixture_labels)
+        if serialized_labels:
+            raise CommandError('Serialized fixtures can\'t be loaded with --%s: %s' % (mode, serialized_labels[0]))
+        return fixtures
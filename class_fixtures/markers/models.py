@@ -0,0 +1,50 @@
+"""
+An optional app recording which class-based fixtures have been loaded into
+which database, so that ``loaddata`` can skip the ones that haven't changed
+since. Add ``class_fixtures.markers`` to ``INSTALLED_APPS`` to enable it.
+"""
+from django.db import models, router
+try:
+    from django.utils.timezone import now # Django 1.4 onwards
+except ImportError:
+    from datetime import datetime
+    now = datetime.now
+
+
+class FixtureMarkerManager(models.Manager):
+    def _markers_allowed(self):
+        return router.allow_syncdb(self.db, self.model)
+
+    def is_current(self, label, content_hash):
+        """
+        Returns True if the fixture labeled ``label`` was last loaded into
+        this database with the same ``content_hash``.
+        """
+        if content_hash is None or not self._markers_allowed():
+            return False
+        return self.filter(label=label, content_hash=content_hash).exists()
+
+    def record(self, label, content_hash):
+        """
+        Records the fixture labeled ``label`` as having been loaded into this
+        database with ``content_hash``.
+        """
+        if content_hash is None or not self._markers_allowed():
+            return
+        if not self.filter(label=label).update(content_hash=content_hash, loaded=now()):
+            self.create(label=label, content_hash=content_hash)
+
+
+class FixtureMarker(models.Model):
+    """
+    The content hash of a class-based fixture at the time it was last loaded
+    into the database this row lives in.
+    """
+    label = models.CharField(max_length=255, unique=True)
+    content_hash = models.CharField(max_length=40)
+    loaded = models.DateTimeField(auto_now=True)
+
+    objects = FixtureMarkerManager()
+
+    def __unicode__(self):
+        return self.label
@@ -2,8 +2,13 @@ try:
     from collections import OrderedDict # Python 2.7 onwards
 except ImportError:
     from class_fixtures.utils.ordereddict import OrderedDict
+import csv
+import hashlib
+import random
+import threading
 from collections import Iterable
 
+from django.core.exceptions import ValidationError
 from django.db import models, router
 from django.db.models.fields.related import (
     SingleRelatedObjectDescriptor as srod,
@@ -12,13 +17,21 @@ from django.db.models.fields.related import (
     ReverseManyRelatedObjectsDescriptor as rmrod,
     )
 from class_fixtures.exceptions import FixtureUsageError, RelatedObjectError
+from class_fixtures.utils import chunked, get_load_order
+from class_fixtures.utils.db import bulk_insert, save_batch, unload_fixtures
+from class_fixtures.utils.storage import ColumnarStorage
 
 try:
     from milkman.dairy import milkman
 except ImportError:
     milkman = None
 
-__all__ = ['Fixture']
+__all__ = ['Fixture', 'LazyFixture', 'CSVFixture', 'ReplicatedFixture', 'replicate']
+
+# Milkman's generators use the global state of the random module, which the
+# seeded random ranges swap in and out. Loads running in several threads at
+# once, like those of sharded loading, take turns generating objects.
+_random_lock = threading.Lock()
 
 class Fixture(object):
     """
@@ -41,15 +54,41 @@ class Fixture(object):
 
     For the full details, see the documentation.
     """
+    # How many definitions FixtureLoader processes at a time.
+    batch_size = 500
+    # Identifies the Fixture in the marker table of class_fixtures.markers.
+    # Assigned by the loaddata command to fixtures discovered in modules,
+    # as "dotted.module.path.attribute_name".
+    label = None
+    # Whether the relation tokens of the definitions are shared, see
+    # _share_loader.
+    shares_loaders = True
+
     def __init__(self, model, raw=False):
-        # PK values as keys, object definition kwargs as values.
-        # Populated by add() calls.
-        self._kwarg_storage = OrderedDict()
+        # PK values as keys, object definition kwargs as values, stored in
+        # columns to save memory. Populated by add() calls.
+        self._kwarg_storage = ColumnarStorage()
         # Stores references to Fixture instances that need to be loaded
         # before this one. Populated by add() calls.
         self._dependencies = []
         # Set to False just before the first loading attempt.
         self._adding_allowed = True
+        # Field names as keys, (field_is_m2m, other_model) tuples as values.
+        # Populated by _get_relation_info.
+        self._relation_cache = {}
+        # Field names as keys, booleans as values. Populated by _is_m2m_field.
+        self._m2m_field_cache = {}
+        # RandomRange instances. Populated by add_random_range() calls.
+        self._random_ranges = []
+        # Shared ObjectLoader instances, so that every reference to the same
+        # object in the stored definitions is represented by the same token.
+        # PK values as keys for the DelayedRelatedObjectLoaders pointing to
+        # this Fixture, (model, type, identifier) tuples for
+        # RelatedObjectLoaders.
+        self._delayed_loaders = {}
+        self._related_loaders = {}
+        # A (number of stored definitions, index) tuple, see _get_pk_index
+        self._pk_index = None
         # Enable DeserializedObject-like raw saves that bypass custom save
         # methods (which Django's loaddata does)
         self.raw = raw
@@ -60,6 +99,15 @@ class Fixture(object):
         else:
             raise TypeError('%s is not a Django model class' % model.__name__)
 
+    @classmethod
+    def from_csv(cls, model, path, pk_column, **kwargs):
+        """
+        Returns a ``CSVFixture`` that reads its object definitions from the
+        CSV file at ``path`` when loaded. See ``CSVFixture`` for the
+        available keyword arguments.
+        """
+        return CSVFixture(model, path, pk_column, **kwargs)
+
     def add(self, *args, **kwargs):
         """
         A tiny gatekeeper method. Checks that ``args`` contains precisely one
@@ -93,7 +141,7 @@ class Fixture(object):
         """
         if not self._adding_allowed:
             raise FixtureUsageError('Cannot add more objects to a loaded fixture')
-        if pk in self._kwarg_storage:
+        if pk in self._kwarg_storage or self._in_random_range(pk):
             raise FixtureUsageError('Primary key %s already added to another object in the same fixture.' % pk)
 
         definitions = self._build_relations(**kwargs)
@@ -112,7 +160,7 @@ class Fixture(object):
         """
         if milkman is None:
             raise FixtureUsageError('Milkman is not installed, Fixture.add_random() not available.')
-        if pk in self._kwarg_storage:
+        if pk in self._kwarg_storage or self._in_random_range(pk):
             raise FixtureUsageError('Primary key %s already added to another object in the same fixture.' % pk)
 
         definitions = self._build_relations(**kwargs)
@@ -120,17 +168,216 @@ class Fixture(object):
         definitions.update({'pk': pk})
         self._kwarg_storage[pk] = DelayedMilkmanDelivery(**definitions)
 
+    def add_random_range(self, first_pk, last_pk, seed=None, **overrides):
+        """
+        Creates randomly generated model instances for every primary key from
+        ``first_pk`` to ``last_pk`` (inclusive), using the value generators of
+        Milkman, if it is installed. Raises a FixtureUsageError if not.
+
+        Unlike with ``add_random``, nothing is stored per object. The values
+        are generated in batches at load time and written with bulk INSERTs,
+        which means that custom save methods are bypassed like in raw mode.
+        With a ``seed``, the same values are generated on every load.
+
+        ``overrides`` are like the keyword arguments of ``add``, shared by
+        every object. Callable values are called with the primary key of each
+        object to produce a value for it. Values for required relation fields
+        must be given, since they are not generated.
+        """
+        if milkman is None:
+            raise FixtureUsageError('Milkman is not installed, Fixture.add_random_range() not available.')
+        if not self._adding_allowed:
+            raise FixtureUsageError('Cannot add more objects to a loaded fixture')
+        if not all([isinstance(pk, (int, long)) for pk in (first_pk, last_pk)]) or first_pk > last_pk:
+            raise FixtureUsageError('add_random_range() requires integer primary keys, first_pk <= last_pk')
+        for pk in self._kwarg_storage:
+            if isinstance(pk, (int, long)) and first_pk <= pk <= last_pk:
+                raise FixtureUsageError('Primary key %s already added to another object in the same fixture.' % pk)
+        for other in self._random_ranges:
+            if first_pk <= other.last_pk and other.first_pk <= last_pk:
+                raise FixtureUsageError('Primary keys %s-%s overlap with another '\
+                    'add_random_range() call in the same fixture.' % (first_pk, last_pk))
+
+        factories = dict([(k, v) for k, v in overrides.items() if callable(v)])
+        values = self._build_relations(**dict([(k, v) for k, v in overrides.items() if k not in factories]))
+        m2m_values = {}
+        for fieldname in values.keys():
+            field_is_m2m, other_model = self._get_relation_info(fieldname)
+            if field_is_m2m:
+                if fieldname not in [f.name for f in self.model._meta.many_to_many]:
+                    raise FixtureUsageError('add_random_range() only supports M2M '\
+                        'relations through the ManyToManyField itself, not "%s"' % fieldname)
+                m2m_values[fieldname] = values.pop(fieldname)
+        for field in self.model._meta.fields:
+            if field.rel and not field.primary_key and field.name not in overrides and \
+                not (field.has_default() or field.blank or field.null):
+                raise FixtureUsageError('add_random_range() needs a value for the "%s" relation field' % field.name)
+
+        self._random_ranges.append(RandomRange(first_pk, last_pk, seed, values, m2m_values, factories))
+
+    def add_rows(self, field_names, rows):
+        """
+        Bulk-adds model instance definitions in a columnar form: a tuple of
+        field names followed by an iterable of row tuples, each starting with
+        the primary key and followed by one value per field name::
+
+            bands.add_rows(('name', 'genre'), (
+                (1, "Bar Fighters", "Rock"),
+                (2, "Brutallica", "Metal"),
+            ))
+
+        This is the form used by the ``class_columnar`` ``dumpdata`` format.
+        The relation handling of each field is determined once per call
+        instead of once per row, making this considerably faster than the
+        equivalent series of ``add`` calls for large fixtures.
+        """
+        if not self._adding_allowed:
+            raise FixtureUsageError('Cannot add more objects to a loaded fixture')
+        field_names = tuple(field_names)
+        relation_info = self._get_column_relation_info(field_names)
+        width = len(field_names) + 1
+
+        storage = self._kwarg_storage
+        for row in rows:
+            if len(row) != width:
+                raise FixtureUsageError('Row %r does not match the %d field '\
+                    'names given to add_rows().' % (row, len(field_names)))
+            pk = row[0]
+            if pk in storage or self._in_random_range(pk):
+                raise FixtureUsageError('Primary key %s already added to another object in the same fixture.' % pk)
+            storage[pk] = self._build_row_relations(field_names, relation_info, pk, row[1:])
+
+    def _in_random_range(self, pk):
+        for random_range in self._random_ranges:
+            if random_range.first_pk <= pk <= random_range.last_pk:
+                return True
+        return False
+
+    def _get_column_relation_info(self, field_names):
+        """
+        Returns ``(index, fieldname, field_is_m2m, other_model)`` tuples for
+        the relation fields among ``field_names``, for use with
+        ``_build_row_relations``.
+        """
+        relation_info = [(i, fieldname) + self._get_relation_info(fieldname)
+            for i, fieldname in enumerate(field_names)]
+        return [info for info in relation_info if info[3] is not None]
+
+    def _build_row_relations(self, field_names, relation_info, pk, values):
+        """
+        The columnar equivalent of ``_build_relations``. Returns a definition
+        dictionary for a single row of ``values`` corresponding to
+        ``field_names``, including the primary key.
+        """
+        definitions = dict(zip(field_names, values))
+        for i, fieldname, field_is_m2m, other_model in relation_info:
+            value = values[i]
+            if field_is_m2m:
+                if not isinstance(value, Iterable):
+                    raise FixtureUsageError('Non-iterable value %s passed to '\
+                        'the "%s" M2M field in an add_rows() call.' % (value, fieldname))
+                definitions[fieldname] = self._wrap_related_values(other_model, value)
+            elif isinstance(value, DelayedRelatedObjectLoader):
+                self._add_dependency(value.fixture_instance)
+                definitions[fieldname] = self._share_loader(value)
+            elif value:
+                definitions[fieldname] = self._get_related_loader(other_model, value)
+        definitions['pk'] = pk
+        return definitions
+
+    def _get_relation_info(self, fieldname):
+        """
+        Returns a ``(field_is_m2m, other_model)`` tuple describing the
+        relation that ``fieldname`` refers to in ``self.model``.
+        ``other_model`` is None if ``fieldname`` is not a relation.
+
+        The result only depends on the model class, so it is cached per
+        field name.
+        """
+        try:
+            return self._relation_cache[fieldname]
+        except KeyError:
+            pass
+        # The name given to a ManyToManyField in a model definition will
+        # actually become a descriptor with that name. In the model where
+        # the field is included in, it becomes a
+        # ReverseManyRelatedObjectsDescriptor. In the "target" model, a
+        # ManyRelatedObjectsDescriptor (foobar_set by default) is created.
+        # See if the field name we're examining is either of those.
+        #
+        # The model class itself won't have attributes named after
+        # its fields, except the descriptors created by FK/M2M/O2O
+        # fields, which are precisely what we're after here.
+        descriptor = getattr(self.model, fieldname, None)
+        field_is_m2m = isinstance(descriptor, (mrod, rmrod))
+        other_model = None
+        # Find the other end of the relation
+        if descriptor:
+            if isinstance(descriptor, (rsrod, rmrod)):
+                # fieldname refers to a descriptor in the model that
+                # contains the FK/M2M/O2O field definition
+                other_model = descriptor.field.related.parent_model
+            elif isinstance(descriptor, (srod, mrod)):
+                # fieldname refers to the automatically created
+                # attribute in the target model of the FK/M2M/O2O
+                other_model = descriptor.related.model
+            else:
+                from django.db.models.fields.related import ForeignRelatedObjectsDescriptor
+                if isinstance(descriptor, ForeignRelatedObjectsDescriptor):
+                    raise RelatedObjectError('Cannot define foreign key relation from the target end')
+                else:
+                    raise RelatedObjectError('Unknown descriptor-related '\
+                        'error condition. Please file a bug report for '\
+                        'django-class-fixtures.')
+        self._relation_cache[fieldname] = (field_is_m2m, other_model)
+        return field_is_m2m, other_model
+
+    def _is_m2m_field(self, fieldname):
+        """
+        Tells ``FixtureLoader`` whether ``fieldname`` needs to be assigned
+        with a post-save M2M addition. Cached per field name like
+        ``_get_relation_info``, so that it is only figured out once no matter
+        how many definitions or loads there are.
+        """
+        try:
+            return self._m2m_field_cache[fieldname]
+        except KeyError:
+            # See _get_relation_info for the descriptors involved.
+            is_m2m = isinstance(getattr(self.model, fieldname, None), (mrod, rmrod))
+            self._m2m_field_cache[fieldname] = is_m2m
+            return is_m2m
+
+    def _add_dependency(self, fixture_instance):
+        """
+        Records ``fixture_instance`` as a Fixture that needs to be loaded
+        before this one.
+        """
+        if self in fixture_instance._dependencies:
+            raise RelatedObjectError('Circular dependency between '\
+                'Fixture instances for %s and %s' %
+                (self.model, fixture_instance.model))
+        if fixture_instance not in self._dependencies and fixture_instance != self:
+            self._dependencies.append(fixture_instance)
+
+    def _wrap_related_values(self, other_model, values):
+        """
+        Turns an iterable of M2M values into a list of ObjectLoaders,
+        registering the Fixtures of any DelayedRelatedObjectLoaders as
+        dependencies.
+        """
+        loaders = []
+        for v in values:
+            if isinstance(v, DelayedRelatedObjectLoader):
+                self._add_dependency(v.fixture_instance)
+                loaders.append(self._share_loader(v))
+            else:
+                loaders.append(self._get_related_loader(other_model, v))
+        return loaders
+
     def _build_relations(self, **kwargs):
         for fieldname, value in kwargs.items():
-            field_is_m2m = False
-            # The name given to a ManyToManyField in a model definition will
-            # actually become a descriptor with that name. In the model where
-            # the field is included in, it becomes a
-            # ReverseManyRelatedObjectsDescriptor. In the "target" model, a
-            # ManyRelatedObjectsDescriptor (foobar_set by default) is created.
-            # See if the field name we're examining is either of those.
-            if any([isinstance(getattr(self.model, fieldname, None), m2m_descriptor) for m2m_descriptor in [mrod, rmrod]]):
-                field_is_m2m = True
+            field_is_m2m, other_model = self._get_relation_info(fieldname)
+            if field_is_m2m:
                 # M2Ms must be expressed as iterables (iterables of iterables
                 # in case of natural keys). A single natural key tuple will
                 # pass this check, but fail another one later on.
@@ -148,63 +395,31 @@ class Fixture(object):
             else:
                 value_list = value
 
-            if any([isinstance(v, DelayedRelatedObjectLoader) for v in value_list]):
-                # Add the Fixture instances that DelayedRelatedObjectLoaders
-                # point to as dependencies that need to be loaded before this
-                # Fixture.
-                for v in value_list:
-                    if isinstance(v, DelayedRelatedObjectLoader):
-                        if self in v.fixture_instance._dependencies:
-                            raise RelatedObjectError('Circular dependency between '\
-                                'Fixture instances for %s and %s' %
-                                self.model, v.fixture_instance.model)
-                        if v.fixture_instance not in self._dependencies and v.fixture_instance != self:
-                            self._dependencies.append(v.fixture_instance)
+            # Add the Fixture instances that DelayedRelatedObjectLoaders
+            # point to as dependencies that need to be loaded before this
+            # Fixture.
+            for v in value_list:
+                if isinstance(v, DelayedRelatedObjectLoader):
+                    self._add_dependency(v.fixture_instance)
 
             # Case 2: Relating to pre-existing objects, not ones getting
             # created in the fixture loading process.
-
-            # The model class itself won't have attributes named after
-            # its fields, except the descriptors created by FK/M2M/O2O
-            # fields, which are precisely what we're after here.
-            descriptor = getattr(self.model, fieldname, None)
-            # Find the other end of the relation
-            if descriptor:
-                if any([isinstance(descriptor, rev_rel_descriptor) for rev_rel_descriptor in [rsrod, rmrod]]):
-                    # fieldname refers to a descriptor in the model that
-                    # contains the FK/M2M/O2O field definition
-                    other_model = descriptor.field.related.parent_model
-                elif any([isinstance(descriptor, rel_descriptor) for rel_descriptor in [srod, mrod]]):
-                    # fieldname refers to the automatically created
-                    # attribute in the target model of the FK/M2M/O2O
-                    other_model = descriptor.related.model
-                else:
-                    from django.db.models.fields.related import ForeignRelatedObjectsDescriptor
-                    if isinstance(descriptor, ForeignRelatedObjectsDescriptor):
-                        raise RelatedObjectError('Cannot define foreign key relation from the target end')
-                    else:
-                        raise RelatedObjectError('Unknown descriptor-related '\
-                            'error condition. Please file a bug report for '\
-                            'django-class-fixtures.')
-
-                # Turn any values that don't evaluate to boolean False and are
-                # not DelayedRelatedObjectLoaders into RelatedObjectLoader
-                # instances.
-                if value:
-                    if not field_is_m2m and not isinstance(value, DelayedRelatedObjectLoader):
-                        kwargs.update({fieldname: RelatedObjectLoader(other_model, value)})
-                    elif field_is_m2m:
-                        loaders = []
-                        for v in value_list:
-                            if not isinstance(v, DelayedRelatedObjectLoader):
-                                loaders.append(RelatedObjectLoader(other_model, v))
-                            else:
-                                loaders.append(v)
-                        kwargs.update({fieldname: loaders})
+            #
+            # Turn any values that don't evaluate to boolean False and are
+            # not DelayedRelatedObjectLoaders into RelatedObjectLoader
+            # instances.
+            if other_model is not None and value:
+                if not field_is_m2m and isinstance(value, DelayedRelatedObjectLoader):
+                    kwargs.update({fieldname: self._share_loader(value)})
+                elif not field_is_m2m:
+                    kwargs.update({fieldname: self._get_related_loader(other_model, value)})
+                elif field_is_m2m:
+                    kwargs.update({fieldname: self._wrap_related_values(other_model, value_list)})
 
         return kwargs
 
-    def load(self, using=None):
+    def load(self, using=None, lean=False, upsert=False, outcomes=None, empty_tables=None,
+            on_batch=None, pks=None):
         """
         Creates model instances from the stored definitions and writes them
         to the database.
@@ -213,21 +428,184 @@ class Fixture(object):
         fixture discovery and loading process of the overridden ``loaddata``
         command.
 
-        Returns the number of objects saved to the database.
+        Returns a dictionary of the saved objects, keyed by primary key.
+        With ``lean=True``, the saved objects are not kept around and the
+        dictionary values are model classes instead of model instances.
+
+        The stored definitions are not modified, so a Fixture can be loaded
+        any number of times, e.g. again into a flushed database. Related
+        objects are looked up anew on every load.
+
+        With ``upsert=True``, existing objects are compared against the
+        definitions and only the changed fields of changed objects are
+        written. If ``outcomes`` is a dictionary, ``(model, pk)`` tuples are
+        recorded in it as keys, with "inserted", "updated" or "unchanged" as
+        values.
+
+        Objects are written to empty tables with plain INSERTs, skipping the
+        UPDATE attempts of ordinary saves. ``empty_tables`` is a dictionary
+        shared by all the loads of one ``loaddata`` run, with ``(model,
+        using)`` tuples as keys and booleans telling whether the table is
+        (still) empty as values. Missing keys are checked with a query.
+
+        If given, ``on_batch`` is called with the number of objects written
+        after each batch of them, e.g. for committing as the load goes.
+
+        With ``pks``, only the objects with those primary keys are loaded,
+        along with the objects of other Fixtures they refer to, directly or
+        through other objects, and nothing else. Primary keys that this
+        Fixture doesn't define are ignored.
         """
         self._adding_allowed = False
         saved_objects = {}
+        if empty_tables is None:
+            empty_tables = {}
+
+        if pks is not None:
+            closure = self._get_closure(pks)
+            for fixture in get_load_order([self]):
+                if fixture not in closure:
+                    continue
+                fl = FixtureLoader(fixture, batch_size=fixture.batch_size, lean=lean,
+                    upsert=upsert, outcomes=outcomes, empty_tables=empty_tables,
+                    on_batch=on_batch, pks=closure[fixture])
+                saved_objects.update(fl.load(using=using, raw=fixture.raw))
+                fl.create_m2m_relations(using=using)
+            return saved_objects
 
         # Load any unloaded dependencies of this instance first
         for dep in self._dependencies:
-            saved_objects.update(dep.load(using=using))
+            saved_objects.update(dep.load(using=using, lean=lean, upsert=upsert,
+                outcomes=outcomes, empty_tables=empty_tables, on_batch=on_batch))
 
         # Offload the actual processing to a FixtureLoader instance
-        fl = FixtureLoader(self._kwarg_storage, self)
+        fl = FixtureLoader(self, batch_size=self.batch_size, lean=lean,
+            upsert=upsert, outcomes=outcomes, empty_tables=empty_tables,
+            on_batch=on_batch)
         saved_objects.update(fl.load(using=using, raw=self.raw))
         fl.create_m2m_relations(using=using)
         return saved_objects
 
+    def unload(self, using=None):
+        """
+        Deletes the objects of this Fixture and its dependencies from the
+        database, along with their M2M relations, restoring the state of the
+        affected tables to what it was before ``load``. Objects that existed
+        before the load and got overwritten by it are deleted as well.
+
+        Meant as a fast alternative to flushing the whole database between
+        tests, it deletes in bulk without collecting related objects or
+        sending signals, so anything outside the fixtures relating to the
+        deleted objects is your responsibility.
+        """
+        unload_fixtures([self], using=using)
+
+    def content_hash(self):
+        """
+        Returns a hex digest of everything that goes into the database when
+        this Fixture is loaded, including its dependencies. Used by
+        ``class_fixtures.markers`` to tell whether the Fixture has changed
+        since it was last loaded.
+
+        Returns None if the contents can't be reliably hashed, which is the
+        case for ``add_random_range`` calls with callable overrides.
+        """
+        digest = hashlib.sha1()
+        digest.update(repr((self.model._meta.app_label, self.model._meta.object_name, self.raw)))
+        for dep in self._dependencies:
+            dep_hash = dep.content_hash()
+            if dep_hash is None:
+                return None
+            digest.update(dep_hash)
+        for pk, definitions in self._iter_definitions():
+            digest.update(repr((type(definitions).__name__, pk, sorted(
+                [(fieldname, _hashable_value(value)) for fieldname, value in definitions.items() if fieldname != 'pk']))))
+        for random_range in self._random_ranges:
+            if random_range.factories:
+                return None
+            digest.update(repr((random_range.first_pk, random_range.last_pk, random_range.seed,
+                sorted([(fieldname, _hashable_value(value)) for fieldname, value in random_range.values.items()]),
+                sorted([(fieldname, _hashable_value(value)) for fieldname, value in random_range.m2m_values.items()]))))
+        return digest.hexdigest()
+
+    def _iter_definitions(self):
+        """
+        Yields ``(pk, definitions)`` tuples for ``FixtureLoader`` to create
+        objects from. Subclasses that don't keep their definitions in
+        ``_kwarg_storage`` override this.
+        """
+        return self._kwarg_storage.iteritems()
+
+    def _iter_selected_definitions(self, pks):
+        """
+        Like ``_iter_definitions``, but only yields the definitions whose
+        primary keys, converted with the primary key field of the model, are
+        in the set ``pks``. They come in the order they were added in.
+        """
+        index = self._get_pk_index()
+        selected = sorted([index[pk] for pk in pks if pk in index])
+        for position, pk in selected:
+            yield pk, self._kwarg_storage[pk]
+
+    def _get_pk_index(self):
+        """
+        Returns a dictionary with the primary keys of the stored definitions,
+        converted with the primary key field of the model, as keys and
+        ``(position, stored primary key)`` tuples as values. Built once, and
+        again only if definitions have been added since.
+        """
+        count = len(self._kwarg_storage)
+        if self._pk_index is None or self._pk_index[0] != count:
+            to_python = self.model._meta.pk.to_python
+            self._pk_index = (count, dict([(to_python(pk), (position, pk))
+                for position, pk in enumerate(self._kwarg_storage.iterkeys())]))
+        return self._pk_index[1]
+
+    def _get_closure(self, pks):
+        """
+        Returns a dictionary with this Fixture and the Fixtures that its
+        objects with primary keys ``pks`` refer to, directly or indirectly,
+        as keys and sets of the primary keys of the referred objects as
+        values. Only references to objects defined in Fixtures are followed,
+        pre-existing objects are already there.
+        """
+        closure = {}
+        # Fixtures as keys, sets of primary keys still to be examined as
+        # values
+        pending = {self: set([self.model._meta.pk.to_python(pk) for pk in pks])}
+        while pending:
+            fixture, fixture_pks = pending.popitem()
+            new_pks = fixture_pks - closure.setdefault(fixture, set())
+            if not new_pks:
+                continue
+            closure[fixture].update(new_pks)
+            values = []
+            for pk, definitions in fixture._iter_selected_definitions(new_pks):
+                values.extend(definitions.values())
+            for random_range in fixture._random_ranges:
+                if [pk for pk in new_pks if random_range.first_pk <= pk <= random_range.last_pk]:
+                    values.extend(random_range.values.values())
+                    values.extend(random_range.m2m_values.values())
+            for value in values:
+                if not isinstance(value, (list, tuple)):
+                    value = [value]
+                for v in value:
+                    if isinstance(v, DelayedRelatedObjectLoader):
+                        other = v.fixture_instance
+                        pending.setdefault(other, set()).add(other.model._meta.pk.to_python(v.pk))
+        return closure
+
+    def iter_pks(self):
+        """
+        Yields the primary keys of all the objects this Fixture loads, not
+        including those of its dependencies.
+        """
+        for pk in self._kwarg_storage.iterkeys():
+            yield pk
+        for random_range in self._random_ranges:
+            for pk in xrange(random_range.first_pk, random_range.last_pk + 1):
+                yield pk
+
     def get_object_by_pk(self, pk, using=None):
         try:
             return self.model._default_manager.db_manager(using).get(pk=pk)
@@ -247,25 +625,366 @@ class Fixture(object):
         return DelayedRelatedObjectLoader(self, pk)
     fk = m2m = o2o = _create_delayed_relation
 
+    def _share_loader(self, loader):
+        """
+        Returns the DelayedRelatedObjectLoader that the stored definitions
+        use for the object of ``loader``, which becomes it if there is none
+        yet.
+        """
+        if not self.shares_loaders:
+            return loader
+        return loader.fixture_instance._delayed_loaders.setdefault(loader.pk, loader)
+
+    def _get_related_loader(self, model, identifier):
+        """
+        Returns a RelatedObjectLoader for ``identifier``, reusing an existing
+        one if the same identifier has been seen before. Model instances and
+        unhashable identifiers always get a new one.
+        """
+        if isinstance(identifier, models.Model) or not self.shares_loaders:
+            return RelatedObjectLoader(model, identifier)
+        key = (model, type(identifier), identifier)
+        try:
+            return self._related_loaders[key]
+        except KeyError:
+            loader = self._related_loaders[key] = RelatedObjectLoader(model, identifier)
+            return loader
+        except TypeError:
+            return RelatedObjectLoader(model, identifier)
+
+
+class LazyFixture(Fixture):
+    """
+    A Fixture whose object definitions are generated at load time instead of
+    being added beforehand. ``source`` is a callable returning an iterable of
+    ``(pk, kwargs)`` tuples, where ``kwargs`` are what would otherwise be
+    given to ``add``::
+
+        def generate_bands():
+            for i in xrange(1, 1000001):
+                yield i, {'name': 'Band #%d' % i}
+
+        bands = LazyFixture(Band, generate_bands)
+
+    ``source`` is called anew for every load, and its output consumed
+    ``batch_size`` definitions at a time, so the definitions are never all
+    held in memory at once.
+
+    Since the definitions don't exist before loading, the dependencies of
+    the fixture can't be discovered from them. Any Fixture instances whose
+    ``fk``/``m2m``/``o2o`` references appear in the definitions must be
+    listed in ``depends_on``, or a FixtureUsageError is raised during
+    loading.
+    """
+    # The definitions are thrown away after loading, sharing their tokens
+    # would keep them all alive.
+    shares_loaders = False
+
+    def __init__(self, model, source, depends_on=(), batch_size=None, raw=False):
+        super(LazyFixture, self).__init__(model, raw=raw)
+        self._kwarg_storage = None
+        self.source = source
+        if batch_size:
+            self.batch_size = batch_size
+        for fixture in depends_on:
+            super(LazyFixture, self)._add_dependency(fixture)
+
+    def _adding_not_supported(self, *args, **kwargs):
+        raise FixtureUsageError('Objects cannot be added to a %s' % self.__class__.__name__)
+    add = add_random = add_random_range = add_rows = _adding_not_supported
+
+    def _add_dependency(self, fixture_instance):
+        if fixture_instance is not self and fixture_instance not in self._dependencies:
+            raise FixtureUsageError('%s refers to an undeclared dependency, a '\
+                'Fixture for %s. Add it to depends_on.' % (
+                self.__class__.__name__, fixture_instance.model._meta.object_name))
+
+    def _iter_definitions(self):
+        for pk, kwargs in self.source():
+            definitions = self._build_relations(**kwargs)
+            definitions['pk'] = pk
+            yield pk, definitions
+
+    def iter_pks(self):
+        for pk, definitions in self._iter_definitions():
+            yield pk
+
+    def _iter_selected_definitions(self, pks):
+        to_python = self.model._meta.pk.to_python
+        for pk, definitions in self._iter_definitions():
+            if to_python(pk) in pks:
+                yield pk, definitions
+
+
+class CSVFixture(LazyFixture):
+    """
+    A Fixture whose object definitions come from a CSV (or TSV, or any other
+    format the ``csv`` module can be configured to read) file instead of
+    ``add`` calls. Usually created with ``Fixture.from_csv``::
+
+        postal_codes = Fixture.from_csv(PostalCode, 'postal_codes.csv', 'code')
+
+    The first row of the file holds the field names, unless ``fieldnames``
+    is given. ``pk_column`` names the column containing the primary keys.
+
+    The file is only read when the fixture is loaded, ``batch_size`` rows at
+    a time, so the rows are never all held in memory at once.
+
+    ``relations`` maps relation field names to the Fixture instances that
+    their values refer to, turning each value into the equivalent of a
+    ``fixture.fk(value)`` call. ``'self'`` refers to the CSVFixture itself.
+    The Fixture instances become dependencies of this one as usual. Values of
+    other relation fields are treated like plain values given to ``add``,
+    i.e. primary keys of pre-existing objects. The values of M2M fields are
+    split on ``m2m_separator``.
+
+    Empty values in nullable fields are loaded as None. Any other keyword
+    arguments are passed on to ``csv.reader``.
+    """
+    def __init__(self, model, path, pk_column, relations=None, fieldnames=None,
+        encoding='utf-8', m2m_separator='|', batch_size=None, raw=False, **reader_kwargs):
+        relations = dict(relations or {})
+        super(CSVFixture, self).__init__(model, None,
+            depends_on=[f for f in relations.values() if f != 'self'],
+            batch_size=batch_size, raw=raw)
+        self.path = path
+        self.pk_column = pk_column
+        self.relations = relations
+        self.fieldnames = fieldnames
+        self.encoding = encoding
+        self.m2m_separator = m2m_separator
+        self.reader_kwargs = reader_kwargs
+        for fieldname, fixture in self.relations.items():
+            if fixture == 'self':
+                self.relations[fieldname] = self
+            if self._get_relation_info(fieldname)[1] is None:
+                raise FixtureUsageError('"%s" is not a relation field of %s' % (
+                    fieldname, model._meta.object_name))
+
+    def _adding_not_supported(self, *args, **kwargs):
+        raise FixtureUsageError('Objects cannot be added to a CSVFixture, they are read from %s' % self.path)
+    add = add_random = add_random_range = add_rows = _adding_not_supported
+
+    def _iter_definitions(self):
+        f = open(self.path, 'rb')
+        try:
+            reader = csv.reader(f, **self.reader_kwargs)
+            fieldnames = self.fieldnames
+            if fieldnames is None:
+                fieldnames = reader.next()
+            fieldnames = list(fieldnames)
+            try:
+                pk_index = fieldnames.index(self.pk_column)
+            except ValueError:
+                raise FixtureUsageError('No "%s" column in %s' % (self.pk_column, self.path))
+            del fieldnames[pk_index]
+            fieldnames = tuple(fieldnames)
+
+            nullable = set()
+            for fieldname in fieldnames:
+                try:
+                    if self.model._meta.get_field(fieldname).null:
+                        nullable.add(fieldname)
+                except models.FieldDoesNotExist:
+                    pass
+            relation_info = self._get_column_relation_info(fieldnames)
+            m2m_fields = set([info[1] for info in relation_info if info[2]])
+
+            for row in reader:
+                if not row:
+                    continue
+                values = [v.decode(self.encoding) for v in row]
+                pk = values.pop(pk_index)
+                for i, fieldname in enumerate(fieldnames):
+                    value = values[i]
+                    if value == u'' and fieldname in nullable:
+                        values[i] = None
+                    elif fieldname in m2m_fields:
+                        values[i] = value and value.split(self.m2m_separator) or []
+                        if fieldname in self.relations:
+                            values[i] = [self.relations[fieldname].fk(v) for v in values[i]]
+                    elif fieldname in self.relations:
+                        values[i] = self.relations[fieldname].fk(value)
+                yield pk, self._build_row_relations(fieldnames, relation_info, pk, values)
+        finally:
+            f.close()
+
+
+class ReplicatedFixture(LazyFixture):
+    """
+    A Fixture that loads ``copies`` copies of the objects of another
+    Fixture, ``original``, with the primary keys of copy number ``n``
+    (counting from 1) offset by ``n * offset``. Created by ``replicate``,
+    which sets up a ReplicatedFixture for every Fixture in a dependency
+    graph, so that the ``fk``/``m2m``/``o2o`` references of each copy are
+    rewritten to point to the objects of the same copy.
+
+    The copies are generated from the definitions of ``original`` at load
+    time, one copy and batch at a time, so they never exist in memory all at
+    once.
+
+    If given, ``vary`` is called with the model, the copy number and the
+    definitions of each copied object, and returns the definitions to use
+    instead, e.g. to keep the values of unique fields unique.
+    """
+    def __init__(self, original, copies, offset, replicas, vary=None):
+        super(LazyFixture, self).__init__(original.model, raw=original.raw)
+        self._kwarg_storage = None
+        self.source = None
+        self.batch_size = original.batch_size
+        self.original = original
+        self.copies = copies
+        self.offset = offset
+        self.vary = vary
+        # Original Fixtures as keys, ReplicatedFixtures as values, shared by
+        # all the replicas of a graph.
+        self._replicas = replicas
+        replicas[original] = self
+        self._dependencies = [replicas[dep] for dep in original._dependencies]
+        for copy in xrange(1, copies + 1):
+            shift = copy * offset
+            for random_range in original._random_ranges:
+                seed = random_range.seed
+                if seed is not None:
+                    # Different random values for every copy
+                    seed = (seed, copy)
+                self._random_ranges.append(RandomRange(
+                    random_range.first_pk + shift, random_range.last_pk + shift, seed,
+                    self._shift_value(random_range.values, shift),
+                    self._shift_value(random_range.m2m_values, shift),
+                    random_range.factories))
+
+    def _shift_value(self, value, shift):
+        if isinstance(value, DelayedRelatedObjectLoader):
+            # Not through fk(), whose shared tokens would pile up for every
+            # copy.
+            return DelayedRelatedObjectLoader(self._replicas[value.fixture_instance], value.pk + shift)
+        if isinstance(value, list):
+            return [self._shift_value(v, shift) for v in value]
+        if isinstance(value, dict):
+            shifted = type(value)()
+            for k, v in value.items():
+                shifted[k] = self._shift_value(v, shift)
+            return shifted
+        return value
+
+    def _iter_definitions(self):
+        for copy in xrange(1, self.copies + 1):
+            shift = copy * self.offset
+            for pk, definitions in self.original._iter_definitions():
+                definitions = self._shift_value(definitions, shift)
+                definitions['pk'] = pk + shift
+                if self.vary is not None:
+                    definitions = self.vary(self.model, copy, definitions)
+                yield pk + shift, definitions
+
+
+def replicate(fixtures, copies, offset=None, vary=None):
+    """
+    Returns ReplicatedFixtures loading ``copies`` copies of ``fixtures`` and
+    all of their dependencies, for producing larger amounts of data for
+    load testing out of existing fixtures. The returned list is in load
+    order, i.e. loading its last item loads them all if ``fixtures`` is a
+    single Fixture.
+
+    The copies come in addition to the original objects: the primary keys of
+    copy number ``n`` are offset by ``n * offset``. By default, ``offset``
+    is the smallest power of ten that is larger than every primary key in
+    the fixtures, so that copy 1 of object 7 becomes 17, or 107, and so on.
+    All the primary keys need to be integers. See ``ReplicatedFixture`` for
+    ``vary``.
+    """
+    if isinstance(fixtures, Fixture):
+        fixtures = [fixtures]
+    originals = get_load_order(fixtures)
+    largest_pk = 0
+    for original in originals:
+        for pk in original.iter_pks():
+            if not isinstance(pk, (int, long)):
+                raise FixtureUsageError('Only fixtures with integer primary keys '\
+                    'can be replicated, %s has %r' % (original.model._meta.object_name, pk))
+            largest_pk = max(largest_pk, pk)
+    if offset is None:
+        offset = 10 ** len(str(largest_pk))
+    elif offset <= largest_pk:
+        raise FixtureUsageError('The offset of replicated fixtures must be '\
+            'larger than their primary keys, the largest of which is %s' % largest_pk)
+    replicas = {}
+    return [ReplicatedFixture(original, copies, offset, replicas, vary=vary)
+        for original in originals]
+
+
+def _hashable_value(value):
+    """
+    Turns a definition value into something with a stable ``repr`` for
+    ``Fixture.content_hash``, identifying related objects by their model and
+    primary key rather than the identity of the placeholder instances.
+    """
+    if isinstance(value, DelayedRelatedObjectLoader):
+        model = value.fixture_instance.model
+        return ('fixture', model._meta.app_label, model._meta.object_name, value.pk)
+    if isinstance(value, RelatedObjectLoader):
+        return ('object', value.model._meta.app_label, value.model._meta.object_name,
+            _hashable_value(value.identifier))
+    if isinstance(value, models.Model):
+        return value.pk
+    if isinstance(value, (list, tuple)):
+        return [_hashable_value(v) for v in value]
+    return value
+
 
 class FixtureLoader(object):
     """
     A utility class, throwaway instances of which are generated by
-    ``Fixture.load``. Constructs objects from the ``kwarg_storage``
-    OrderedDict, saves them to the database and builds any M2M relations.
+    ``Fixture.load``. Constructs objects from the definitions of a Fixture,
+    saves them to the database and builds any M2M relations.
 
     Enables keeping Fixture instances state-free regarding actual
-    created objects.
+    created objects: everything that depends on the contents of the database
+    being loaded into lives here, and is thrown away after the load.
+
+    In ``lean`` mode, only primary keys are kept track of: ``saved`` maps the
+    primary keys to the model class and pending M2M relations are stored as
+    primary keys, so that no model instances outlive the batch they were
+    created in.
+
+    In ``upsert`` mode, each batch of definitions is compared against the
+    existing objects, and only new objects and changed fields are written.
+
+    If the table of the model is empty, objects are saved with forced
+    INSERTs, or bulk inserted a batch at a time where saves would bypass
+    custom save methods anyway (in ``raw`` and ``upsert`` modes).
     """
-    def __init__(self, kwarg_storage, fixture_instance):
-        self.kwarg_storage = kwarg_storage
+    def __init__(self, fixture_instance, batch_size=None, lean=False, upsert=False,
+            outcomes=None, empty_tables=None, on_batch=None, pks=None):
         self.fixture_instance = fixture_instance
+        self.batch_size = batch_size or Fixture.batch_size
+        self.lean = lean
+        self.upsert = upsert
+        # (model, pk) tuples as keys, "inserted", "updated" or "unchanged"
+        # as values. The first outcome recorded for an object is the one
+        # that counts, since dependencies get loaded more than once.
+        self.outcomes = outcomes if outcomes is not None else {}
+        # See Fixture.load
+        self.empty_tables = empty_tables if empty_tables is not None else {}
+        # See Fixture.load
+        self.on_batch = on_batch
+        # The set of primary keys to load, converted with the primary key
+        # field, or None to load everything.
+        self.pks = pks
         # PKs as keys, dictionaries of all the M2M fields to which objects
         # need to be added to as values.
         self._pending_m2m = {}
-        # PKs as keys, saved objects as values.
+        # Whether the table was empty before the load, see load
+        self._was_empty = False
+        # PKs as keys, saved objects (or the model class in lean mode) as
+        # values.
         self.saved = OrderedDict()
 
+    def _record_saved(self, pk, obj, outcome='inserted'):
+        self.saved[pk] = self.fixture_instance.model if self.lean else obj
+        self.outcomes.setdefault((self.fixture_instance.model, pk), outcome)
+
     def load(self, using=None, raw=False):
         """
         Does the actual work of creating objects from definitions stored in
@@ -273,84 +992,401 @@ class FixtureLoader(object):
 
         Returns the number of objects saved to the database.
         """
-        # Replace ObjectLoaders with the actual objects
-        for pk, model_def in self.kwarg_storage.items():
-            resolved_def = dict()
-            for fieldname, value in model_def.items():
-                # Do the magic of allowing M2M relation creation through an
-                # iterable of values inlined in the object definition kwargs.
-                # See if the field name is listed in the Model's M2M field
-                # list. If yes, replace the assignment with a proper post-save
-                # M2M addition.
-                if any([isinstance(getattr(self.fixture_instance.model, fieldname, None), m2m_descriptor) for m2m_descriptor in [mrod, rmrod]]):
-                    if isinstance(model_def, DelayedMilkmanDelivery):
-                        # Milkman handles explicit M2Ms itself, no need to
-                        # add to the list of relations created later. Just
-                        # resolve to the real objects.
-                        resolved_def[fieldname] = []
-                        if isinstance(value, Iterable) and all([isinstance(v, ObjectLoader) for v in value]):
-                            for v in value:
-                                resolved_def[fieldname].append(v.get_related_object(using=using))
-                        else:
-                            raise RelatedObjectError('Invalid argument "%s" to a ManyToMany field' % value)
-                    else:
-                        # Save the M2M relations for later saving
-                        if pk not in self._pending_m2m:
-                            self._pending_m2m[pk] = {}
-                        if fieldname not in self._pending_m2m[pk]:
-                            self._pending_m2m[pk][fieldname] = []
-                        # The value assigned to the field can be either a single
-                        # M2M placeholder or an iterable of them.
-                        if isinstance(value, Iterable) and all([isinstance(v, ObjectLoader) for v in value]):
-                            for v in value:
-                                self._pending_m2m[pk][fieldname].append(v.get_related_object(using=using))
-                        else:
-                            raise RelatedObjectError('Invalid argument "%s" to a ManyToMany field' % value)
+        if not router.allow_syncdb(using, self.fixture_instance.model):
+            # Don't go looking up related objects for nothing, their tables
+            # may not even exist in this database.
+            return self.saved
+        empty = self._was_empty = self._table_is_empty(using=using)
+        if self.pks is not None:
+            definitions = self.fixture_instance._iter_selected_definitions(self.pks)
+        else:
+            definitions = self.fixture_instance._iter_definitions()
+        for batch in chunked(definitions, self.batch_size):
+            prefetched = self._prefetch_related_objects(batch, using=using)
+            if self.upsert or (empty and raw):
+                self._upsert_batch(batch, prefetched, using=using, empty=empty)
+            else:
+                for pk, model_def in batch:
+                    self._load_definition(pk, model_def, prefetched, using=using, raw=raw, force_insert=empty)
+            if self.on_batch is not None:
+                self.on_batch(len(batch))
+        for random_range in self.fixture_instance._random_ranges:
+            self._load_random_range(random_range, using=using, empty=empty)
+        if self.saved:
+            model = self.fixture_instance.model
+            # Inserting multi-table inherited objects inserts rows into the
+            # tables of the parent models, too.
+            for written in [model] + list(model._meta.get_parent_list()):
+                self.empty_tables[(written, using)] = False
+        return self.saved
+
+    def _table_is_empty(self, using=None):
+        """
+        Returns True if the table of the model, and those of any parent
+        models it has, are empty. Each table is only checked once per
+        ``empty_tables`` dictionary.
+        """
+        model = self.fixture_instance.model
+        for checked in [model] + list(model._meta.get_parent_list()):
+            key = (checked, using)
+            try:
+                empty = self.empty_tables[key]
+            except KeyError:
+                empty = self.empty_tables[key] = not checked._default_manager.db_manager(using).exists()
+            if not empty:
+                return False
+        return True
+
+    def _load_random_range(self, random_range, using=None, empty=False):
+        """
+        Generates and bulk inserts the objects of an ``add_random_range``
+        call, a batch at a time.
+        """
+        model = self.fixture_instance.model
+        if not router.allow_syncdb(using, model):
+            return
+        if self.pks is not None and not [pk for pk in self.pks if random_range.first_pk <= pk <= random_range.last_pk]:
+            return
+        # Resolve the shared relations once for all objects
+        values = {}
+        for fieldname, value in random_range.values.items():
+            if isinstance(value, ObjectLoader):
+                value = value.get_related_object(using=using)
+            values[fieldname] = value
+        m2m_targets = {}
+        for fieldname, loaders in random_range.m2m_values.items():
+            m2m_targets[fieldname] = [v.get_related_object(using=using) for v in loaders]
+
+        generated_fields = [f for f in model._meta.fields
+            if not f.primary_key and not f.rel and f.name not in values and
+            f.name not in random_range.factories and
+            not (f.has_default() or f.blank or f.null)]
+        generators = [(f.name, milkman.registry.get(type(f))(f)()) for f in generated_fields]
+
+        # Run the generators with our own random state, leaving the global
+        # state as it was for anyone else using the random module.
+        rng_state = None
+        if random_range.seed is not None:
+            with _random_lock:
+                outside_state = random.getstate()
+                random.seed(random_range.seed)
+                rng_state = random.getstate()
+                random.setstate(outside_state)
+
+        for pks in chunked(xrange(random_range.first_pk, random_range.last_pk + 1), self.batch_size):
+            _random_lock.acquire()
+            if rng_state is not None:
+                outside_state = random.getstate()
+                random.setstate(rng_state)
+            try:
+                objects = []
+                for pk in pks:
+                    kwargs = dict(values)
+                    for fieldname, generator in generators:
+                        kwargs[fieldname] = generator.next()
+                    for fieldname, factory in random_range.factories.items():
+                        kwargs[fieldname] = factory(pk)
+                    objects.append(model(pk=pk, **kwargs))
+            finally:
+                if rng_state is not None:
+                    rng_state = random.getstate()
+                    random.setstate(outside_state)
+                _random_lock.release()
+            if self.pks is not None:
+                # The unselected objects still had to be generated to keep
+                # the random values of the selected ones the same.
+                objects = [obj for obj in objects if obj.pk in self.pks]
+                pks = [obj.pk for obj in objects]
+                if not objects:
+                    continue
+            if empty:
+                bulk_insert(model, objects, using=using)
+                existing = ()
+            else:
+                existing = save_batch(model, objects, using=using)
+            for obj in objects:
+                self._record_saved(obj.pk, obj, 'updated' if obj.pk in existing else 'inserted')
+            for fieldname, targets in m2m_targets.items():
+                field = model._meta.get_field(fieldname)
+                if field.rel.through._meta.auto_created:
+                    self._bulk_add_m2m(field, [(pk, target.pk) for pk in pks for target in targets],
+                        using=using, empty=empty)
                 else:
-                    # The field is not an M2M and thus supports
-                    # "fieldname=value" assignment, so just get a reference to
-                    # an actual object to replace the placeholder.
-                    if isinstance(value, ObjectLoader):
-                        resolved_def[fieldname] = value.get_related_object(using=using)
-                    else:
-                        resolved_def[fieldname] = value
-            # Safe to modify, since we're iterating over the items() output,
-            # not the dictionary itself.
-            self.kwarg_storage[pk] = resolved_def
+                    for obj in model._default_manager.db_manager(using).filter(pk__in=pks):
+                        getattr(obj, fieldname).add(*targets)
+            if self.on_batch is not None:
+                self.on_batch(len(objects))
+
+    def _bulk_add_m2m(self, field, pairs, using=None, empty=False, reverse=False):
+        """
+        Writes the relations in ``pairs``, ``(pk, target_pk)`` tuples, to
+        the automatically created intermediary table of ``field`` with bulk
+        INSERTs, a batch at a time. With ``reverse``, ``field`` belongs to
+        the other model and points to the model of this loader.
+
+        Unless the table of the objects is known to be ``empty``, the
+        relations that already exist are fetched with one query per batch
+        and left out.
+        """
+        through = field.rel.through
+        source_name = field.m2m_field_name()
+        target_name = field.m2m_reverse_field_name()
+        if reverse:
+            source_name, target_name = target_name, source_name
+        manager = through._default_manager.db_manager(using)
+        for batch in chunked(pairs, self.batch_size):
+            if not empty:
+                existing = set(manager.filter(**{'%s__in' % source_name: list(set([pk for pk, target_pk in batch]))
+                    }).values_list(source_name, target_name))
+                batch = [pair for pair in batch if pair not in existing]
+            bulk_insert(through, [through(**{'%s_id' % source_name: pk, '%s_id' % target_name: target_pk})
+                for pk, target_pk in batch], using=using)
+
+    def _prefetch_related_objects(self, batch, using=None):
+        """
+        Fetches the targets of all the DelayedRelatedObjectLoaders in
+        ``batch`` that point to other Fixture instances, with one query per
+        Fixture instance instead of one per relation.
+
+        Returns a dictionary with Fixture instances as keys and ``in_bulk``
+        results as values. References to this loader's own Fixture instance
+        are left out, since their targets may be saved earlier in the same
+        batch.
+        """
+        wanted = {}
+        for pk, model_def in batch:
+            for value in model_def.values():
+                if not isinstance(value, list):
+                    value = [value]
+                for v in value:
+                    if isinstance(v, DelayedRelatedObjectLoader) and v.fixture_instance is not self.fixture_instance:
+                        wanted.setdefault(v.fixture_instance, set()).add(v.pk)
+        prefetched = {}
+        for fixture, pks in wanted.items():
+            pk_field = fixture.model._meta.pk
+            prefetched[fixture] = fixture.model._default_manager.db_manager(using).in_bulk(
+                [pk_field.to_python(pk) for pk in pks])
+        return prefetched
 
-            if router.allow_syncdb(using, self.fixture_instance.model):
+    def _get_related_object(self, loader, prefetched, using=None):
+        if isinstance(loader, DelayedRelatedObjectLoader) and loader.fixture_instance in prefetched:
+            pk = loader.fixture_instance.model._meta.pk.to_python(loader.pk)
+            try:
+                return prefetched[loader.fixture_instance][pk]
+            except KeyError:
+                # Let get_related_object raise the appropriate error
+                pass
+        return loader.get_related_object(using=using)
+
+    def _load_definition(self, pk, model_def, prefetched, using=None, raw=False, force_insert=False):
+        """
+        Saves the object described by a single definition, with the
+        ObjectLoaders in it replaced by the actual objects. The definition
+        itself is left untouched.
+        """
+        resolved_def = self._resolve_definition(pk, model_def, prefetched, using=using)
+        if isinstance(model_def, DelayedMilkmanDelivery):
+            self._record_saved(pk, milkman.deliver(self.fixture_instance.model, **resolved_def))
+        else:
+            if raw:
+                # See the documentation on "raw mode" for an explanation
+                obj = self.fixture_instance.model(**resolved_def)
+                models.Model.save_base(obj, using=using, raw=True, force_insert=force_insert)
+                self._record_saved(pk, obj)
+            else:
+                obj = self.fixture_instance.model(**resolved_def)
+                obj.save(using=using, force_insert=force_insert)
+                self._record_saved(pk, obj)
+
+    def _upsert_batch(self, batch, prefetched, using=None, empty=False):
+        """
+        Compares a batch of definitions against the existing objects with the
+        same primary keys, fetched with one query. New objects are bulk
+        inserted, and the fields that differ from the definitions are
+        updated with one query per distinct set of changes. Fields that the
+        definitions don't mention are left as they are.
+
+        If the table is known to be ``empty``, there's nothing to compare
+        against and all the objects are just bulk inserted.
+        """
+        model = self.fixture_instance.model
+        manager = model._default_manager.db_manager(using)
+        pk_field = model._meta.pk
+        fields = dict([(f.name, f) for f in model._meta.fields if not f.primary_key])
+        if empty:
+            existing = {}
+        else:
+            existing = manager.in_bulk([pk_field.to_python(pk) for pk, model_def in batch])
+        new_objects = []
+        # The primary keys of new_objects
+        pending_pks = set()
+        # Tuples of (fieldname, value) tuples as keys, lists of PKs as values
+        updates = {}
+        for pk, model_def in batch:
+            if pending_pks and self._refers_to_any(model_def, pending_pks):
+                # Objects of the same Fixture must exist before they can be
+                # related to.
+                bulk_insert(model, new_objects, using=using)
+                new_objects = []
+                pending_pks = set()
+            resolved_def = self._resolve_definition(pk, model_def, prefetched, using=using)
+            current = existing.get(pk_field.to_python(pk))
+            if current is None:
                 if isinstance(model_def, DelayedMilkmanDelivery):
-                    self.saved[pk] = milkman.deliver(self.fixture_instance.model, **resolved_def)
+                    self._record_saved(pk, milkman.deliver(model, **resolved_def))
                 else:
-                    if raw:
-                        # See the documentation on "raw mode" for an explanation
-                        obj = self.fixture_instance.model(**resolved_def)
-                        models.Model.save_base(obj, using=using, raw=True)
-                        self.saved[pk] = obj
-                    else:
-                        obj = self.fixture_instance.model(**resolved_def)
-                        obj.save(using=using)
-                        self.saved[pk] = obj
+                    obj = model(**resolved_def)
+                    new_objects.append(obj)
+                    pending_pks.add(obj.pk)
+                    self._record_saved(pk, obj)
+                continue
+            # Milkman would fill in the unmentioned fields with random data,
+            # which is exactly what shouldn't be compared against.
+            obj = model(**dict([(k, v) for k, v in resolved_def.items() if k == 'pk' or k in fields]))
+            changes = []
+            for fieldname in resolved_def:
+                field = fields.get(fieldname)
+                if field is None:
+                    continue
+                value = getattr(obj, field.attname)
+                try:
+                    value = field.to_python(value)
+                except ValidationError:
+                    pass
+                if value != getattr(current, field.attname):
+                    changes.append((field.name, value))
+            if not changes:
+                self._record_saved(pk, current, 'unchanged')
+                continue
+            changes = tuple(sorted(changes))
+            try:
+                updates.setdefault(changes, []).append(current.pk)
+            except TypeError:
+                # Unhashable values, update this one on its own
+                manager.filter(pk=current.pk).update(**dict(changes))
+            self._record_saved(pk, obj, 'updated')
+        bulk_insert(model, new_objects, using=using)
+        for changes, pks in updates.items():
+            manager.filter(pk__in=pks).update(**dict(changes))
 
-        return self.saved
+    def _refers_to_any(self, model_def, pks):
+        """
+        Returns True if ``model_def`` relates to any of the objects of this
+        loader's Fixture with primary keys in the set ``pks``.
+        """
+        for value in model_def.values():
+            if not isinstance(value, list):
+                value = [value]
+            for v in value:
+                if isinstance(v, DelayedRelatedObjectLoader) and v.fixture_instance is self.fixture_instance and v.pk in pks:
+                    return True
+        return False
+
+    def _resolve_definition(self, pk, model_def, prefetched, using=None):
+        """
+        Returns a copy of a single definition with the ObjectLoaders in it
+        replaced by the actual objects. M2M relations are left out and
+        stored for ``create_m2m_relations``, except for Milkman deliveries,
+        which handle them themselves.
+        """
+        resolved_def = dict()
+        for fieldname, value in model_def.items():
+            # Do the magic of allowing M2M relation creation through an
+            # iterable of values inlined in the object definition kwargs.
+            # See if the field name is listed in the Model's M2M field
+            # list. If yes, replace the assignment with a proper post-save
+            # M2M addition.
+            if self.fixture_instance._is_m2m_field(fieldname):
+                if isinstance(model_def, DelayedMilkmanDelivery):
+                    # Milkman handles explicit M2Ms itself, no need to
+                    # add to the list of relations created later. Just
+                    # resolve to the real objects.
+                    resolved_def[fieldname] = []
+                    if isinstance(value, Iterable) and all([isinstance(v, ObjectLoader) for v in value]):
+                        for v in value:
+                            resolved_def[fieldname].append(self._get_related_object(v, prefetched, using=using))
+                    else:
+                        raise RelatedObjectError('Invalid argument "%s" to a ManyToMany field' % value)
+                else:
+                    # Save the M2M relations for later saving
+                    if pk not in self._pending_m2m:
+                        self._pending_m2m[pk] = {}
+                    if fieldname not in self._pending_m2m[pk]:
+                        self._pending_m2m[pk][fieldname] = []
+                    # The value assigned to the field can be either a single
+                    # M2M placeholder or an iterable of them.
+                    if isinstance(value, Iterable) and all([isinstance(v, ObjectLoader) for v in value]):
+                        for v in value:
+                            target = self._get_related_object(v, prefetched, using=using)
+                            self._pending_m2m[pk][fieldname].append(target.pk if self.lean else target)
+                    else:
+                        raise RelatedObjectError('Invalid argument "%s" to a ManyToMany field' % value)
+            else:
+                # The field is not an M2M and thus supports
+                # "fieldname=value" assignment, so just get a reference to
+                # an actual object to replace the placeholder.
+                if isinstance(value, ObjectLoader):
+                    resolved_def[fieldname] = self._get_related_object(value, prefetched, using=using)
+                else:
+                    resolved_def[fieldname] = value
+        return resolved_def
 
     def create_m2m_relations(self, using=None):
         """
         Writes any pending M2M relations to the database after the objects
         that are to relate to each other have been saved.
+
+        Relations through automatically created intermediary tables are
+        bulk inserted, leaving out those that already exist, without sending
+        ``m2m_changed`` signals. Others are added through the related
+        managers one object at a time.
         """
+        model = self.fixture_instance.model
+        to_python = model._meta.pk.to_python
+        # Field names as keys, (field, reverse, target model, list of (pk,
+        # target pk) tuples) as values
+        bulk = {}
         for pk, relations in self._pending_m2m.items():
-            obj = self.fixture_instance.get_object_by_pk(pk, using=using)
+            obj = None
             for rel_name, targets in relations.items():
+                if rel_name not in bulk:
+                    descriptor = getattr(model, rel_name)
+                    if isinstance(descriptor, rmrod):
+                        field, reverse, target_model = descriptor.field, False, descriptor.field.rel.to
+                    else:
+                        field, reverse, target_model = descriptor.related.field, True, descriptor.related.model
+                    bulk[rel_name] = (field, reverse, target_model, [])
+                field, reverse, target_model, pairs = bulk[rel_name]
+                if field.rel.through._meta.auto_created:
+                    target_to_python = target_model._meta.pk.to_python
+                    for target in targets:
+                        target_pk = target.pk if isinstance(target, models.Model) else target
+                        pairs.append((to_python(pk), target_to_python(target_pk)))
+                    continue
+                if obj is None:
+                    obj = self.fixture_instance.get_object_by_pk(pk, using=using)
                 for target in targets:
                     getattr(obj, rel_name).add(target)
+        for rel_name, (field, reverse, target_model, pairs) in bulk.items():
+            # Adding through a related manager ignores duplicates, and
+            # relates both ways on symmetrical fields.
+            if not reverse and field.rel.symmetrical and target_model is model:
+                pairs.extend([(target_pk, pk) for pk, target_pk in pairs])
+            seen = set()
+            pairs = [pair for pair in pairs if pair not in seen and not seen.add(pair)]
+            self._bulk_add_m2m(field, pairs, using=using, empty=self._was_empty, reverse=reverse)
 
 
 class ObjectLoader(object):
     """
     No-op base class for DelayedRelatedObjectLoader and RelatedObjectLoader,
     used to aid in ``isinstance`` calls in ``FixtureLoader.load``.
+
+    Fixtures can contain millions of these, so they use ``__slots__`` rather
+    than an instance dictionary.
     """
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         raise NotImplementedError('Use one of the child classes of ObjectLoader.')
 
@@ -364,7 +1400,12 @@ class DelayedRelatedObjectLoader(ObjectLoader):
     definitions stored in a Fixture, where those related objects are
     themselves contained in Fixtures. See RelatedObjectLoader for the
     equivalent for pre-existing objects.
+
+    Created by the ``fk``, ``m2m`` and ``o2o`` methods of Fixture instances.
+    The definitions stored in a Fixture share one instance per primary key.
     """
+    __slots__ = ('fixture_instance', 'pk')
+
     def __init__(self, fixture_instance, pk):
         self.fixture_instance = fixture_instance
         self.pk = pk
@@ -393,6 +1434,8 @@ class RelatedObjectLoader(ObjectLoader):
     See DelayedRelatedObjectLoader for the similar implementation of relations
     that live in Fixture instances.
     """
+    __slots__ = ('model', 'identifier')
+
     def __init__(self, model, identifier):
         self.model = model
         # Either a PK value, a natural key tuple or a model instance.
@@ -435,7 +1478,26 @@ class DelayedMilkmanDelivery(dict):
     pass
 
 
+class RandomRange(object):
+    """
+    The stored form of an ``add_random_range`` call, turned into objects by
+    ``FixtureLoader`` at load time.
+    """
+    def __init__(self, first_pk, last_pk, seed, values, m2m_values, factories):
+        self.first_pk = first_pk
+        self.last_pk = last_pk
+        self.seed = seed
+        # Field names as keys, values or ObjectLoaders as values
+        self.values = values
+        # Field names as keys, lists of ObjectLoaders as values
+        self.m2m_values = m2m_values
+        # Field names as keys, callables receiving a primary key as values
+        self.factories = factories
+
+
 from django.core.serializers import register_serializer
 # Not thread safe according to the register_serializer docstring, don't know
 # if it matters here or not.
 register_serializer('class', 'class_fixtures.serializer')
+register_serializer('class_columnar', 'class_fixtures.columnar_serializer')
+
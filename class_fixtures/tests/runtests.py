@@ -35,7 +35,8 @@ if not settings.configured:
             'class_fixtures.tests.testapp_no_fixtures',
         ],
         SERIALIZATION_FORMATS = {
-            'class': 'class_fixtures.serializer'
+            'class': 'class_fixtures.serializer',
+            'class_columnar': 'class_fixtures.columnar_serializer',
         }
     )
 
@@ -21,5 +21,6 @@ INSTALLED_APPS = (
 )
 
 SERIALIZATION_FORMATS = {
-    'class': 'class_fixtures.serializer'
+    'class': 'class_fixtures.serializer',
+    'class_columnar': 'class_fixtures.columnar_serializer',
 }
\ No newline at end of file
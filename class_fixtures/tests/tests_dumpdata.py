@@ -2,9 +2,11 @@ import re
 from django.core.management import call_command
 from django.test import TestCase
 
-from class_fixtures.tests.models import (Band, Musician,
-    Membership, Roadie, Competency, JobPosting, ComprehensiveModel)
+from class_fixtures.tests.models import (Band, MetalBand, Musician,
+    Membership, Roadie, Company, Employee, Competency, JobPosting,
+    ComprehensiveModel)
 from class_fixtures.utils import string_stdout
+from class_fixtures.utils.serialization import collect_subset
 
 class DumpDataTests(TestCase):
     def test_encoding_declaration(self):
@@ -182,3 +184,112 @@ And the second paragraph looks like this.""")
         self.assertEqual(lines[13], "tests_jobposting_fixture.add(1, **{'additional_competencies': [], 'main_competency': 1, 'title': u'Rails Intern'})")
         self.assertEqual(lines[14], "tests_jobposting_fixture.add(2, **{'additional_competencies': [1], 'main_competency': 4, 'title': u'Elder Django Deity'})")
         self.assertEqual(lines[15], "tests_jobposting_fixture.add(3, **{'additional_competencies': [1, 2], 'main_competency': 3, 'title': u'A man of many talents'})")
+
+    def test_columnar_output(self):
+        band = Band.objects.create(name="Brutallica")
+        band2 = Band.objects.create(name="Bar Fighters")
+        musician = Musician.objects.create(name="Lars Toorich")
+        membership = Membership.objects.create(band=band, musician=musician, instrument="Bongos", date_joined="1982-01-01")
+        roadie = Roadie.objects.create(name="Ciggy Tardust")
+        roadie.hauls_for.add(band, band2)
+        with string_stdout() as output:
+            call_command('dumpdata', 'tests', format='class_columnar', exclude=[
+                'tests.Party', 'tests.Politician'])
+            lines = output.getvalue().split('\n')
+        self.assertEqual(lines[4], "from tests.models import Band, Membership, Musician, Roadie")
+        self.assertEqual(lines[6], 'tests_band_fixture = Fixture(Band)')
+        self.assertEqual(lines[11:24], [
+            "tests_band_fixture.add_rows(('name',), (",
+            "    (1, u'Brutallica'),",
+            "    (2, u'Bar Fighters'),",
+            "))",
+            "tests_musician_fixture.add_rows(('name',), (",
+            "    (1, u'Lars Toorich'),",
+            "))",
+            "tests_membership_fixture.add_rows(('band', 'date_joined', 'instrument', 'musician'), (",
+            "    (1, 1, datetime.date(1982, 1, 1), u'Bongos', 1),",
+            "))",
+            "tests_roadie_fixture.add_rows(('hauls_for', 'name'), (",
+            "    (1, [1, 2], u'Ciggy Tardust'),",
+            "))",
+        ])
+
+    def test_columnar_output_loads(self):
+        band = Band.objects.create(name="Brutallica")
+        musician = Musician.objects.create(name="Lars Toorich")
+        membership = Membership.objects.create(band=band, musician=musician, instrument="Bongos", date_joined="1982-01-01")
+        roadie = Roadie.objects.create(name="Ciggy Tardust")
+        roadie.hauls_for.add(band)
+        with string_stdout() as output:
+            call_command('dumpdata', 'tests', format='class_columnar', exclude=[
+                'tests.Party', 'tests.Politician'])
+        # The generated imports use the app label, which isn't importable
+        # as such from here.
+        source = output.getvalue().replace('from tests.models', 'from class_fixtures.tests.models')
+        Roadie.objects.all().delete()
+        Membership.objects.all().delete()
+        Musician.objects.all().delete()
+        Band.objects.all().delete()
+        namespace = {}
+        exec source in namespace
+        for name in ['tests_band_fixture', 'tests_musician_fixture',
+            'tests_membership_fixture', 'tests_roadie_fixture']:
+            namespace[name].load()
+        self.assertEqual(Membership.objects.get(pk=1).band.name, 'Brutallica')
+        self.assertEqual(Roadie.objects.get(pk=1).hauls_for.get().name, 'Brutallica')
+
+    def test_subset_output(self):
+        band = Band.objects.create(name="Brutallica")
+        band2 = Band.objects.create(name="Bar Fighters")
+        musician = Musician.objects.create(name="Lars Toorich")
+        musician2 = Musician.objects.create(name="Dave Growl")
+        Membership.objects.create(band=band, musician=musician, instrument="Bongos", date_joined="1982-01-01")
+        Membership.objects.create(band=band2, musician=musician2, instrument="All of them", date_joined="2000-04-01")
+        roadie = Roadie.objects.create(name="Ciggy Tardust")
+        roadie.hauls_for.add(band2)
+        Roadie.objects.create(name="Tats Brimhat").hauls_for.add(band)
+        with string_stdout() as output:
+            call_command('dumpsubset', 'tests.Membership', '2')
+            lines = output.getvalue().split('\n')
+        self.assertEqual(lines[4], "from tests.models import Band, Membership, Musician")
+        self.assertEqual(lines[10:14], [
+            "tests_band_fixture.add(2, **{'name': u'Bar Fighters'})",
+            "tests_musician_fixture.add(2, **{'name': u'Dave Growl'})",
+            "tests_membership_fixture.add(2, **{'band': 2, 'date_joined': datetime.date(2000, 4, 1), 'instrument': u'All of them', 'musician': 2})",
+            "",
+        ])
+        # M2M relations are followed from the end they are defined in
+        with string_stdout() as output:
+            call_command('dumpsubset', 'tests.Roadie', '1')
+            lines = output.getvalue().split('\n')
+        self.assertEqual(lines[9:11], [
+            "tests_band_fixture.add(2, **{'name': u'Bar Fighters'})",
+            "tests_roadie_fixture.add(1, **{'hauls_for': [2], 'name': u'Ciggy Tardust'})",
+        ])
+
+    def test_subset_ordering(self):
+        company = Company.objects.create(name='FacelessCorp Inc.')
+        # Saved in an order where the manager has the larger primary key
+        employee = Employee.objects.create(name='Sue Ecide-Risk', company=company)
+        manager = Employee.objects.create(name='Ty Rant', company=company)
+        Employee.objects.filter(pk=employee.pk).update(manager=manager)
+        Employee.objects.create(name='Andy Depressant', company=company)
+        metal_band = MetalBand.objects.create(name='Brutallica')
+        objects = collect_subset(Employee.objects.filter(pk=employee.pk))
+        self.assertEqual(objects, [company, manager, employee])
+        objects = collect_subset(MetalBand, [str(metal_band.pk)])
+        self.assertEqual([type(obj) for obj in objects], [Band, MetalBand])
+
+    def test_large_subset(self):
+        # More primary keys than fit in a single SQLite statement
+        band = Band.objects.create(name='Brutallica')
+        Roadie.objects.bulk_create([Roadie(name='Roadie %d' % i) for i in range(1000)])
+        through = Roadie.hauls_for.through
+        through.objects.bulk_create([through(roadie=roadie, band=band) for roadie in Roadie.objects.all()])
+        pks = list(Roadie.objects.values_list('pk', flat=True))
+        # Two chunks of roadies and of their bands, one query for the band
+        with self.assertNumQueries(5):
+            objects = collect_subset(Roadie, pks)
+        self.assertEqual(len(objects), 1001)
+        self.assertEqual(objects[0], band)
+
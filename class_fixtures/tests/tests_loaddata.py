@@ -3,18 +3,26 @@ import sys
 
 from django.conf import settings
 from django.core.management import call_command
-from django.test import TestCase
+from django.db import connections
+from django.test import TestCase, TransactionTestCase
 from django.utils.importlib import import_module
 
 from class_fixtures.exceptions import RelatedObjectError, FixtureUsageError
 from class_fixtures.management.commands.loaddata import Command as Loaddata
-from class_fixtures.models import Fixture
+from class_fixtures.models import (Fixture, LazyFixture, CSVFixture, replicate,
+    DelayedRelatedObjectLoader)
 from class_fixtures.tests.models import (Band, MetalBand, Musician,
     Membership, Roadie, Company, Employee, EmployeeHistory, Competency,
     JobPosting, Party, Politician)
 from class_fixtures.utils.loaddata import (associate_handlers,
-    process_django_output)
+    get_fixtures_from_module, process_django_output)
 from class_fixtures.utils import string_stdout
+from class_fixtures.utils.db import DeferredIndexes, unload_fixtures
+from class_fixtures.utils.daemon import FixtureDaemon, request_database, request_plan
+from class_fixtures.utils.provisioning import load_plan, provision_sqlite_databases
+from class_fixtures.utils.sharding import load_sharded
+from class_fixtures.utils.storage import ColumnarStorage
+from class_fixtures.utils.watch import FixtureWatcher
 
 class LoaddataOverrideTest(TestCase):
     def test_overriding(self):
@@ -279,6 +287,344 @@ class BasicLoadingFunctionalityTests(TestCase):
         self.assertEqual(normal.cog_in_the_machine, True)
         self.assertEqual(raw.cog_in_the_machine, False)
 
+    def test_add_rows(self):
+        company_fixture = Fixture(Company)
+        company_fixture.add_rows(('name',), ((1, 'Macrohard'), (2, 'Bloatware Corporation')))
+        employee_fixture = Fixture(Employee)
+        employee_fixture.add_rows(('company', 'manager', 'name'), (
+            (1, company_fixture.fk(1), None, 'Andy Depressant'),
+            (2, 2, employee_fixture.fk(1), 'Sadie Peon'),
+        ))
+        band_fixture = Fixture(Band)
+        band_fixture.add_rows(('name',), ((1, "Nuns N' Hoses"),))
+        roadie_fixture = Fixture(Roadie)
+        roadie_fixture.add_rows(('hauls_for', 'name'), ((1, [band_fixture.m2m(1)], 'Marshall Amp'),))
+        self.assertEqual(employee_fixture._dependencies, [company_fixture])
+        employee_fixture.load()
+        roadie_fixture.load()
+        self.assertEqual(Company.objects.count(), 2)
+        self.assertEqual(Employee.objects.get(pk=1).company.name, 'Macrohard')
+        self.assertEqual(Employee.objects.get(pk=2).manager.pk, 1)
+        self.assertEqual(Employee.objects.get(pk=2).cog_in_the_machine, True)
+        self.assertEqual(Roadie.objects.get(pk=1).hauls_for.get().name, "Nuns N' Hoses")
+
+    def test_shared_relation_tokens(self):
+        band_fixture = Fixture(Band)
+        band_fixture.add(1, name="Nuns N' Hoses")
+        band_fixture.add(3, name='Bar Fighters')
+        self.assertFalse(hasattr(band_fixture.fk(1), '__dict__'))
+        band = Band.objects.create(pk=2, name='Led Dirigible')
+        roadie_fixture = Fixture(Roadie)
+        roadie_fixture.add(1, name='Marshall Amp', hauls_for=[band_fixture.m2m(1), 2])
+        roadie_fixture.add(2, name='Tats Brimhat', hauls_for=[2, band])
+        roadie_fixture.add_rows(('name', 'hauls_for'), [(3, 'Blackie Teeshirt', [band_fixture.m2m(1)])])
+        first, second = roadie_fixture._kwarg_storage[1]['hauls_for'], roadie_fixture._kwarg_storage[2]['hauls_for']
+        self.assertTrue(first[1] is second[0])
+        self.assertTrue(first[0] is roadie_fixture._kwarg_storage[3]['hauls_for'][0])
+        # Model instances are not shared
+        self.assertFalse(second[1] is second[0])
+        roadie_fixture.load()
+        self.assertEqual(Band.objects.get(pk=2).roadie_set.count(), 2)
+
+        # The definitions of lazy fixtures aren't stored, so neither are
+        # their tokens
+        lazy_fixture = LazyFixture(Roadie, lambda: [(pk, {'name': 'Roadie %d' % pk,
+            'hauls_for': [band_fixture.m2m(3), 2]}) for pk in range(4, 8)], depends_on=[band_fixture])
+        lazy_fixture.load()
+        self.assertEqual(Band.objects.get(pk=2).roadie_set.count(), 6)
+        self.assertEqual(band_fixture._delayed_loaders.keys(), [1])
+        self.assertEqual(lazy_fixture._related_loaders, {})
+
+    def test_repeated_loading(self):
+        company_fixture = Fixture(Company)
+        company_fixture.add(1, name='Macrohard')
+        employee_fixture = Fixture(Employee)
+        employee_fixture.add(1, name='Andy Depressant', company=company_fixture.fk(1), manager=None)
+        band_fixture = Fixture(Band)
+        band_fixture.add(1, name="Nuns N' Hoses")
+        roadie_fixture = Fixture(Roadie)
+        roadie_fixture.add(1, name='Marshall Amp', hauls_for=[band_fixture.m2m(1)])
+        for i in range(2):
+            employee_fixture.load()
+            roadie_fixture.load()
+            self.assertEqual(Employee.objects.get(pk=1).company.name, 'Macrohard')
+            self.assertEqual(Roadie.objects.get(pk=1).hauls_for.get().name, "Nuns N' Hoses")
+            # The definitions still contain the relation tokens
+            self.assertTrue(employee_fixture._kwarg_storage[1]['company'] is company_fixture._delayed_loaders[1])
+            # As if the database had been flushed between test cases
+            for model in (Employee, Company, Roadie, Band):
+                model.objects.all().delete()
+
+    def test_content_hash(self):
+        def band_fixture(name):
+            fixture = Fixture(Band)
+            fixture.add(1, name=name)
+            return fixture
+        self.assertEqual(band_fixture('Bar Fighters').content_hash(), band_fixture('Bar Fighters').content_hash())
+        self.assertNotEqual(band_fixture('Bar Fighters').content_hash(), band_fixture('Brutallica').content_hash())
+        # Dependencies are part of the hash
+        bands = band_fixture('Bar Fighters')
+        roadie_fixture = Fixture(Roadie)
+        roadie_fixture.add(1, name='Marshall Amp', hauls_for=[bands.m2m(1)])
+        other_bands = band_fixture('Brutallica')
+        other_roadie_fixture = Fixture(Roadie)
+        other_roadie_fixture.add(1, name='Marshall Amp', hauls_for=[other_bands.m2m(1)])
+        self.assertNotEqual(roadie_fixture.content_hash(), other_roadie_fixture.content_hash())
+
+    def test_upsert(self):
+        company_fixture = Fixture(Company)
+        company_fixture.add(1, name='Macrohard')
+        company_fixture.add(2, name='Mozzarella')
+        employee_fixture = Fixture(Employee)
+        employee_fixture.add(1, name='Andy Depressant', company=company_fixture.fk(1), manager=None)
+        employee_fixture.add(2, name='Mate Workman', company=company_fixture.fk(1), manager=None)
+        employee_fixture.load()
+        Employee.objects.filter(pk=2).update(cog_in_the_machine=True)
+
+        company_fixture = Fixture(Company)
+        company_fixture.add(1, name='Macrohard')
+        company_fixture.add(2, name='Mozzarella')
+        employee_fixture = Fixture(Employee)
+        employee_fixture.add(1, name='Andy Depressant', company=company_fixture.fk(1), manager=None)
+        employee_fixture.add(2, name='Mate Workman', company=company_fixture.fk(2), manager=None)
+        employee_fixture.add(3, name='Sloan Ranger', company=company_fixture.fk(2), manager=employee_fixture.fk(2))
+        outcomes = {}
+        # Companies: the emptiness check and one SELECT. Employees: the same,
+        # the prefetch of the companies, the manager of the new employee, an
+        # INSERT and an UPDATE.
+        with self.assertNumQueries(8):
+            employee_fixture.load(upsert=True, outcomes=outcomes)
+        self.assertEqual(outcomes, {
+            (Company, 1): 'unchanged', (Company, 2): 'unchanged',
+            (Employee, 1): 'unchanged', (Employee, 2): 'updated', (Employee, 3): 'inserted'})
+        self.assertEqual(Employee.objects.get(pk=2).company.name, 'Mozzarella')
+        self.assertEqual(Employee.objects.get(pk=3).manager.pk, 2)
+        # Fields not mentioned in the definition are left alone
+        self.assertEqual(Employee.objects.get(pk=2).cog_in_the_machine, True)
+
+    def test_empty_table_inserts(self):
+        band_fixture = Fixture(Band)
+        band_fixture.add(1, name="Nuns N' Hoses")
+        band_fixture.add(2, name='Led Dirigible')
+        # The emptiness check and one INSERT per object, no UPDATE attempts
+        with self.assertNumQueries(3):
+            band_fixture.load()
+        # The table is no longer empty, so normal saves are used
+        band_fixture.load()
+        self.assertEqual(Band.objects.count(), 2)
+        Band.objects.all().delete()
+        # Bulk inserted in raw mode
+        raw_band_fixture = Fixture(Band, raw=True)
+        raw_band_fixture.add(1, name="Nuns N' Hoses")
+        raw_band_fixture.add(2, name='Led Dirigible')
+        with self.assertNumQueries(2):
+            raw_band_fixture.load()
+        # Skip the check altogether
+        Band.objects.all().delete()
+        with self.assertNumQueries(1):
+            raw_band_fixture.load(empty_tables={(Band, None): True})
+        self.assertEqual(Band.objects.count(), 2)
+
+    def test_bulk_m2m_relations(self):
+        band_fixture = Fixture(Band)
+        band_fixture.add(1, name="Nuns N' Hoses")
+        band_fixture.add(2, name='Led Dirigible')
+        band_fixture.load()
+        roadie_fixture = Fixture(Roadie, raw=True)
+        for pk in range(1, 11):
+            roadie_fixture.add(pk, name='Roadie %d' % pk, hauls_for=[band_fixture.m2m(1), band_fixture.m2m(2)])
+        # Bands: the emptiness check and one SELECT. Roadies: the emptiness
+        # check, the prefetch of the bands, one INSERT for the roadies and
+        # one for their relations.
+        with self.assertNumQueries(6):
+            roadie_fixture.load(upsert=True)
+        self.assertEqual(Roadie.hauls_for.through.objects.count(), 20)
+        Roadie.objects.get(pk=3).hauls_for.remove(Band.objects.get(pk=2))
+        # The same, with a SELECT of the existing roadies instead of their
+        # INSERT, and another of their existing relations
+        with self.assertNumQueries(7):
+            roadie_fixture.load(upsert=True)
+        self.assertEqual(Roadie.hauls_for.through.objects.count(), 20)
+        self.assertEqual(Roadie.objects.get(pk=3).hauls_for.count(), 2)
+
+    def test_unload(self):
+        other_band = Band.objects.create(pk=99, name='Led Dirigible')
+        band_fixture = Fixture(Band)
+        band_fixture.add(1, name="Nuns N' Hoses")
+        roadie_fixture = Fixture(Roadie)
+        roadie_fixture.add(1, name='Marshall Amp', hauls_for=[band_fixture.m2m(1), other_band])
+        metalband_fixture = Fixture(MetalBand)
+        metalband_fixture.add(2, name='Brutallica', leather_pants_worn=True)
+        roadie_fixture.load()
+        metalband_fixture.load()
+        # Through table and Roadie, through table and Band
+        with self.assertNumQueries(4):
+            roadie_fixture.unload()
+        self.assertEqual(list(Band.objects.values_list('pk', flat=True)), [2, 99])
+        self.assertEqual(Roadie.objects.count(), 0)
+        self.assertEqual(Roadie.hauls_for.through.objects.count(), 0)
+        # The parent rows of multi-table inherited objects go too
+        unload_fixtures([metalband_fixture])
+        self.assertEqual(list(Band.objects.values_list('pk', flat=True)), [99])
+        # Loading again works as if nothing happened
+        roadie_fixture.load()
+        self.assertEqual(Roadie.objects.get(pk=1).hauls_for.count(), 2)
+
+    def test_lean_loading(self):
+        band_fixture = Fixture(Band)
+        band_fixture.add(1, name="Nuns N' Hoses")
+        band_fixture.add(2, name='Led Dirigible')
+        roadie_fixture = Fixture(Roadie)
+        roadie_fixture.add(1, name='Marshall Amp', hauls_for=[band_fixture.m2m(1), band_fixture.m2m(2)])
+        # Model classes instead of instances
+        self.assertEqual(band_fixture.load(lean=True), {1: Band, 2: Band})
+        self.assertEqual(roadie_fixture.load(lean=True)[1], Roadie)
+        # The definitions are not replaced with resolved ones
+        self.assertTrue(isinstance(roadie_fixture._kwarg_storage[1]['hauls_for'][0], DelayedRelatedObjectLoader))
+        self.assertEqual(sorted(Roadie.objects.get(pk=1).hauls_for.values_list('pk', flat=True)), [1, 2])
+
+    def test_partial_loading(self):
+        company_fixture = Fixture(Company)
+        company_fixture.add(1, name='FacelessCorp Inc.')
+        company_fixture.add(2, name='Dull Ltd.')
+        employee_fixture = Fixture(Employee)
+        employee_fixture.add(1, name='Ty Rant', company=company_fixture.fk(1))
+        employee_fixture.add(2, name='Sue Ecide-Risk', company=company_fixture.fk(1), manager=employee_fixture.fk(1))
+        employee_fixture.add(3, name='Andy Depressant', company=company_fixture.fk(2))
+        # The manager and the company come along, nothing else does
+        saved = employee_fixture.load(pks=[2])
+        self.assertEqual(sorted(saved.keys()), [1, 2])
+        self.assertEqual(list(Employee.objects.order_by('pk').values_list('pk', flat=True)), [1, 2])
+        self.assertEqual(list(Company.objects.values_list('pk', flat=True)), [1])
+
+        band_fixture = Fixture(Band)
+        band_fixture.add(1, name="Nuns N' Hoses")
+        band_fixture.add(2, name='Led Dirigible')
+        band_fixture.add(3, name='Bar Fighters')
+        roadie_fixture = Fixture(Roadie)
+        roadie_fixture.add(1, name='Marshall Amp', hauls_for=[band_fixture.m2m(1), band_fixture.m2m(2)])
+        roadie_fixture.add(2, name='Tats Brimhat', hauls_for=[band_fixture.m2m(3)])
+        # String primary keys from labels work, too
+        roadie_fixture.load(pks=['1'])
+        self.assertEqual(list(Roadie.objects.values_list('pk', flat=True)), [1])
+        self.assertEqual(sorted(Band.objects.values_list('pk', flat=True)), [1, 2])
+        self.assertEqual(Roadie.objects.get(pk=1).hauls_for.count(), 2)
+
+    def test_partial_loading_of_chains(self):
+        company_fixture = Fixture(Company)
+        company_fixture.add(1, name='FacelessCorp Inc.')
+        employee_fixture = Fixture(Employee)
+        employee_fixture.add(1, name='Employee 1', company=company_fixture.fk(1))
+        for pk in range(2, 101):
+            employee_fixture.add(pk, name='Employee %d' % pk, company=company_fixture.fk(1),
+                manager=employee_fixture.fk(pk - 1))
+        employee_fixture.add(101, name='Andy Depressant', company=company_fixture.fk(1))
+        # Each level of the chain is looked up by primary key instead of
+        # going through all the definitions again
+        pk_field = Employee._meta.pk
+        converted = []
+        def counting_to_python(value, to_python=pk_field.to_python):
+            converted.append(value)
+            return to_python(value)
+        pk_field.to_python = counting_to_python
+        try:
+            employee_fixture.load(pks=[100])
+        finally:
+            del pk_field.to_python
+        self.assertEqual(Employee.objects.count(), 100)
+        self.assertTrue(len(converted) < 500, len(converted))
+
+    def test_replication(self):
+        company_fixture = Fixture(Company)
+        company_fixture.add(1, name='FacelessCorp Inc.')
+        employee_fixture = Fixture(Employee)
+        employee_fixture.add(1, name='Ty Rant', company=company_fixture.fk(1))
+        employee_fixture.add(2, name='Sue Ecide-Risk', company=company_fixture.fk(1), manager=employee_fixture.fk(1))
+        history_fixture = Fixture(EmployeeHistory)
+        history_fixture.add(2, employee=employee_fixture.o2o(2), date_joined='2006-08-07')
+        def vary(model, copy, definitions):
+            if model is Company:
+                definitions['name'] += ' #%d' % copy
+            return definitions
+        replicas = replicate(history_fixture, 3, vary=vary)
+        self.assertEqual([r.model for r in replicas], [Company, Employee, EmployeeHistory])
+        replicas[-1].load()
+        # Only the copies, each pointing within itself
+        self.assertEqual(list(Company.objects.order_by('pk').values_list('pk', 'name')),
+            [(11, 'FacelessCorp Inc. #1'), (21, 'FacelessCorp Inc. #2'), (31, 'FacelessCorp Inc. #3')])
+        self.assertEqual(list(Employee.objects.order_by('pk').values_list('pk', 'company', 'manager')),
+            [(11, 11, None), (12, 11, 11), (21, 21, None), (22, 21, 21), (31, 31, None), (32, 31, 31)])
+        self.assertEqual(list(EmployeeHistory.objects.order_by('pk').values_list('pk', 'employee')),
+            [(12, 12), (22, 22), (32, 32)])
+        # The references of the copies aren't kept around
+        for replica in replicas:
+            self.assertEqual(replica._delayed_loaders, {})
+        # The originals load alongside
+        history_fixture.load()
+        self.assertEqual(Employee.objects.count(), 8)
+
+        band_fixture = Fixture(Band)
+        band_fixture.add(1, name="Nuns N' Hoses")
+        band_fixture.add(2, name='Led Dirigible')
+        roadie_fixture = Fixture(Roadie)
+        roadie_fixture.add(1, name='Marshall Amp', hauls_for=[band_fixture.m2m(1), band_fixture.m2m(2)])
+        replicate([roadie_fixture], 2, offset=100)[-1].load()
+        self.assertEqual(sorted(Roadie.objects.get(pk=201).hauls_for.values_list('pk', flat=True)), [201, 202])
+        self.assertEqual(sorted(Band.objects.values_list('pk', flat=True)), [101, 102, 201, 202])
+        self.assertRaises(FixtureUsageError, replicate, roadie_fixture, 2, offset=2)
+
+
+class ColumnarStorageTests(TestCase):
+    def test_mapping_behaviour(self):
+        storage = ColumnarStorage()
+        storage[3] = {'pk': 3, 'name': u'Bar Fighters', 'rank': 1}
+        storage[1] = {'pk': 1, 'name': u'Brutallica'}
+        storage['x'] = {'pk': 'x', 'name': u'Led Dirigible', 'rank': None, 'extra': [1, 2]}
+        self.assertEqual(storage.keys(), [3, 1, 'x'])
+        self.assertEqual(len(storage), 3)
+        self.assertTrue(1 in storage)
+        self.assertFalse(2 in storage)
+        self.assertEqual(storage[3], {'pk': 3, 'name': u'Bar Fighters', 'rank': 1})
+        # Fields missing from a definition stay missing, None is kept
+        self.assertEqual(storage[1], {'pk': 1, 'name': u'Brutallica'})
+        self.assertEqual(storage['x'], {'pk': 'x', 'name': u'Led Dirigible', 'rank': None, 'extra': [1, 2]})
+        # Replacing a definition keeps its position
+        storage[1] = {'pk': 1, 'rank': 2.5}
+        self.assertEqual(storage.items(), [
+            (3, {'pk': 3, 'name': u'Bar Fighters', 'rank': 1}),
+            (1, {'pk': 1, 'rank': 2.5}),
+            ('x', {'pk': 'x', 'name': u'Led Dirigible', 'rank': None, 'extra': [1, 2]}),
+        ])
+
+    def test_compact_columns(self):
+        from array import array
+        from class_fixtures.models import DelayedMilkmanDelivery
+        storage = ColumnarStorage()
+        for i in range(10):
+            storage[i] = {'pk': i, 'year': 1990 + i, 'genre': u''.join([u'Ro', u'ck'])}
+        self.assertTrue(isinstance(storage._columns['year'], array))
+        # Equal strings are shared
+        self.assertTrue(storage[0]['genre'] is storage[9]['genre'])
+        storage[10] = DelayedMilkmanDelivery(pk=10, year='MCMXC')
+        self.assertTrue(isinstance(storage._columns['year'], list))
+        self.assertTrue(isinstance(storage[10], DelayedMilkmanDelivery))
+        self.assertFalse(isinstance(storage[9], DelayedMilkmanDelivery))
+        self.assertEqual([d['year'] for d in storage.values()], range(1990, 2000) + ['MCMXC'])
+
+    def test_interning(self):
+        from class_fixtures.utils.storage import INTERN_SAMPLE_SIZE
+        storage = ColumnarStorage()
+        for i in range(INTERN_SAMPLE_SIZE * 2):
+            storage[i] = {'pk': i, 'name': u'Band %d' % i, 'genre': u''.join([u'Ro', u'ck']),
+                'country': ''.join(['F', 'I'])}
+        self.assertTrue(storage[0]['genre'] is storage[INTERN_SAMPLE_SIZE * 2 - 1]['genre'])
+        self.assertTrue(storage[0]['country'] is storage[1]['country'])
+        # Mostly distinct columns don't keep a table of their values
+        self.assertEqual(storage._interned['name'], None)
+        self.assertEqual(len(storage._interned['genre']), 1)
+        self.assertFalse('country' in storage._interned)
+        self.assertEqual(storage[150]['name'], u'Band 150')
+
 
 class DependencyResolutionTests(TestCase):
     """
@@ -352,6 +698,98 @@ class DependencyResolutionTests(TestCase):
         self.assertEqual(Band.objects.get(name='Led Dirigible').roadie_set.count(), 1)
 
 
+class LazyFixtureTests(TestCase):
+    def test_lazy_fixture(self):
+        company_fixture = Fixture(Company)
+        company_fixture.add(1, name='Macrohard')
+        saved_counts = []
+        def employees():
+            for i in range(1, 8):
+                # Record how many objects had been saved when each
+                # definition was generated
+                saved_counts.append(Employee.objects.count())
+                yield i, {'name': 'Drone #%d' % i, 'company': company_fixture.fk(1)}
+        employee_fixture = LazyFixture(Employee, employees, depends_on=[company_fixture], batch_size=3)
+        employee_fixture.load()
+        self.assertEqual(Company.objects.count(), 1)
+        self.assertEqual(Employee.objects.count(), 7)
+        self.assertEqual(Employee.objects.get(pk=7).company.name, 'Macrohard')
+        # Consumed in batches of three
+        self.assertEqual(saved_counts, [0, 0, 0, 3, 3, 3, 6])
+
+    def test_m2m_and_self_references(self):
+        band_fixture = Fixture(Band)
+        band_fixture.add(1, name="Nuns N' Hoses")
+        roadie_fixture = LazyFixture(Roadie,
+            lambda: iter([(1, {'name': 'Marshall Amp', 'hauls_for': [band_fixture.m2m(1), 2]})]),
+            depends_on=[band_fixture])
+        Band.objects.create(pk=2, name='Led Dirigible')
+        roadie_fixture.load()
+        self.assertEqual(Roadie.objects.get(pk=1).hauls_for.count(), 2)
+
+        company_fixture = Fixture(Company)
+        company_fixture.add(1, name='Macrohard')
+        def employees():
+            yield 1, {'name': 'Andy Depressant', 'company': company_fixture.fk(1)}
+            yield 2, {'name': 'Sadie Peon', 'company': company_fixture.fk(1), 'manager': employee_fixture.fk(1)}
+        employee_fixture = LazyFixture(Employee, employees, depends_on=[company_fixture])
+        employee_fixture.load()
+        self.assertEqual(Employee.objects.get(pk=2).manager.pk, 1)
+
+    def test_undeclared_dependency(self):
+        company_fixture = Fixture(Company)
+        company_fixture.add(1, name='Macrohard')
+        employee_fixture = LazyFixture(Employee,
+            lambda: iter([(1, {'name': 'Andy Depressant', 'company': company_fixture.fk(1)})]))
+        self.assertRaises(FixtureUsageError, employee_fixture.load)
+        self.assertRaises(FixtureUsageError, employee_fixture.add, 2, name='Sadie Peon')
+
+
+class CSVFixtureTests(TestCase):
+    def csv_path(self, filename):
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'csv_data', filename)
+
+    def test_csv_fixture(self):
+        company_fixture = Fixture.from_csv(Company, self.csv_path('companies.csv'), 'id')
+        self.assertTrue(isinstance(company_fixture, CSVFixture))
+        company_fixture.load()
+        self.assertEqual(Company.objects.count(), 2)
+        self.assertEqual(Company.objects.get(pk=2).name, 'Bloatware Corporation')
+
+    def test_relations_to_other_fixtures(self):
+        company_fixture = Fixture(Company)
+        company_fixture.add(1, name='Macrohard')
+        company_fixture.add(2, name='Bloatware Corporation')
+        # TSV, batches smaller than the file and a self-referencing FK
+        employee_fixture = Fixture.from_csv(Employee, self.csv_path('employees.tsv'), 'id',
+            relations={'company': company_fixture, 'manager': 'self'}, delimiter='\t', batch_size=2)
+        self.assertEqual(employee_fixture._dependencies, [company_fixture])
+        employee_fixture.load()
+        self.assertEqual(Employee.objects.count(), 3)
+        self.assertEqual(Employee.objects.get(pk=2).company.name, 'Bloatware Corporation')
+        self.assertEqual(Employee.objects.get(pk=2).manager.name, 'Andy Depressant')
+        self.assertEqual(Employee.objects.get(pk=3).manager, None)
+        self.assertEqual(Employee.objects.get(pk=2).cog_in_the_machine, True)
+
+    def test_m2m_column(self):
+        band_fixture = Fixture(Band)
+        band_fixture.add(1, name="Nuns N' Hoses")
+        band_fixture.add(2, name='Led Dirigible')
+        roadie_fixture = Fixture.from_csv(Roadie, self.csv_path('roadies.csv'), 'id',
+            relations={'hauls_for': band_fixture})
+        roadie_fixture.load()
+        self.assertEqual(Band.objects.count(), 2)
+        self.assertEqual(Roadie.objects.get(pk=1).hauls_for.count(), 2)
+        self.assertEqual(Roadie.objects.get(pk=2).hauls_for.count(), 0)
+
+    def test_errors(self):
+        company_fixture = Fixture.from_csv(Company, self.csv_path('companies.csv'), 'pk')
+        self.assertRaises(FixtureUsageError, company_fixture.load)
+        self.assertRaises(FixtureUsageError, company_fixture.add, 3, name='Macrohard')
+        self.assertRaises(FixtureUsageError, Fixture.from_csv, Company,
+            self.csv_path('companies.csv'), 'id', relations={'name': company_fixture})
+
+
 class FixtureDiscoveryHandlingLoadingTests(TestCase):
     """
     Test the different ways of referring to class fixtures through
@@ -558,6 +996,106 @@ class FixtureDiscoveryHandlingLoadingTests(TestCase):
             call_command('loaddata', 'other_fixtures')
             self.assertEqual(output.getvalue(), 'Installed 14 object(s) from 8 fixture(s)\n')
 
+    def test_correct_fixture_counts_lean(self):
+        with string_stdout() as output:
+            call_command('loaddata', 'other_fixtures', lean=True)
+            self.assertEqual(output.getvalue(), 'Installed 14 object(s) from 8 fixture(s)\n')
+        self.assertEqual(Roadie.objects.count(), 3)
+
+    def test_upsert_counts(self):
+        with string_stdout() as output:
+            call_command('loaddata', 'other_fixtures', upsert=True)
+            self.assertEqual(output.getvalue(), 'Inserted 14, updated 0 and left 0 unchanged object(s) from 8 fixture(s)\n')
+        with string_stdout() as output:
+            call_command('loaddata', 'other_fixtures', upsert=True)
+            self.assertEqual(output.getvalue(), 'Inserted 0, updated 0 and left 14 unchanged object(s) from 8 fixture(s)\n')
+
+    def test_partial_loading(self):
+        with string_stdout() as output:
+            call_command('loaddata', 'tests.other_fixtures:Membership=7')
+            self.assertEqual(output.getvalue(), 'Installed 3 object(s) from 1 fixture(s)\n')
+        self.assertEqual(Membership.objects.get().musician.name, 'Dave Growl')
+        self.assertEqual(Band.objects.get().name, 'Bar Fighters')
+        self.assertEqual(Musician.objects.count(), 1)
+        self.assertEqual(Roadie.objects.count(), 0)
+        self.assertRaises(FixtureUsageError, call_command, 'loaddata', 'tests.other_fixtures:Membership=9')
+        self.assertRaises(FixtureUsageError, call_command, 'loaddata', 'tests.other_fixtures:Manager=7')
+        self.assertRaises(FixtureUsageError, call_command, 'loaddata', 'tests.other_fixtures:Membership')
+
+    def test_assume_empty(self):
+        with string_stdout() as output:
+            call_command('loaddata', 'other_fixtures', assume_empty=True)
+            self.assertEqual(output.getvalue(), 'Installed 14 object(s) from 8 fixture(s)\n')
+        self.assertEqual(Employee.objects.count(), 2)
+
+    def test_replace(self):
+        call_command('loaddata', 'other_fixtures', verbosity=0)
+        stale_band = Band.objects.create(pk=99, name='Led Dirigible')
+        Roadie.objects.get(pk=3).hauls_for.add(stale_band)
+        Band.objects.filter(pk=5).update(name='Bar Fiters')
+        call_command('loaddata', 'other_fixtures', verbosity=0, replace='stale')
+        self.assertEqual(Band.objects.filter(pk=99).count(), 0)
+        self.assertEqual(list(Roadie.objects.get(pk=3).hauls_for.values_list('pk', flat=True)), [5])
+        self.assertEqual(Band.objects.get(pk=5).name, 'Bar Fighters')
+        # The parent row of the MetalBand is not stale
+        self.assertEqual(MetalBand.objects.get(pk=6).name, 'Brutallica')
+        self.assertEqual(Band.objects.count(), 2)
+
+        Band.objects.create(pk=99, name='Led Dirigible')
+        Company.objects.create(pk=99, name='Mozzarella')
+        with string_stdout() as output:
+            call_command('loaddata', 'other_fixtures', replace='all')
+            self.assertEqual(output.getvalue(), 'Installed 14 object(s) from 8 fixture(s)\n')
+        self.assertEqual(Band.objects.count(), 2)
+        self.assertEqual(Company.objects.filter(pk=99).count(), 0)
+        self.assertEqual(Roadie.objects.get(pk=4).hauls_for.count(), 2)
+
+    def test_replace_several_labels(self):
+        Company.objects.create(pk=99, name='Mozzarella')
+        for replace in ['stale', 'all']:
+            with string_stdout() as output:
+                call_command('loaddata', 'some_fixtures', 'other_fixtures', replace=replace)
+                self.assertEqual(output.getvalue(), 'Installed 19 object(s) from 11 fixture(s)\n')
+            # The objects of the first label aren't replaced by the second
+            self.assertEqual(sorted(Company.objects.values_list('pk', flat=True)), [2, 3])
+            self.assertEqual(Employee.objects.filter(company=3).count(), 2)
+            self.assertEqual(Employee.objects.count(), 4)
+
+    def test_delete_objects_except(self):
+        from class_fixtures.utils.db import delete_objects_except
+        for pk in [1, 2, 3, 4, 7, 9]:
+            MetalBand.objects.create(pk=pk, name='Band %d' % pk)
+        roadie = Roadie.objects.create(pk=1, name='Marshall Amp')
+        roadie.hauls_for.add(Band.objects.get(pk=1), Band.objects.get(pk=4))
+        delete_objects_except(MetalBand, [1, 2, 3, 7])
+        self.assertEqual(sorted(MetalBand.objects.values_list('pk', flat=True)), [1, 2, 3, 7])
+        # The parent rows and M2M relations of the stale objects go too
+        self.assertEqual(sorted(Band.objects.values_list('pk', flat=True)), [1, 2, 3, 7])
+        self.assertEqual(list(roadie.hauls_for.values_list('pk', flat=True)), [1])
+        # Too many parameters for SQLite, whose fallback gives the same result
+        delete_objects_except(MetalBand, range(1, 2000, 2))
+        self.assertEqual(sorted(MetalBand.objects.values_list('pk', flat=True)), [1, 3, 7])
+        delete_objects_except(MetalBand, [])
+        self.assertEqual(Band.objects.count(), 0)
+
+    def test_sequence_reset(self):
+        from django.db import connection
+        reset_models = []
+        def sequence_reset_sql(style, model_list):
+            reset_models.extend(model_list)
+            return []
+        original_sequence_reset_sql = connection.ops.sequence_reset_sql
+        connection.ops.sequence_reset_sql = sequence_reset_sql
+        try:
+            call_command('loaddata', 'other_fixtures', verbosity=0)
+        finally:
+            connection.ops.sequence_reset_sql = original_sequence_reset_sql
+        # Once, with the models of all the fixtures, and the parent of
+        # MetalBand.
+        self.assertEqual(sorted([m._meta.object_name for m in reset_models]), [
+            'Band', 'Company', 'Employee', 'EmployeeHistory', 'Membership',
+            'MetalBand', 'Musician', 'Roadie'])
+
     def test_correct_initial_data_fixture_counts(self):
         with string_stdout() as output:
             call_command('loaddata', 'initial_data')
@@ -645,6 +1183,473 @@ class FixtureDiscoveryHandlingLoadingTests(TestCase):
         self.assertEqual(Roadie.objects.count(), 2)
 
 
+class FixtureMarkerTests(TransactionTestCase):
+    """
+    class_fixtures.markers is not installed for the rest of the tests, since
+    it changes the outcome of repeated loaddata runs. Install it and create
+    its table for the duration of each test here.
+    """
+    def setUp(self):
+        from django.core.management.color import no_style
+        from django.db import connection, transaction
+        from class_fixtures.markers.models import FixtureMarker
+        self.old_apps = settings.INSTALLED_APPS
+        settings.INSTALLED_APPS = list(self.old_apps) + ['class_fixtures.markers']
+        cursor = connection.cursor()
+        for sql in connection.creation.sql_create_model(FixtureMarker, no_style(), set())[0]:
+            cursor.execute(sql)
+        transaction.commit_unless_managed()
+
+    def tearDown(self):
+        from django.db import connection, transaction
+        from class_fixtures.markers.models import FixtureMarker
+        connection.cursor().execute('DROP TABLE %s' % FixtureMarker._meta.db_table)
+        transaction.commit_unless_managed()
+        settings.INSTALLED_APPS = self.old_apps
+
+    def test_unchanged_fixtures_skipped(self):
+        from class_fixtures.markers.models import FixtureMarker
+        with string_stdout() as output:
+            call_command('loaddata', 'other_fixtures', verbosity=1)
+            self.assertEqual(output.getvalue(), 'Installed 14 object(s) from 8 fixture(s)\n')
+        self.assertEqual(FixtureMarker.objects.count(), 8)
+        self.assertTrue(FixtureMarker.objects.filter(label='class_fixtures.tests.fixtures.other_fixtures.band_fixture').exists())
+        with string_stdout() as output:
+            call_command('loaddata', 'other_fixtures', verbosity=1)
+            self.assertEqual(output.getvalue(), 'Skipped 8 unchanged fixture(s)\n')
+        with string_stdout() as output:
+            call_command('loaddata', 'other_fixtures', verbosity=1, force=True)
+            self.assertEqual(output.getvalue(), 'Installed 14 object(s) from 8 fixture(s)\n')
+
+    def test_changed_fixtures_loaded(self):
+        from class_fixtures.markers.models import FixtureMarker
+        band_fixture = Fixture(Band)
+        band_fixture.label = 'bands'
+        band_fixture.add(1, name="Nuns N' Hoses")
+        call_command('loaddata', band_fixture, verbosity=0)
+        first_hash = FixtureMarker.objects.get(label='bands').content_hash
+        band_fixture = Fixture(Band)
+        band_fixture.label = 'bands'
+        band_fixture.add(1, name='Led Dirigible')
+        call_command('loaddata', band_fixture, verbosity=0)
+        self.assertNotEqual(FixtureMarker.objects.get(label='bands').content_hash, first_hash)
+        self.assertEqual(Band.objects.get(pk=1).name, 'Led Dirigible')
+        # Unlabeled fixtures are always loaded and leave no markers
+        call_command('loaddata', Fixture(Band), verbosity=0)
+        self.assertEqual(FixtureMarker.objects.count(), 1)
+
+
+class FastLoadTests(TransactionTestCase):
+    """
+    Changing the SQLite settings commits the open transaction, so these need
+    to run outside the transaction of a TestCase.
+    """
+    def get_pragmas(self):
+        from django.db import connection
+        cursor = connection.cursor()
+        values = []
+        for pragma in ('foreign_keys', 'synchronous', 'journal_mode'):
+            cursor.execute('PRAGMA %s' % pragma)
+            values.append(cursor.fetchone()[0])
+        return values
+
+    def test_fast_load(self):
+        from django.db import connection, IntegrityError
+        if connection.vendor != 'sqlite':
+            return
+        previous = self.get_pragmas()
+        with string_stdout() as output:
+            call_command('loaddata', 'other_fixtures', fast_load=True)
+            self.assertEqual(output.getvalue(), 'Installed 14 object(s) from 8 fixture(s)\n')
+        self.assertEqual(self.get_pragmas(), previous)
+        # A dangling foreign key, courtesy of raw mode and an attname
+        employee_fixture = Fixture(Employee, raw=True)
+        employee_fixture.add(99, name='Andy Depressant', company_id=99, manager=None)
+        self.assertRaises(IntegrityError, call_command, 'loaddata', employee_fixture, fast_load=True, verbosity=0)
+        self.assertEqual(self.get_pragmas(), previous)
+        self.assertEqual(Employee.objects.filter(pk=99).count(), 0)
+
+    def test_fast_load_checks_written_tables(self):
+        connection = connections['default']
+        if connection.vendor != 'sqlite':
+            return
+        checked = []
+        check_constraints = connection.check_constraints
+        def recording_check_constraints(table_names=None):
+            checked.append(table_names)
+            check_constraints(table_names=table_names)
+        connection.check_constraints = recording_check_constraints
+        try:
+            call_command('loaddata', 'some_fixtures', fast_load=True, commit_every=2, verbosity=0)
+        finally:
+            del connection.check_constraints
+        self.assertTrue(len(checked) > 1)
+        # Only the tables of the loaded models
+        self.assertEqual(checked[-1], ['tests_company', 'tests_employee', 'tests_employeehistory'])
+
+    def test_fast_load_requires_own_transaction(self):
+        from django.core.management.base import CommandError
+        self.assertRaises(CommandError, call_command, 'loaddata', 'other_fixtures', fast_load=True, commit=False)
+
+
+class DeferredIndexTests(TransactionTestCase):
+    """
+    Index DDL commits the open transaction on SQLite, so these need to run
+    outside the transaction of a TestCase.
+    """
+    def get_indexes(self):
+        from django.db import connection
+        cursor = connection.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name IN "
+            "('tests_employee', 'tests_membership', 'tests_roadie_hauls_for') AND sql IS NOT NULL")
+        return sorted([row[0] for row in cursor.fetchall()])
+
+    def test_drop_and_rebuild(self):
+        from django.db import connection
+        if connection.vendor != 'sqlite':
+            return
+        indexes = self.get_indexes()
+        # Two FKs on each model
+        self.assertEqual(len(indexes), 6)
+        deferred_indexes = DeferredIndexes(connection, [Employee, Membership, Roadie])
+        deferred_indexes.drop()
+        self.assertEqual(self.get_indexes(), [])
+        deferred_indexes.rebuild()
+        self.assertEqual(self.get_indexes(), indexes)
+
+    def test_defer_indexes(self):
+        from django.db import connection
+        if connection.vendor != 'sqlite':
+            return
+        from django.db import transaction
+        indexes = self.get_indexes()
+        # The CREATE INDEX statements would commit the load on SQLite, so
+        # they only run once loaddata has committed it itself.
+        rebuild = DeferredIndexes.rebuild
+        managed_during_rebuild = []
+        def recording_rebuild(deferred_indexes):
+            managed_during_rebuild.append(transaction.is_managed())
+            rebuild(deferred_indexes)
+        DeferredIndexes.rebuild = recording_rebuild
+        try:
+            with string_stdout() as output:
+                call_command('loaddata', 'other_fixtures', defer_indexes=True)
+                self.assertEqual(output.getvalue(), 'Installed 14 object(s) from 8 fixture(s)\n')
+        finally:
+            DeferredIndexes.rebuild = rebuild
+        self.assertEqual(managed_during_rebuild, [False])
+        self.assertEqual(self.get_indexes(), indexes)
+        self.assertEqual(Employee.objects.filter(company__name='FacelessCorp Inc.').count(), 2)
+        # Restored after failed loads too
+        employee_fixture = Fixture(Employee)
+        employee_fixture.add(99, name='Andy Depressant', company=99, manager=None)
+        with string_stdout():
+            call_command('loaddata', employee_fixture, defer_indexes=True, verbosity=0)
+        self.assertEqual(self.get_indexes(), indexes)
+        self.assertEqual(Employee.objects.filter(pk=99).count(), 0)
+
+    def test_restore_after_intermediate_commit(self):
+        from django.db import connection
+        if connection.vendor != 'sqlite':
+            return
+        indexes = self.get_indexes()
+        rebuild = DeferredIndexes.rebuild
+        rebuilt = []
+        def recording_rebuild(deferred_indexes):
+            rebuilt.append(True)
+            rebuild(deferred_indexes)
+        DeferredIndexes.rebuild = recording_rebuild
+        try:
+            deferred_indexes = DeferredIndexes(connection, [Employee, Membership, Roadie])
+            # As on PostgreSQL, where a rollback brings the indexes back
+            # until the transaction has been committed
+            deferred_indexes.commits_implicitly = False
+            deferred_indexes.drop()
+            deferred_indexes.restore()
+            self.assertEqual(rebuilt, [])
+            # Which SQLite doesn't do
+            rebuild(deferred_indexes)
+            deferred_indexes.drop()
+            deferred_indexes.transaction_committed()
+            deferred_indexes.restore()
+            self.assertEqual(rebuilt, [True])
+        finally:
+            DeferredIndexes.rebuild = rebuild
+        self.assertEqual(self.get_indexes(), indexes)
+
+    def test_defer_indexes_requires_own_transaction(self):
+        from django.core.management.base import CommandError
+        self.assertRaises(CommandError, call_command, 'loaddata', 'other_fixtures', defer_indexes=True, commit=False)
+
+
+class ChunkedCommitTests(TransactionTestCase):
+    """
+    The objects committed before a failure must survive the rollback, which
+    can only be seen outside the transaction of a TestCase.
+    """
+    def test_commit_every_fixture(self):
+        from StringIO import StringIO
+        band_fixture = Fixture(Band)
+        band_fixture.add(1, name='Bruce Springsteen & The E Street Band')
+        employee_fixture = Fixture(Employee)
+        employee_fixture.add(99, name='Andy Depressant', company=99, manager=None)
+        band_fixture.label = 'bands'
+        errors = StringIO()
+        sys.stderr = errors
+        try:
+            with string_stdout():
+                call_command('loaddata', band_fixture, employee_fixture, commit_every='fixture', verbosity=0)
+        finally:
+            sys.stderr = sys.__stderr__
+        self.assertEqual(Band.objects.count(), 1)
+        self.assertEqual(Employee.objects.count(), 0)
+        self.assertTrue('Committed 1 object(s) and 1 complete fixture(s), up to and including bands.'
+            in errors.getvalue())
+
+    def test_commit_every_n_objects(self):
+        from django.db import transaction
+        commits = []
+        original_commit = transaction.commit
+        def counting_commit(*args, **kwargs):
+            commits.append(1)
+            original_commit(*args, **kwargs)
+        transaction.commit = counting_commit
+        try:
+            with string_stdout() as output:
+                call_command('loaddata', 'other_fixtures', commit_every=5)
+                self.assertEqual(output.getvalue(), 'Installed 14 object(s) from 8 fixture(s)\n')
+        finally:
+            transaction.commit = original_commit
+        self.assertEqual(Employee.objects.filter(company__name='FacelessCorp Inc.').count(), 2)
+        # Dependencies get written again with every Fixture that depends on
+        # them, so more than 14 objects are written in all, and there's a
+        # final commit at the end.
+        self.assertTrue(len(commits) >= 4)
+
+    def test_resume(self):
+        import shutil
+        import tempfile
+        from StringIO import StringIO
+        from class_fixtures.tests.models import Company
+        checkpoint_dir = tempfile.mkdtemp()
+        settings.CLASS_FIXTURES_CHECKPOINT_DIR = checkpoint_dir
+        try:
+            band_fixture = Fixture(Band)
+            band_fixture.add(1, name='Bruce Springsteen & The E Street Band')
+            band_fixture.label = 'bands'
+            employee_fixture = Fixture(Employee)
+            employee_fixture.add(99, name='Andy Depressant', company=99, manager=None)
+            employee_fixture.label = 'employees'
+            sys.stderr = StringIO()
+            try:
+                with string_stdout():
+                    call_command('loaddata', band_fixture, employee_fixture, resume=True, verbosity=0)
+            finally:
+                sys.stderr = sys.__stderr__
+            self.assertEqual(Band.objects.count(), 1)
+            self.assertEqual(len(os.listdir(checkpoint_dir)), 1)
+            # Fix the problem and delete the band to see that its fixture
+            # doesn't get loaded again.
+            Company.objects.create(pk=99, name='Dull Ltd.')
+            Band.objects.all().delete()
+            with string_stdout() as output:
+                call_command('loaddata', band_fixture, employee_fixture, resume=True)
+                self.assertEqual(output.getvalue(),
+                    'Resumed after 1 fixture(s) loaded by a previous run\n'
+                    'Installed 1 object(s) from 1 fixture(s)\n')
+            self.assertEqual(Band.objects.count(), 0)
+            self.assertEqual(Employee.objects.count(), 1)
+            # Finished plans leave no checkpoints behind
+            self.assertEqual(os.listdir(checkpoint_dir), [])
+        finally:
+            del settings.CLASS_FIXTURES_CHECKPOINT_DIR
+            shutil.rmtree(checkpoint_dir)
+
+    def test_checkpoint_files(self):
+        import shutil
+        import stat
+        import tempfile
+        from class_fixtures.utils.loaddata import LoadCheckpoint
+        checkpoint = LoadCheckpoint(['bands', 'employees'], 'default')
+        # A directory of the current user's own, out of reach of others
+        directory = os.path.dirname(checkpoint.path)
+        self.assertEqual(os.stat(directory).st_uid, os.getuid())
+        self.assertEqual(stat.S_IMODE(os.stat(directory).st_mode), 0700)
+        # Files in the way aren't written through
+        target = tempfile.NamedTemporaryFile()
+        os.symlink(target.name, checkpoint.path + '.tmp')
+        try:
+            checkpoint.record(0)
+            self.assertEqual(LoadCheckpoint(['bands', 'employees'], 'default').completed, 1)
+            self.assertEqual(open(target.name).read(), '')
+        finally:
+            os.remove(checkpoint.path + '.tmp')
+            checkpoint.clear()
+            target.close()
+        # Directories of other users are not trusted
+        getuid = os.getuid
+        os.getuid = lambda: getuid() + 1
+        try:
+            self.assertRaises(FixtureUsageError, LoadCheckpoint, ['bands'], 'default')
+        finally:
+            os.getuid = getuid
+            shutil.rmtree(os.path.join(tempfile.gettempdir(), 'class_fixtures_checkpoints_%d' % (getuid() + 1)))
+
+    def test_commit_every_errors(self):
+        from django.core.management.base import CommandError
+        self.assertRaises(CommandError, call_command, 'loaddata', 'other_fixtures', commit_every='fixture', commit=False)
+        self.assertRaises(CommandError, call_command, 'loaddata', 'other_fixtures', commit_every='0')
+        self.assertRaises(CommandError, call_command, 'loaddata', 'other_fixtures', commit_every='some')
+
+
+class ProvisioningTests(TransactionTestCase):
+    """
+    The worker processes commit for real, which a TestCase would prevent.
+    """
+    def test_provision_sqlite_databases(self):
+        import shutil
+        import sqlite3
+        import tempfile
+        directory = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(directory, 'worker_%d.db' % i) for i in range(3)]
+            fixture_module = import_module('class_fixtures.tests.fixtures.other_fixtures')
+            fixtures = get_fixtures_from_module(fixture_module)
+            self.assertEqual(provision_sqlite_databases(fixtures, paths, processes=2), [14, 14, 14])
+            for path in paths:
+                connection = sqlite3.connect(path)
+                try:
+                    self.assertEqual(connection.execute('SELECT COUNT(*) FROM tests_employee').fetchone()[0], 2)
+                    self.assertEqual(connection.execute('SELECT COUNT(*) FROM tests_roadie_hauls_for').fetchone()[0], 4)
+                finally:
+                    connection.close()
+            # Nothing ends up in the database of the test run itself
+            self.assertEqual(Employee.objects.count(), 0)
+            with string_stdout() as output:
+                call_command('loaddata', 'other_fixtures', provision=paths[0])
+                self.assertEqual(output.getvalue(), 'Installed 14 object(s) from 8 fixture(s) into each of 1 database(s)\n')
+        finally:
+            shutil.rmtree(directory)
+
+    def test_unpicklable_fixtures(self):
+        lazy_fixture = LazyFixture(Band, lambda: [(1, {'name': 'Bar Fighters'})])
+        self.assertRaises(FixtureUsageError, provision_sqlite_databases, [lazy_fixture], ['unused.db'])
+
+
+class FixtureDaemonTests(TransactionTestCase):
+    def test_fixture_daemon(self):
+        import shutil
+        import sqlite3
+        import tempfile
+        directory = tempfile.mkdtemp()
+        daemon = FixtureDaemon(os.path.join(directory, 'daemon.sock'))
+        daemon.start()
+        try:
+            plan = request_plan(['other_fixtures'], daemon.socket_path)
+            self.assertEqual(len(plan), 8)
+            self.assertEqual(load_plan(plan), 14)
+            self.assertEqual(Employee.objects.count(), 2)
+            prepared = daemon.plans[('other_fixtures',)]
+            request_plan(['other_fixtures'], daemon.socket_path)
+            self.assertTrue(daemon.plans[('other_fixtures',)] is prepared)
+            # Touching a fixture module gets the plan prepared again
+            source = import_module('class_fixtures.tests.fixtures.other_fixtures').__file__.replace('.pyc', '.py')
+            mtime = os.stat(source).st_mtime
+            os.utime(source, (mtime, mtime + 1))
+            try:
+                path = os.path.join(directory, 'test.db')
+                self.assertEqual(request_database(['other_fixtures'], path, daemon.socket_path), 14)
+            finally:
+                os.utime(source, (mtime, mtime))
+            self.assertFalse(daemon.plans[('other_fixtures',)] is prepared)
+            connection = sqlite3.connect(path)
+            try:
+                self.assertEqual(connection.execute('SELECT COUNT(*) FROM tests_employee').fetchone()[0], 2)
+            finally:
+                connection.close()
+            self.assertRaises(FixtureUsageError, request_plan, ['tests.json'], daemon.socket_path)
+            # Sockets of other users are not trusted
+            getuid = os.getuid
+            os.getuid = lambda: getuid() + 1
+            try:
+                self.assertRaises(FixtureUsageError, request_plan, ['other_fixtures'], daemon.socket_path)
+            finally:
+                os.getuid = getuid
+        finally:
+            daemon.shutdown()
+            shutil.rmtree(directory)
+
+
+class FixtureWatcherTests(TestCase):
+    watched_module = '''
+from class_fixtures.models import Fixture
+from class_fixtures.tests.models import Band, Roadie
+
+band_fixture = Fixture(Band)
+roadie_fixture = Fixture(Roadie)
+%s
+'''
+
+    def write_module(self, path, definitions, mtime):
+        with open(path, 'w') as f:
+            f.write(self.watched_module % definitions)
+        os.utime(path, (mtime, mtime))
+
+    def test_watch(self):
+        import shutil
+        import tempfile
+        import time
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'watched_fixtures.py')
+        # Explicit modification times, since edits within the same second
+        # would go unnoticed
+        mtime = int(time.time()) - 10
+        self.write_module(path, '''
+band_fixture.add(1, name="Bar Fighters")
+band_fixture.add(2, name="Brutallica")
+band_fixture.add(3, name="The Rolling Rocks")
+roadie_fixture.add(1, name="Ciggy Tardust", hauls_for=[band_fixture.m2m(1), band_fixture.m2m(2)])
+''', mtime)
+        sys.path.insert(0, directory)
+        try:
+            module = import_module('watched_fixtures')
+            call_command('loaddata', module, verbosity=0)
+            watcher = FixtureWatcher([module])
+            self.assertEqual(watcher.poll(), None)
+            self.write_module(path, '''
+band_fixture.add(1, name="Bar Fighters")
+band_fixture.add(2, name="Brutallica!")
+band_fixture.add(4, name="Led Zeppelinn")
+roadie_fixture.add(1, name="Ciggy Tardust", hauls_for=[band_fixture.m2m(2), band_fixture.m2m(4)])
+''', mtime + 1)
+            self.assertEqual(watcher.poll(), (['watched_fixtures'], 1, 2, 1))
+            self.assertEqual(sorted(Band.objects.values_list('pk', 'name')),
+                [(1, 'Bar Fighters'), (2, 'Brutallica!'), (4, 'Led Zeppelinn')])
+            self.assertEqual(sorted(Roadie.objects.get(pk=1).hauls_for.values_list('pk', flat=True)), [2, 4])
+            self.assertEqual(watcher.poll(), None)
+            # A broken edit changes nothing
+            self.write_module(path, 'band_fixture.add(5, name=)', mtime + 2)
+            self.assertRaises(SyntaxError, watcher.poll)
+            self.assertEqual(Band.objects.count(), 3)
+        finally:
+            sys.path.remove(directory)
+            sys.modules.pop('watched_fixtures', None)
+            shutil.rmtree(directory)
+
+
+class WatchOptionTests(TransactionTestCase):
+    """
+    A TestCase would turn the transaction management functions into no-ops.
+    """
+    def test_watch_selection(self):
+        from django.core.management.base import CommandError
+        from django.db import connection
+        self.assertRaises(CommandError, call_command, 'loaddata',
+            'other_fixtures:Band=5', watch=True, verbosity=0)
+        # Rejected before entering transaction management
+        self.assertEqual(connection.transaction_state, [])
+
+
 class DjangoLoaddataOutputParsingTests(TestCase):
     """
     The output of Django's ``loaddata`` command is parsed to add its reported
@@ -745,6 +1750,109 @@ class MultiDBTests(TestCase):
             self.assertEqual(Band.objects.using('alternate').get(name="Nuns N' Hoses").roadie_set.count(), 1)
             self.assertEqual(Band.objects.using('alternate').get(name='Led Dirigible').roadie_set.count(), 1)
 
+    def test_sharded_loading(self):
+        if self.do_tests:
+            band_fixture = Fixture(Band)
+            band_fixture.add(1, name="Nuns N' Hoses")
+            band_fixture.add(2, name='Led Dirigible')
+            band_fixture.add(3, name='Bar Fighters')
+            roadie_fixture = Fixture(Roadie)
+            roadie_fixture.add(1, name='Marshall Amp', hauls_for=[band_fixture.m2m(1), band_fixture.m2m(3)])
+            roadie_fixture.add(2, name='Tats Brimhat', hauls_for=[band_fixture.m2m(2)])
+            # The sequences of the tables written to are reset in each
+            # database
+            reset_models = {}
+            for alias in ('default', 'alternate'):
+                ops = connections[alias].ops
+                def recording_sequence_reset_sql(style, model_list, alias=alias, original=ops.sequence_reset_sql):
+                    reset_models[alias] = sorted([model.__name__ for model in model_list])
+                    return original(style, model_list)
+                ops.sequence_reset_sql = recording_sequence_reset_sql
+            try:
+                # Loaded serially, since other threads can't see the
+                # in-memory test databases
+                counts = load_sharded([roadie_fixture], shard_by_parity)
+            finally:
+                for alias in ('default', 'alternate'):
+                    del connections[alias].ops.sequence_reset_sql
+            self.assertEqual(reset_models, {'default': ['Band', 'Roadie'], 'alternate': ['Band', 'Roadie']})
+            self.assertEqual(counts, {'default': 3, 'alternate': 2})
+            self.assertEqual(sorted(Band.objects.values_list('pk', flat=True)), [1, 3])
+            self.assertEqual(list(Band.objects.using('alternate').values_list('pk', flat=True)), [2])
+            self.assertEqual(Roadie.objects.using('alternate').get().hauls_for.get().name, 'Led Dirigible')
+            # Relations across databases are rejected before writing anything
+            other_roadie_fixture = Fixture(Roadie)
+            other_roadie_fixture.add(4, name='Ciggy Tardust', hauls_for=[band_fixture.m2m(1)])
+            self.assertRaises(FixtureUsageError, load_sharded, [other_roadie_fixture], shard_by_parity)
+            self.assertRaises(FixtureUsageError, call_command, 'loaddata', 'other_fixtures',
+                shard='class_fixtures.tests.tests_loaddata.shard_by_parity')
+            self.assertEqual(Roadie.objects.count(), 1)
+            from django.core.management.base import CommandError
+            self.assertRaises(CommandError, call_command, 'loaddata', 'tests.json', shard='router')
+            self.assertRaises(CommandError, call_command, 'loaddata', 'other_fixtures', shard='router', upsert=True)
+
+
+def shard_by_parity(model, pk):
+    return 'default' if pk % 2 else 'alternate'
+
+
+class ConcurrentShardingTests(TransactionTestCase):
+    """
+    Loads into SQLite database files, which the threads of concurrent
+    sharded loading can all see, unlike the in-memory test databases.
+    """
+    def setUp(self):
+        import tempfile
+        from class_fixtures.utils.sharding import is_in_memory
+        self.directory = tempfile.mkdtemp()
+        self.aliases = ['shard_odd', 'shard_even', 'serial_odd', 'serial_even']
+        for alias in self.aliases:
+            connections.databases[alias] = {'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(self.directory, '%s.db' % alias), 'OPTIONS': {}}
+            call_command('syncdb', database=alias, interactive=False, verbosity=0,
+                load_initial_data=False)
+            self.assertFalse(is_in_memory(alias))
+        self.assertTrue(is_in_memory('default'))
+
+    def tearDown(self):
+        import shutil
+        for alias in self.aliases:
+            connections[alias].close()
+            cache = connections._connections
+            if isinstance(cache, dict):
+                cache.pop(alias, None)
+            elif hasattr(cache, alias):
+                delattr(cache, alias)
+            del connections.databases[alias]
+        shutil.rmtree(self.directory)
+
+    def test_concurrent_sharded_loading(self):
+        band_fixture = Fixture(Band)
+        band_fixture.add(1, name="Nuns N' Hoses")
+        band_fixture.add(2, name='Led Dirigible')
+        roadie_fixture = Fixture(Roadie)
+        roadie_fixture.add(1, name='Marshall Amp', hauls_for=[band_fixture.m2m(1)])
+        roadie_fixture.add(2, name='Tats Brimhat', hauls_for=[band_fixture.m2m(2)])
+        try:
+            from milkman.dairy import milkman
+            # Seeded random objects come out the same however the threads
+            # happen to run
+            band_fixture.add_random_range(3, 200, seed=1)
+        except ImportError:
+            pass
+        shard = lambda prefix: lambda model, pk: prefix + ('odd' if pk % 2 else 'even')
+        counts = load_sharded([roadie_fixture], shard('shard_'))
+        serial_counts = load_sharded([roadie_fixture], shard('serial_'), concurrent=False)
+        self.assertEqual((counts['shard_odd'], counts['shard_even']),
+            (serial_counts['serial_odd'], serial_counts['serial_even']))
+        self.assertEqual(Roadie.objects.using('shard_even').get().hauls_for.get().name, 'Led Dirigible')
+        self.assertEqual(Band.objects.using('shard_odd').get(pk=1).name, "Nuns N' Hoses")
+        for parity in ['odd', 'even']:
+            self.assertEqual(list(Band.objects.using('shard_' + parity).order_by('pk').values_list('pk', 'name')),
+                list(Band.objects.using('serial_' + parity).order_by('pk').values_list('pk', 'name')))
+        # Nothing ends up in the database of the test run itself
+        self.assertEqual(Band.objects.count(), 0)
+
 
 class MilkmanIntegrationTests(TestCase):
     """
@@ -814,6 +1922,66 @@ class MilkmanIntegrationTests(TestCase):
             # And that company should be connected to the employee
             self.assertTrue(Employee.objects.all()[0] in Company.objects.all()[0].employee_set.all())
 
+    def test_random_range(self):
+        if self.milkman_found:
+            company_fixture = Fixture(Company)
+            company_fixture.add(1, name='Macrohard')
+            employee_fixture = Fixture(Employee)
+            employee_fixture.add(1, name='Andy Depressant', company=company_fixture.fk(1))
+            employee_fixture.add_random_range(2, 1201, seed=42, company=company_fixture.fk(1),
+                manager=employee_fixture.fk(1), cog_in_the_machine=lambda pk: pk % 2 == 0)
+            employee_fixture.load()
+            self.assertEqual(Employee.objects.count(), 1201)
+            self.assertEqual(Employee.objects.filter(company__pk=1, manager__pk=1).count(), 1200)
+            self.assertEqual(Employee.objects.filter(cog_in_the_machine=True).count(), 600)
+            names = list(Employee.objects.exclude(pk=1).order_by('pk').values_list('name', flat=True))
+            self.assertEqual(len(set(names)), 1200)
+
+            # The same seed produces the same values on the next load
+            Employee.objects.exclude(pk=1).update(name='')
+            employee_fixture.load()
+            self.assertEqual(list(Employee.objects.exclude(pk=1).order_by('pk').values_list('name', flat=True)), names)
+
+    def test_random_range_m2m(self):
+        if self.milkman_found:
+            band_fixture = Fixture(Band)
+            band_fixture.add(1, name='Bar Fighters')
+            band_fixture.add(2, name='Brutallica')
+            roadie_fixture = Fixture(Roadie)
+            roadie_fixture.add_random_range(1, 10, hauls_for=[band_fixture.m2m(1), band_fixture.m2m(2)])
+            roadie_fixture.load()
+            self.assertEqual(Roadie.objects.count(), 10)
+            self.assertEqual(Band.objects.get(pk=1).roadie_set.count(), 10)
+            self.assertEqual(Roadie.objects.get(pk=10).hauls_for.count(), 2)
+
+            # Reloading only adds the relations that are missing
+            Roadie.objects.get(pk=3).hauls_for.remove(Band.objects.get(pk=2))
+            roadie_fixture.load()
+            self.assertEqual(Roadie.objects.count(), 10)
+            self.assertEqual(Roadie.hauls_for.through.objects.count(), 20)
+            self.assertEqual(Roadie.objects.get(pk=3).hauls_for.count(), 2)
+
+    def test_replicated_random_range(self):
+        if self.milkman_found:
+            band_fixture = Fixture(Band)
+            band_fixture.add(1, name="Nuns N' Hoses")
+            band_fixture.add_random_range(2, 3, seed=1)
+            roadie_fixture = Fixture(Roadie)
+            roadie_fixture.add(1, name='Marshall Amp', hauls_for=[band_fixture.m2m(1), band_fixture.m2m(3)])
+            replicate([roadie_fixture], 2, offset=100)[-1].load()
+            self.assertEqual(sorted(Roadie.objects.get(pk=201).hauls_for.values_list('pk', flat=True)), [201, 203])
+            self.assertEqual(sorted(Band.objects.values_list('pk', flat=True)), [101, 102, 103, 201, 202, 203])
+
+    def test_random_range_errors(self):
+        if self.milkman_found:
+            employee_fixture = Fixture(Employee)
+            # No value for the required company FK
+            self.assertRaises(FixtureUsageError, employee_fixture.add_random_range, 1, 10)
+            employee_fixture.add_random_range(1, 10, company=1)
+            self.assertRaises(FixtureUsageError, employee_fixture.add_random_range, 10, 20, company=1)
+            self.assertRaises(FixtureUsageError, employee_fixture.add, 5, name='Andy Depressant', company=1)
+            self.assertRaises(FixtureUsageError, employee_fixture.add_random_range, 30, 21, company=1)
+
 
 class ErrorConditionTests(TestCase):
     def test_adding_duplicate_pk(self):
@@ -844,6 +2012,14 @@ class ErrorConditionTests(TestCase):
         company_fixture.load()
         self.assertRaises(RelatedObjectError, employee_fixture.load)
 
+    def test_add_rows_errors(self):
+        band_fixture = Fixture(Band)
+        band_fixture.add(1, name="Nuns N' Hoses")
+        self.assertRaises(FixtureUsageError, band_fixture.add_rows, ('name',), ((1, 'Led Dirigible'),))
+        self.assertRaises(FixtureUsageError, band_fixture.add_rows, ('name',), ((2,),))
+        roadie_fixture = Fixture(Roadie)
+        self.assertRaises(FixtureUsageError, roadie_fixture.add_rows, ('hauls_for', 'name'), ((1, band_fixture.m2m(1), 'Marshall Amp'),))
+
     def test_non_iterable_m2m_definition(self):
         band_fixture = Fixture(Band)
         band_fixture.add(1, name="Nuns N' Hoses")
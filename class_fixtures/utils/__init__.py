@@ -1,10 +1,71 @@
+import os
 import sys
+import tempfile
 from contextlib import contextmanager
+from itertools import islice
 from StringIO import StringIO
 
+from class_fixtures.exceptions import FixtureUsageError
+
 @contextmanager
 def string_stdout():
     output = StringIO()
     sys.stdout = output
     yield output
     sys.stdout = sys.__stdout__
+
+def chunked(iterable, size):
+    """
+    Yields lists of at most ``size`` consecutive items from ``iterable``,
+    consuming it lazily.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def get_load_order(fixtures):
+    """
+    Returns a list of ``fixtures`` and all of their dependencies, each
+    included once, with the dependencies of each Fixture placed before it.
+    """
+    ordered = []
+    def visit(fixture):
+        if fixture in ordered:
+            return
+        for dep in fixture._dependencies:
+            visit(dep)
+        ordered.append(fixture)
+    for fixture in fixtures:
+        visit(fixture)
+    return ordered
+
+def check_owner(path):
+    """
+    Raises FixtureUsageError unless ``path`` belongs to the current user.
+    """
+    if os.stat(path).st_uid != os.getuid():
+        raise FixtureUsageError('%s belongs to another user, refusing to use '
+            'it.' % path)
+
+def private_temp_directory(name):
+    """
+    Returns the path of a directory of the current user's own in the
+    temporary directory of the system, named ``name`` followed by the user
+    ID, creating it accessible to that user only if needed. Raises
+    FixtureUsageError if an existing one belongs to another user or is
+    accessible to others, since they could plant or replace files in it.
+    """
+    directory = os.path.join(tempfile.gettempdir(), '%s_%d' % (name, os.getuid()))
+    try:
+        os.mkdir(directory, 0700)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+    check_owner(directory)
+    if os.stat(directory).st_mode & 0077:
+        raise FixtureUsageError('%s is accessible to other users, refusing to '
+            'use it.' % directory)
+    return directory
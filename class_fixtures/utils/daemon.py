@@ -0,0 +1,280 @@
+"""
+A long-lived process that keeps fixture modules imported and their load
+plans prepared for test processes, which talk to it over a Unix socket.
+"""
+import cPickle as pickle
+import os
+import socket
+import struct
+import sys
+import threading
+from SocketServer import StreamRequestHandler, UnixStreamServer
+
+from django.conf import settings
+
+from class_fixtures.exceptions import FixtureUsageError
+from class_fixtures.models import Fixture
+from class_fixtures.utils import check_owner, get_load_order, private_temp_directory
+from class_fixtures.utils.loaddata import (collect_class_fixtures,
+    file_mtime, reload_fixture_module, source_file)
+from class_fixtures.utils.provisioning import _provision_database, sqlite_settings
+
+# Every message is a pickle, preceded by its length
+_HEADER = struct.Struct('!Q')
+
+
+def default_socket_path():
+    """
+    The ``CLASS_FIXTURES_DAEMON_SOCKET`` setting, or a file in a directory of
+    the current user's own in the system's temporary directory.
+    """
+    return getattr(settings, 'CLASS_FIXTURES_DAEMON_SOCKET', None) or \
+        os.path.join(private_temp_directory('class_fixtures_daemon'), 'daemon.sock')
+
+
+def _send(sock, obj):
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+def _receive_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise EOFError('The connection was closed mid-message')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+def _receive(sock):
+    size, = _HEADER.unpack(_receive_exactly(sock, _HEADER.size))
+    return pickle.loads(_receive_exactly(sock, size))
+
+
+class PreparedPlan(object):
+    """
+    The pickled load order of the fixtures of some labels, and the fixture
+    modules they came from along with the modification times of their
+    source files when the plan was prepared.
+    """
+    def __init__(self, labels):
+        fixtures, serialized_labels = collect_class_fixtures(labels)
+        if serialized_labels:
+            raise FixtureUsageError('Serialized fixtures can\'t be served '
+                'by the fixture daemon: %s' % serialized_labels[0])
+        load_order = get_load_order(fixtures)
+        self.fixture_count = len(load_order)
+        try:
+            self.plan = pickle.dumps(load_order, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError), e:
+            raise FixtureUsageError('The fixtures could not be pickled for '
+                'the test processes: %s' % e)
+        self.modules = self._find_modules(load_order)
+        self.mtimes = dict([(source_file(m), file_mtime(source_file(m))) for m in self.modules])
+
+    def _find_modules(self, load_order):
+        """
+        Returns the modules that contain any of the fixtures of the plan and
+        live in the same directories as the modules the fixtures were found
+        in, i.e. the fixture packages involved, so that modules a fixture is
+        merely imported into (like test modules) aren't included. They're
+        ordered so that the modules of the dependencies come first.
+        """
+        positions = dict([(id(fixture), i) for i, fixture in enumerate(load_order)])
+        directories = set()
+        for fixture in load_order:
+            if fixture.label and '.' in fixture.label:
+                module = sys.modules.get(fixture.label.rsplit('.', 1)[0])
+                if source_file(module):
+                    directories.add(os.path.dirname(source_file(module)))
+        modules = []
+        for module in sys.modules.values():
+            filename = source_file(module)
+            if not filename or os.path.dirname(filename) not in directories:
+                continue
+            found = [positions[id(value)] for value in vars(module).values()
+                if isinstance(value, Fixture) and id(value) in positions]
+            if found:
+                modules.append((max(found), module))
+        modules.sort(key=lambda item: item[0])
+        return [module for position, module in modules]
+
+    def is_stale(self):
+        for filename, mtime in self.mtimes.items():
+            if file_mtime(filename) != mtime:
+                return True
+        return False
+
+    def reload_modules(self):
+        """
+        Reloads the modules of the plan, dependencies first, so that the
+        modules importing fixtures from other modules get the new ones.
+        """
+        for module in self.modules:
+            reload_fixture_module(module)
+
+
+class FixtureDaemon(object):
+    """
+    Serves the load plans of fixture labels over the Unix socket at
+    ``socket_path``, preparing each plan on the first request for it and
+    preparing it again, after reloading its fixture modules, once any of
+    their source files has changed.
+
+    The requests are handled one at a time, so there's no need to worry
+    about reloading modules while they're used by another request.
+    """
+    def __init__(self, socket_path=None, stdout=None, verbosity=1):
+        self.socket_path = socket_path or default_socket_path()
+        self.stdout = stdout
+        self.verbosity = verbosity
+        self.plans = {}
+        self.server = None
+
+    def log(self, message, level=1):
+        if self.stdout is not None and self.verbosity >= level:
+            self.stdout.write(message + '\n')
+
+    def get_plan(self, labels):
+        """
+        Returns the ``PreparedPlan`` for ``labels``, preparing it if needed.
+        """
+        labels = tuple(labels)
+        prepared = self.plans.get(labels)
+        if prepared is not None and prepared.is_stale():
+            self.log('Fixture modules changed, preparing %s again' % ', '.join(labels))
+            del self.plans[labels]
+            prepared.reload_modules()
+            prepared = None
+        if prepared is None:
+            prepared = self.plans[labels] = PreparedPlan(labels)
+            self.log('Prepared %d fixture(s) for %s' % (prepared.fixture_count, ', '.join(labels)), 2)
+        return prepared
+
+    def handle(self, request):
+        """
+        Carries out a request, a tuple of an action and its arguments:
+
+        - ``('plan', labels)`` returns the pickled load order for the labels
+        - ``('database', labels, path, create_schema)`` loads the fixtures
+          into the SQLite database file at ``path`` and returns the number
+          of objects loaded
+        """
+        action, args = request[0], request[1:]
+        if action == 'plan':
+            return self.get_plan(*args).plan
+        elif action == 'database':
+            labels, path, create_schema = args
+            return _provision_database((self.get_plan(labels).plan,
+                sqlite_settings(), path, create_schema))
+        raise FixtureUsageError('Unknown fixture daemon request: %r' % (action,))
+
+    def bind(self):
+        if os.path.exists(self.socket_path):
+            # Plans are unpickled, so a socket bound by anyone else could
+            # run code in the test processes.
+            check_owner(self.socket_path)
+            # Left behind by a daemon that didn't exit cleanly, unless one
+            # is still listening on it
+            try:
+                probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                probe.connect(self.socket_path)
+            except socket.error:
+                os.unlink(self.socket_path)
+            else:
+                probe.close()
+                raise FixtureUsageError('A fixture daemon is already listening on %s' % self.socket_path)
+        daemon = self
+
+        class RequestHandler(StreamRequestHandler):
+            def handle(self):
+                try:
+                    request = _receive(self.connection)
+                except (EOFError, pickle.UnpicklingError, struct.error):
+                    return
+                try:
+                    response = ('ok', daemon.handle(request))
+                except Exception, e:
+                    daemon.log('%s: %s' % (e.__class__.__name__, e))
+                    response = ('error', '%s: %s' % (e.__class__.__name__, e))
+                _send(self.connection, response)
+
+        # Requests are unpickled, so only the user running the daemon may
+        # connect to it.
+        old_umask = os.umask(0177)
+        try:
+            self.server = UnixStreamServer(self.socket_path, RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def serve_forever(self):
+        if self.server is None:
+            self.bind()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def start(self):
+        """
+        Serves requests in a daemon thread and returns the thread.
+        """
+        self.bind()
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def shutdown(self):
+        """
+        Stops ``serve_forever`` running in another thread.
+        """
+        self.server.shutdown()
+
+    def close(self):
+        if self.server is not None:
+            self.server.server_close()
+            self.server = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+def _request(request, socket_path):
+    socket_path = socket_path or default_socket_path()
+    try:
+        check_owner(socket_path)
+    except OSError, e:
+        raise FixtureUsageError('Could not connect to the fixture daemon '
+            'at %s: %s' % (socket_path, e))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socket_path)
+        except socket.error, e:
+            raise FixtureUsageError('Could not connect to the fixture daemon '
+                'at %s: %s' % (socket_path, e))
+        _send(sock, request)
+        status, value = _receive(sock)
+    finally:
+        sock.close()
+    if status != 'ok':
+        raise FixtureUsageError('The fixture daemon failed: %s' % value)
+    return value
+
+
+def request_plan(labels, socket_path=None):
+    """
+    Asks the fixture daemon for the fixtures of ``labels`` and returns them,
+    with their dependencies, in the order they're to be loaded in. See
+    ``load_plan`` in ``class_fixtures.utils.provisioning``.
+    """
+    return pickle.loads(_request(('plan', list(labels)), socket_path))
+
+
+def request_database(labels, path, socket_path=None, create_schema=True):
+    """
+    Asks the fixture daemon to load the fixtures of ``labels`` into the
+    SQLite database file at ``path``, creating its tables first with
+    ``create_schema``. Returns the number of objects loaded.
+    """
+    return _request(('database', list(labels), path, create_schema), socket_path)
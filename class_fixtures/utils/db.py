@@ -0,0 +1,341 @@
+"""Database utility methods for batched fixture writes"""
+import re
+
+from django.core.management.color import no_style
+from django.db import connections, models, router
+from django.db.models import Q
+
+from class_fixtures.utils import chunked, get_load_order
+
+# The default limit on the number of parameters of an SQLite statement is
+# 999, leave some room for the rest of the statement
+SQLITE_MAX_PARAMS = 900
+
+
+def bulk_insert(model, objects, using=None):
+    """
+    INSERTs ``objects`` of ``model`` into the database in as few queries as
+    possible, bypassing custom save methods and signals. The primary keys
+    of the objects must not exist in the table yet.
+
+    Falls back to forced-insert saves of individual objects where
+    ``QuerySet.bulk_create`` can't be used: on Django versions older than
+    1.4 and for models with multi-table inheritance.
+    """
+    if not objects:
+        return
+    manager = model._default_manager.db_manager(using)
+    if hasattr(manager, 'bulk_create') and not model._meta.parents:
+        manager.bulk_create(objects)
+    else:
+        for obj in objects:
+            models.Model.save_base(obj, using=using, raw=_raw_save_possible(model), force_insert=True)
+
+
+def _raw_save_possible(model):
+    # Raw saves skip the parent tables of multi-table inherited models
+    return not model._meta.parents
+
+
+def save_batch(model, objects, using=None):
+    """
+    Writes ``objects`` of ``model`` into the database the way Django's
+    ``loaddata`` would, overwriting any existing objects with the same
+    primary keys. The existing primary keys are looked up with one query,
+    after which the new objects are written with ``bulk_insert`` and the
+    existing ones updated with individual saves that bypass custom save
+    methods.
+
+    Returns the set of primary keys that already existed.
+    """
+    if not objects:
+        return set()
+    manager = model._default_manager.db_manager(using)
+    existing = set(manager.filter(pk__in=[obj.pk for obj in objects]).values_list('pk', flat=True))
+    new_objects = []
+    for obj in objects:
+        if obj.pk in existing:
+            models.Model.save_base(obj, using=using, raw=_raw_save_possible(model))
+        else:
+            new_objects.append(obj)
+    bulk_insert(model, new_objects, using=using)
+    return existing
+
+
+def delete_objects(model, pks, using=None):
+    """
+    DELETEs the objects of ``model`` with primary keys ``pks`` directly in
+    SQL, a chunk of primary keys at a time, without sending signals or
+    collecting related objects. The rows of automatically created M2M
+    intermediary tables pointing to the objects are deleted as well, as are
+    the parent rows of multi-table inherited objects.
+    """
+    for pks in chunked(pks, 500):
+        for deleted in [model] + list(model._meta.get_parent_list()):
+            for through, fieldname in get_auto_through_tables(deleted):
+                raw_delete(through._default_manager.db_manager(using).filter(**{'%s__in' % fieldname: pks}), using)
+            raw_delete(deleted._default_manager.db_manager(using).filter(pk__in=pks), using)
+
+
+def delete_objects_except(model, pks, using=None):
+    """
+    Like ``delete_objects``, but deletes the objects of ``model`` whose
+    primary keys are *not* in ``pks``, with one set-based DELETE per table
+    instead of fetching the primary keys of the table. Runs of consecutive
+    integer primary keys are matched as ranges to keep the statements short.
+
+    SQLite limits the number of parameters of a statement, so if the
+    primary keys don't fit, the existing ones are fetched and compared after
+    all, and the stale ones deleted with ``delete_objects``.
+    """
+    using = using or router.db_for_write(model)
+    condition, param_count = _pk_set_condition(pks)
+    manager = model._default_manager.db_manager(using)
+    if connections[using].vendor == 'sqlite' and param_count > SQLITE_MAX_PARAMS:
+        pks = set(pks)
+        delete_objects(model, [pk for pk in manager.values_list('pk', flat=True) if pk not in pks], using=using)
+        return
+    stale = manager.exclude(condition) if condition is not None else manager.all()
+    stale_pks = stale.values('pk')
+    # The rows referring to the stale objects go first, while the subquery
+    # can still find them.
+    for deleted in [model] + list(model._meta.get_parent_list()):
+        for through, fieldname in get_auto_through_tables(deleted):
+            raw_delete(through._default_manager.db_manager(using).filter(**{'%s__in' % fieldname: stale_pks}), using)
+    for parent in model._meta.get_parent_list():
+        raw_delete(parent._default_manager.db_manager(using).filter(pk__in=stale_pks), using)
+    raw_delete(stale, using)
+
+
+def _pk_set_condition(pks):
+    """
+    Returns a ``(Q object, number of parameters)`` tuple matching the
+    primary keys ``pks``, or ``(None, 0)`` if there are none.
+    """
+    pks = sorted(set(pks))
+    if not pks:
+        return None, 0
+    if not all([isinstance(pk, (int, long)) for pk in pks]):
+        return Q(pk__in=pks), len(pks)
+    singles = []
+    condition = Q()
+    param_count = 0
+    start = previous = pks[0]
+    for pk in pks[1:] + [None]:
+        if pk is not None and pk == previous + 1:
+            previous = pk
+            continue
+        if previous - start >= 2:
+            condition |= Q(pk__range=(start, previous))
+            param_count += 2
+        else:
+            singles.extend(range(start, previous + 1))
+        if pk is not None:
+            start = previous = pk
+    if singles:
+        condition |= Q(pk__in=singles)
+        param_count += len(singles)
+    return condition, param_count
+
+
+def delete_all_objects(model, using=None):
+    """
+    Like ``delete_objects``, but empties the table of ``model`` and the
+    related M2M intermediary tables altogether. Parent tables are left
+    alone.
+    """
+    for through, fieldname in get_auto_through_tables(model):
+        raw_delete(through._default_manager.db_manager(using).all(), using)
+    raw_delete(model._default_manager.db_manager(using).all(), using)
+
+
+def unload_fixtures(fixtures, using=None):
+    """
+    Deletes the objects of ``fixtures`` and all of their dependencies with
+    ``delete_objects``, one model at a time in reverse dependency order.
+    """
+    # Models in load order
+    unloaded = []
+    # Models as keys, sets of primary keys as values
+    pks_by_model = {}
+    for fixture in get_load_order(fixtures):
+        model = fixture.model
+        if model not in pks_by_model:
+            unloaded.append(model)
+            pks_by_model[model] = set()
+        pks_by_model[model].update([model._meta.pk.to_python(pk) for pk in fixture.iter_pks()])
+    for model in reversed(unloaded):
+        if router.allow_syncdb(using, model):
+            delete_objects(model, list(pks_by_model[model]), using=using)
+
+
+def get_auto_through_tables(model):
+    """
+    Returns ``(through_model, fieldname)`` tuples for the automatically
+    created M2M intermediary models with a foreign key named ``fieldname``
+    pointing to ``model``.
+    """
+    through_tables = []
+    for field in model._meta.many_to_many:
+        if field.rel.through._meta.auto_created:
+            through_tables.append((field.rel.through, field.m2m_field_name()))
+    for related in model._meta.get_all_related_many_to_many_objects():
+        if related.field.rel.through._meta.auto_created:
+            through_tables.append((related.field.rel.through, related.field.m2m_reverse_field_name()))
+    return through_tables
+
+
+def raw_delete(queryset, using=None):
+    if hasattr(queryset, '_raw_delete'):
+        queryset._raw_delete(using or router.db_for_write(queryset.model))
+    else:
+        # Older Django versions
+        queryset.delete()
+
+
+class FastLoadProfile(object):
+    """
+    Switches a database connection into a mode better suited for loading
+    lots of data for the duration of a ``loaddata`` transaction:
+
+    * On PostgreSQL, all deferrable constraints are deferred until the end
+      of the transaction.
+    * On SQLite, foreign key enforcement is turned off, ``synchronous`` is
+      set to ``OFF`` and the rollback journal is kept in memory.
+
+    Other backends are left as they are. Call ``check`` before committing to
+    verify that the loaded data doesn't violate foreign key constraints,
+    ``renew`` after any intermediate commits, and ``restore`` after the
+    final commit or rollback to return the connection to its previous
+    settings.
+
+    Changing the SQLite settings commits any open transaction, so ``enable``
+    must be called before writing anything and ``restore`` after the
+    transaction has ended.
+    """
+    SQLITE_PRAGMAS = (
+        ('foreign_keys', 'OFF'),
+        ('synchronous', 'OFF'),
+        ('journal_mode', 'MEMORY'),
+    )
+
+    def __init__(self, connection):
+        self.connection = connection
+        # (pragma, previous value) tuples
+        self._previous_pragmas = []
+
+    def enable(self):
+        cursor = self.connection.cursor()
+        if self.connection.vendor == 'postgresql':
+            cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+        elif self.connection.vendor == 'sqlite':
+            for pragma, value in self.SQLITE_PRAGMAS:
+                cursor.execute('PRAGMA %s' % pragma)
+                self._previous_pragmas.append((pragma, cursor.fetchone()[0]))
+                cursor.execute('PRAGMA %s = %s' % (pragma, value))
+
+    def check(self, table_names=None):
+        """
+        Raises IntegrityError if the data in the tables named
+        ``table_names``, or in the whole database by default, violates
+        foreign key constraints.
+        """
+        if hasattr(self.connection, 'check_constraints'):
+            # On PostgreSQL, this makes the deferred constraints immediate
+            # for a moment, on SQLite it looks for dangling foreign keys.
+            self.connection.check_constraints(table_names=table_names)
+
+    def renew(self):
+        """
+        Reapplies the settings that only last until the end of a
+        transaction, after an intermediate commit.
+        """
+        if self.connection.vendor == 'postgresql':
+            self.connection.cursor().execute('SET CONSTRAINTS ALL DEFERRED')
+
+    def restore(self):
+        cursor = self.connection.cursor()
+        while self._previous_pragmas:
+            pragma, value = self._previous_pragmas.pop()
+            cursor.execute('PRAGMA %s = %s' % (pragma, value))
+
+
+class DeferredIndexes(object):
+    """
+    Drops the non-unique secondary indexes of ``models`` (those created for
+    ``db_index`` fields, foreign keys and ``Meta.index_together``, plus
+    those of automatically created M2M intermediary tables) so that they can
+    be rebuilt in one go after the data has been loaded.
+
+    The indexes are found from the same ``CREATE INDEX`` statements that
+    ``syncdb`` runs, which are also used to recreate them.
+
+    On some backends, DDL statements commit the open transaction: MySQL and
+    Oracle commit implicitly around them, and with SQLite, Python 2's sqlite3
+    module commits before any statement other than INSERT, UPDATE, DELETE
+    and REPLACE, even though SQLite itself could run them in a transaction.
+    There (``commits_implicitly``), the dropped indexes don't come back with
+    a rollback, so call ``restore`` after rolling back, and ``rebuild`` only
+    after committing the loaded objects, or their transaction gets committed
+    by the first CREATE INDEX and a later failure can't roll it back.
+    Elsewhere, the drops are only permanent once the transaction they were
+    made in has been committed, so call ``transaction_committed`` after any
+    intermediate commits for ``restore`` to know.
+    """
+    create_index_re = re.compile(r'^CREATE INDEX (\S+) ON (\S+)')
+
+    def __init__(self, connection, models):
+        self.connection = connection
+        # (DROP INDEX, CREATE INDEX) statement tuples
+        self.statements = []
+        style = no_style()
+        seen = set()
+        for model in models:
+            for indexed in [model] + [through for through, fieldname in get_auto_through_tables(model)]:
+                if indexed in seen:
+                    continue
+                seen.add(indexed)
+                for create_sql in connection.creation.sql_indexes_for_model(indexed, style):
+                    match = self.create_index_re.match(create_sql)
+                    if match is None:
+                        continue
+                    if connection.vendor == 'mysql':
+                        drop_sql = 'DROP INDEX %s ON %s;' % match.groups()
+                    else:
+                        drop_sql = 'DROP INDEX %s;' % match.group(1)
+                    self.statements.append((drop_sql, create_sql))
+        self.dropped = False
+        self.commits_implicitly = connection.vendor in ('sqlite', 'mysql', 'oracle')
+        # Whether a rollback would no longer bring the dropped indexes back
+        self.drop_committed = False
+
+    def drop(self):
+        cursor = self.connection.cursor()
+        for drop_sql, create_sql in self.statements:
+            cursor.execute(drop_sql)
+        self.dropped = True
+        self.drop_committed = self.commits_implicitly
+
+    def transaction_committed(self):
+        """
+        Records that the transaction the indexes were dropped in has been
+        committed.
+        """
+        if self.dropped:
+            self.drop_committed = True
+
+    def rebuild(self):
+        cursor = self.connection.cursor()
+        for drop_sql, create_sql in self.statements:
+            cursor.execute(create_sql)
+        self.dropped = False
+
+    def restore(self):
+        """
+        Recreates the dropped indexes after a rollback, if the rollback
+        didn't already bring them back.
+        """
+        if self.dropped and self.drop_committed:
+            self.rebuild()
+        self.dropped = False
+        self.drop_committed = False
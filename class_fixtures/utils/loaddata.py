@@ -1,17 +1,25 @@
 """Utility methods for the overridden loaddata command"""
+import hashlib
+import imp
+import os
 import re
+import tempfile
 import types
 from collections import Iterable
+from pkgutil import walk_packages
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.core.serializers import get_public_serializer_formats
+from django.db import router, transaction
 from django.db.models.loading import get_apps
 from django.utils.importlib import import_module
 from django.utils.module_loading import module_has_submodule
 
 from class_fixtures.exceptions import FixtureUsageError
 from class_fixtures.models import Fixture
+from class_fixtures.utils import get_load_order, private_temp_directory
+from class_fixtures.utils.db import delete_all_objects, delete_objects_except
 
 
 def associate_handlers(fixture_labels):
@@ -27,11 +35,12 @@ def associate_handlers(fixture_labels):
             (fixture_module, 'class_fixtures', 'module', None)
             ('appname.fixturemodule', 'class_fixtures', 'submodule_name', submodule_reference)
             ('appname', 'class_fixtures', 'app_label', fixtures_package_reference)
+            ('appname.fixturemodule:Model=1,2', 'class_fixtures', 'selection', (...))
         ]
 
     ``type`` is None for Django fixtures, or one of the following identified
     label types for class-based fixtures: 'instance', 'module', 'app_label',
-    'submodule_name'
+    'submodule_name', 'selection'
 
     ``obj`` is None for Django fixtures, or one of the following for class-
     based fixtures:
@@ -39,6 +48,10 @@ def associate_handlers(fixture_labels):
       - a reference to the ``someapp.fixtures`` package itself
       - None where the instance or module reference is itself the ``label``
         item of the tuple and no further resolving was necessary
+      - for selections of objects with labels like
+        "appname.fixturemodule:Model=1,2", a ``(type, obj, label,
+        model_name, pks)`` tuple, where the first three items describe
+        "appname.fixturemodule" as above
 
     """
     handlers = []
@@ -49,6 +62,8 @@ def associate_handlers(fixture_labels):
             handlers.append((label, 'class_fixtures', 'instance', None))
         elif type(label) == types.ModuleType:
             handlers.append((label, 'class_fixtures', 'module', None))
+        elif isinstance(label, basestring) and ':' in label:
+            handlers.extend(associate_selection_handlers(label))
         elif isinstance(label, basestring):
             label_components = label.split('.')
             # 'some.fixture.json' or "another_fixture.xml" etc.
@@ -141,6 +156,102 @@ def associate_handlers(fixture_labels):
     return handlers
 
 
+def associate_selection_handlers(label):
+    """
+    Returns the handler tuples for a label selecting some of the objects
+    of the fixtures in a module, like "appname.fixturemodule:Model=1,2".
+    See ``associate_handlers``.
+    """
+    module_label, selection = label.split(':', 1)
+    try:
+        model_name, pk_list = selection.split('=', 1)
+    except ValueError:
+        raise FixtureUsageError('Invalid fixture label "%s", selections of '
+            'objects look like "fixturemodule:Model=1,2"' % label)
+    pks = [pk.strip() for pk in pk_list.split(',') if pk.strip()]
+    if not model_name or not pks:
+        raise FixtureUsageError('Invalid fixture label "%s", selections of '
+            'objects look like "fixturemodule:Model=1,2"' % label)
+    handlers = []
+    for module_label, handler, type_, obj in associate_handlers([module_label]):
+        if handler == 'class_fixtures':
+            handlers.append((label, handler, 'selection', (type_, obj, module_label, model_name, pks)))
+    if not handlers:
+        raise FixtureUsageError('No fixture modules found for "%s"' % label)
+    return handlers
+
+def get_class_fixtures(label, type_, obj):
+    """
+    Returns a list of the ``Fixture`` instances referred to by a ``(label,
+    handler, type, obj)`` tuple from ``associate_handlers`` that is to be
+    handled by django-class-fixtures.
+    """
+    if type_ == 'instance':
+        return [label]
+    elif type_ == 'module':
+        return get_fixtures_from_module(label)
+    elif type_ == 'submodule_name':
+        # obj is a reference to an individual submodule of the fixtures
+        # package of some app.
+        return get_fixtures_from_module(obj)
+    elif type_ == 'app_label':
+        # obj is a reference to the fixtures package of the app named in
+        # the label. Load all the fixture modules contained within,
+        # excluding initial_data.
+        fixtures = []
+        for importer, module_name, is_pkg in walk_packages(obj.__path__):
+            if module_name == 'initial_data':
+                continue
+            submodule = importer.find_module(module_name).load_module(module_name)
+            submod_fixtures = get_fixtures_from_module(submodule)
+            for submod_fixture in submod_fixtures:
+                # In case the user has a deeper submodule hierarchy in place
+                # with fixtures imported from submodule to submodule, make
+                # sure no fixture is included in the list twice through
+                # submodule discovery.
+                if submod_fixture not in fixtures:
+                    fixtures.append(submod_fixture)
+        return fixtures
+    elif type_ == 'selection':
+        # Only the fixtures for the selected model. Fixture.load(pks=...)
+        # takes care of loading only the selected objects.
+        base_type, base_obj, base_label, model_name, pks = obj
+        fixtures = [fixture for fixture in get_class_fixtures(base_label, base_type, base_obj)
+            if fixture.model._meta.object_name.lower() == model_name.lower()]
+        if not fixtures:
+            raise FixtureUsageError('No fixtures for a model named "%s" in "%s"' % (model_name, base_label))
+        to_python = fixtures[0].model._meta.pk.to_python
+        defined = set()
+        for fixture in fixtures:
+            defined.update([to_python(pk) for pk in fixture.iter_pks()])
+        for pk in pks:
+            if to_python(pk) not in defined:
+                raise FixtureUsageError('No %s object with primary key %s in "%s"' % (
+                    fixtures[0].model._meta.object_name, pk, base_label))
+        return fixtures
+    elif type_ is None and label == 'initial_data':
+        return gather_initial_data_fixtures()
+    return []
+
+def collect_class_fixtures(fixture_labels):
+    """
+    Returns a ``(fixtures, serialized_labels)`` tuple: the ``Fixture``
+    instances that ``fixture_labels`` refer to, each of them once, and the
+    labels that only Django's loaddata would find anything for.
+    """
+    fixture_handlers = associate_handlers(fixture_labels)
+    class_labels = [h[0] for h in fixture_handlers if h[1] == 'class_fixtures']
+    fixtures = []
+    serialized_labels = []
+    for label, handler, type_, obj in fixture_handlers:
+        if handler == 'class_fixtures':
+            for fixture in get_class_fixtures(label, type_, obj):
+                if fixture not in fixtures:
+                    fixtures.append(fixture)
+        elif label not in class_labels:
+            serialized_labels.append(label)
+    return fixtures, serialized_labels
+
 def gather_initial_data_fixtures(using=None):
     """
     Iterate through the ``fixtures`` package of all installed apps and any
@@ -188,15 +299,52 @@ def check_fixture_packages_setting():
 def get_fixtures_from_module(module):
     """
     Returns a list of all the ``Fixture`` instances contained in ``module``.
+
+    Fixtures without a ``label`` get one from the module and attribute name
+    they were first found under.
     """
     fixture_list = []
     module_attrs = dir(module)
     for attr_name in module_attrs:
         attribute = getattr(module, attr_name)
         if isinstance(attribute, Fixture):
+            if attribute.label is None:
+                attribute.label = '%s.%s' % (module.__name__, attr_name)
             fixture_list.append(attribute)
     return fixture_list
 
+def source_file(module):
+    """
+    Returns the path of the source file of ``module`` rather than that of
+    its compiled version, or None for modules without a file.
+    """
+    filename = getattr(module, '__file__', None)
+    if filename and filename[-4:] in ('.pyc', '.pyo') and os.path.exists(filename[:-1]):
+        return filename[:-1]
+    return filename
+
+def file_mtime(filename):
+    """
+    Returns the modification time of ``filename``, or None if it's gone.
+    """
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
+
+def reload_fixture_module(module):
+    """
+    Executes the source of a fixture module again, like ``reload``. The
+    modules of a fixtures package discovered through an app label are
+    imported under their bare names, which ``reload`` can't find, so those
+    are loaded from their source files instead.
+    """
+    filename = source_file(module)
+    if '.' not in module.__name__ and \
+            os.path.exists(os.path.join(os.path.dirname(filename), '__init__.py')):
+        return imp.load_source(module.__name__, filename)
+    return reload(module)
+
 
 def process_django_output(output):
     """
@@ -225,3 +373,176 @@ def process_django_output(output):
     total_counts = [sum(z) for z in zip(*[(int(tup[0]), int(tup[1])) for tup in counts])] or [0, 0]
 
     return (total_counts[0], total_counts[1], other_msgs)
+
+def delete_replaced_objects(fixtures, using=None, stale_only=False):
+    """
+    Deletes the existing objects of the models of ``fixtures`` and their
+    dependencies, in reverse dependency order, before the fixtures get
+    loaded. With ``stale_only``, only the objects whose primary keys are not
+    in any of the fixtures are deleted, otherwise all of them are.
+
+    Deletes are done directly in SQL with one set-based statement per table,
+    without sending signals or collecting related objects, along with the
+    rows of any automatically created M2M intermediary tables pointing to
+    the deleted objects.
+
+    Returns the list of models whose tables were emptied.
+    """
+    models = []
+    # Models as keys, sets of primary keys in the fixtures as values
+    fixture_pks = {}
+    for fixture in get_load_order(fixtures):
+        model = fixture.model
+        if model not in models:
+            models.append(model)
+            fixture_pks.setdefault(model, set())
+        if stale_only:
+            pks = [model._meta.pk.to_python(pk) for pk in fixture.iter_pks()]
+            fixture_pks[model].update(pks)
+            # The parent rows of multi-table inherited objects aren't stale
+            # either.
+            for parent in model._meta.get_parent_list():
+                fixture_pks.setdefault(parent, set()).update(pks)
+
+    emptied = []
+    for model in reversed(models):
+        if not router.allow_syncdb(using, model):
+            continue
+        if stale_only:
+            delete_objects_except(model, fixture_pks[model], using=using)
+        else:
+            delete_all_objects(model, using=using)
+            emptied.append(model)
+    return emptied
+
+
+class ChunkedCommits(object):
+    """
+    Commits the transaction of a ``loaddata`` run as the load goes, keeping
+    track of how far it has got. With ``every`` set to a number, a commit is
+    made as soon as that many objects have been written since the previous
+    one. With ``every`` set to "fixture", one is made after each fixture.
+
+    ``objects_written`` is meant to be given to ``Fixture.load`` as its
+    ``on_batch`` callback, and ``fixture_done`` called after each fixture has
+    been loaded completely. ``before_commit`` and ``after_commit`` are
+    optional callables run around each commit. If a ``LoadCheckpoint`` is
+    given, the steps of the fixtures are recorded in it as they get
+    committed.
+    """
+    def __init__(self, using, every, before_commit=None, after_commit=None,
+            checkpoint=None):
+        self.using = using
+        self.every = every
+        self.before_commit = before_commit
+        self.after_commit = after_commit
+        self.checkpoint = checkpoint
+        self.uncommitted_objects = 0
+        # (label, step) tuples of the fixtures loaded completely since the
+        # last commit
+        self.uncommitted_fixtures = []
+        self.committed_objects = 0
+        self.committed_fixtures = 0
+        # Label of the last fixture that was committed completely
+        self.last_committed = None
+
+    def objects_written(self, count):
+        self.uncommitted_objects += count
+        if self.every != 'fixture' and self.uncommitted_objects >= self.every:
+            self.commit()
+
+    def fixture_done(self, label, step=None):
+        self.uncommitted_fixtures.append((label, step))
+        if self.every == 'fixture':
+            self.commit()
+
+    def commit(self):
+        if self.before_commit is not None:
+            self.before_commit()
+        transaction.commit(using=self.using)
+        self.committed_objects += self.uncommitted_objects
+        self.uncommitted_objects = 0
+        if self.uncommitted_fixtures:
+            self.committed_fixtures += len(self.uncommitted_fixtures)
+            self.last_committed, step = self.uncommitted_fixtures[-1]
+            self.uncommitted_fixtures = []
+            if self.checkpoint is not None and step is not None:
+                self.checkpoint.record(step)
+        if self.after_commit is not None:
+            self.after_commit()
+
+    def progress(self):
+        """
+        Describes what has been committed so far, for telling the operator
+        what is left in the database after a failure.
+        """
+        if not self.committed_objects and not self.committed_fixtures:
+            return 'Nothing was committed.'
+        msg = 'Committed %d object(s) and %d complete fixture(s)' % (
+            self.committed_objects, self.committed_fixtures)
+        if self.last_committed is not None:
+            msg += ', up to and including %s' % self.last_committed
+        return msg + '.'
+
+
+class LoadCheckpoint(object):
+    """
+    Keeps track of how many steps of a ``loaddata`` plan have been committed,
+    in a file named after a hash of the plan, so that a failed load can be
+    resumed from the step that failed by running the same command again.
+
+    ``steps`` is a list of strings identifying the steps of the plan, that
+    is, the Django fixture labels and class-based fixtures to be loaded, in
+    order. The contents of the fixtures aren't part of the hash, so that
+    fixing the fixture that failed doesn't start the load over.
+
+    The files are kept in ``directory``, which defaults to the
+    ``CLASS_FIXTURES_CHECKPOINT_DIR`` setting or a directory of the current
+    user's own in the temporary directory of the system, since anyone who
+    can write checkpoints can make a run skip fixtures.
+    """
+    def __init__(self, steps, using, directory=None):
+        if directory is None:
+            directory = getattr(settings, 'CLASS_FIXTURES_CHECKPOINT_DIR', None) or \
+                private_temp_directory('class_fixtures_checkpoints')
+        plan_hash = hashlib.sha1(repr((using, list(steps)))).hexdigest()
+        self.path = os.path.join(directory, 'class_fixtures_%s.checkpoint' % plan_hash)
+        # The number of leading steps that have been committed
+        self.completed = self._read()
+
+    def _read(self):
+        try:
+            f = open(self.path)
+        except IOError:
+            return 0
+        try:
+            return int(f.read().strip() or 0)
+        except ValueError:
+            return 0
+        finally:
+            f.close()
+
+    def is_done(self, step):
+        return step < self.completed
+
+    def record(self, step):
+        """
+        Records the steps up to and including ``step`` as committed.
+        """
+        self.completed = max(self.completed, step + 1)
+        # Write and rename, so that a crash never leaves a truncated file.
+        # mkstemp won't follow a symlink planted in place of the file.
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp',
+            prefix=os.path.basename(self.path) + '.', dir=os.path.dirname(self.path))
+        f = os.fdopen(fd, 'w')
+        try:
+            f.write('%d\n' % self.completed)
+        finally:
+            f.close()
+        os.rename(temp_path, self.path)
+
+    def clear(self):
+        """Removes the checkpoint file once the whole plan has been loaded."""
+        self.completed = 0
+        if os.path.exists(self.path):
+            os.remove(self.path)
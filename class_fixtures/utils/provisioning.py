@@ -0,0 +1,113 @@
+"""Loading the same fixtures into many SQLite databases in parallel"""
+import cPickle as pickle
+import multiprocessing
+
+from django.core.management import call_command
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+
+from class_fixtures.exceptions import FixtureUsageError
+from class_fixtures.models import FixtureLoader
+from class_fixtures.utils import get_load_order
+
+# The alias under which each worker process connects to its database file
+WORKER_DB_ALIAS = 'class_fixtures_worker'
+
+
+def provision_sqlite_databases(fixtures, paths, processes=None, create_schema=True):
+    """
+    Loads ``fixtures`` and their dependencies into each of the SQLite
+    database files in ``paths``, e.g. one per test runner process, using a
+    ``multiprocessing`` pool of ``processes`` worker processes (one per
+    database file, up to the number of CPUs, by default). Since every
+    database file has a writer of its own, provisioning several takes about
+    as long as loading one, given enough CPUs.
+
+    The fixtures are pickled once and unpickled in the workers, so any
+    callables they contain (``LazyFixture`` sources, the factories of
+    ``add_random_range`` calls) must be picklable, i.e. module-level
+    functions rather than lambdas or nested functions.
+
+    With ``create_schema``, the tables are created with ``syncdb`` first,
+    without loading initial data. The databases use the settings of the
+    default database, apart from their file names.
+
+    Returns a list of the numbers of objects loaded into each database, in
+    the order of ``paths``.
+    """
+    try:
+        plan = pickle.dumps(get_load_order(fixtures), pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError), e:
+        raise FixtureUsageError('The fixtures could not be pickled for the '\
+            'worker processes: %s' % e)
+    settings_dict = sqlite_settings()
+    tasks = [(plan, settings_dict, path, create_schema) for path in paths]
+    if processes is None:
+        processes = min(len(paths), multiprocessing.cpu_count())
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_provision_database, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def sqlite_settings():
+    """
+    The database settings that the databases written by
+    ``provision_sqlite_databases`` use, apart from their file names.
+    """
+    settings_dict = dict(connections.databases[DEFAULT_DB_ALIAS])
+    if settings_dict['ENGINE'] != 'django.db.backends.sqlite3':
+        # The settings are only reused for OPTIONS and the like
+        settings_dict = {'ENGINE': 'django.db.backends.sqlite3'}
+    return settings_dict
+
+
+def load_plan(load_order, using=DEFAULT_DB_ALIAS, lean=True):
+    """
+    Loads the fixtures of ``load_order``, a list in the order returned by
+    ``get_load_order``, each of them once, into the ``using`` database.
+    Unlike ``Fixture.load``, doesn't manage transactions. Returns the number
+    of objects loaded.
+    """
+    object_count = 0
+    # See Fixture.load
+    empty_tables = {}
+    for fixture in load_order:
+        fl = FixtureLoader(fixture, batch_size=fixture.batch_size,
+            lean=lean, empty_tables=empty_tables)
+        object_count += len(fl.load(using=using, raw=fixture.raw))
+        fl.create_m2m_relations(using=using)
+    return object_count
+
+
+def _provision_database(task):
+    plan, settings_dict, path, create_schema = task
+    settings_dict = dict(settings_dict, NAME=path)
+    settings_dict.setdefault('OPTIONS', {})
+    connections.databases[WORKER_DB_ALIAS] = settings_dict
+    try:
+        if create_schema:
+            call_command('syncdb', database=WORKER_DB_ALIAS, interactive=False,
+                verbosity=0, load_initial_data=False)
+        transaction.enter_transaction_management(using=WORKER_DB_ALIAS)
+        transaction.managed(True, using=WORKER_DB_ALIAS)
+        try:
+            object_count = load_plan(pickle.loads(plan), using=WORKER_DB_ALIAS)
+        except:
+            transaction.rollback(using=WORKER_DB_ALIAS)
+            transaction.leave_transaction_management(using=WORKER_DB_ALIAS)
+            raise
+        transaction.commit(using=WORKER_DB_ALIAS)
+        transaction.leave_transaction_management(using=WORKER_DB_ALIAS)
+        return object_count
+    finally:
+        connections[WORKER_DB_ALIAS].close()
+        # Workers get reused for other database files, so don't leave the
+        # connection lying around in the cache of the connection handler.
+        cache = connections._connections
+        if isinstance(cache, dict):
+            cache.pop(WORKER_DB_ALIAS, None)
+        elif hasattr(cache, WORKER_DB_ALIAS):
+            delattr(cache, WORKER_DB_ALIAS)
+        del connections.databases[WORKER_DB_ALIAS]
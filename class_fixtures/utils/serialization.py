@@ -5,9 +5,13 @@ except ImportError:
 
 from django.core.serializers.base import SerializationError, DeserializationError
 from django.core.serializers.python import _get_model
-from django.db import models
+from django.db import models, router
+from django.db.models.query import QuerySet
 from django.utils.encoding import smart_unicode
 
+from class_fixtures.utils import chunked
+from class_fixtures.utils.db import SQLITE_MAX_PARAMS
+
 class ClassicReprOrderedDict(OrderedDict):
     """An OrderedDict subclass with a custom, dict-like __repr__ method."""
     def __repr__(self):
@@ -18,9 +22,10 @@ class ClassicReprOrderedDict(OrderedDict):
             itemlist.append("%r: %r" % (k,v))
         return '{%s}' % ', '.join(itemlist)
 
-def dump_class_fixtures(objects, stream, **options):
+def write_module_header(objects, stream):
     """
-    Generate fixture modules.
+    Writes the import rows and ``Fixture`` instantiations of a fixture module
+    containing ``objects``.
     """
     # Construct and output the import rows
     apps_models = {}
@@ -58,6 +63,13 @@ def dump_class_fixtures(objects, stream, **options):
 
     stream.write('\n'.join(fixture_instantiations) + '\n\n')
 
+
+def dump_class_fixtures(objects, stream, **options):
+    """
+    Generate fixture modules.
+    """
+    write_module_header(objects, stream)
+
     # Construct and output the Fixture.add() calls in the dependency-resolved
     # order that 'objects' is in. The field names are in the "fields"
     # dictionary which, being a dictionary, is unordered. To make the output
@@ -67,3 +79,172 @@ def dump_class_fixtures(objects, stream, **options):
         app, model = identifier.split('.')
         kwargs = ClassicReprOrderedDict(sorted(fields.items(), key=lambda field: field[0]))
         stream.write('%s_%s_fixture.add(%s, **%s)\n' % (app, model, pk, repr(kwargs)))
+
+
+def dump_columnar_class_fixtures(objects, stream, **options):
+    """
+    Generate fixture modules that use ``Fixture.add_rows`` instead of
+    ``Fixture.add``. Each consecutive run of objects of the same model
+    becomes a single call with one field name header and a tuple of row
+    tuples, instead of repeating the field names for every object.
+    """
+    write_module_header(objects, stream)
+
+    # Same ordering guarantees as in dump_class_fixtures. Field names are
+    # alphabetized for the header, and the values of each row follow them.
+    current_block = None
+    for pk, identifier, fields in [(d['pk'], d['model'], d['fields']) for d in objects]:
+        app, model = identifier.split('.')
+        field_names = tuple(sorted(fields.keys()))
+        if current_block != (app, model, field_names):
+            if current_block is not None:
+                stream.write('))\n')
+            current_block = (app, model, field_names)
+            stream.write('%s_%s_fixture.add_rows(%r, (\n' % (app, model, field_names))
+        row = (pk,) + tuple([fields[name] for name in field_names])
+        stream.write('    %r,\n' % (row,))
+    if current_block is not None:
+        stream.write('))\n')
+
+
+def collect_subset(seed, pks=None, using=None):
+    """
+    Collects the objects of ``seed`` and everything they refer to through
+    their foreign key, one-to-one and many-to-many fields, directly or
+    through other objects, so that the result can be dumped into a fixture
+    module that loads on its own into an empty database.
+
+    ``seed`` is either a QuerySet or a model class, in which case ``pks`` is
+    a list of the primary keys of the objects to start from.
+
+    Relations are followed from the end where they are defined, like the
+    ``fk``/``m2m``/``o2o`` relations of fixtures: an object brings along the
+    objects it refers to, not the ones referring to it. Many-to-many fields
+    with custom intermediary models are not followed, since the serializers
+    leave them out anyway.
+
+    The objects are fetched a level of references at a time, with one
+    ``in_bulk`` query per model and one query per many-to-many field, each
+    split into chunks of primary keys that fit in an SQLite statement.
+    Returns a list of the objects, in an order where objects come after the
+    ones they refer to, save for circular references between models.
+    """
+    if isinstance(seed, QuerySet):
+        using = using or seed.db
+        model = seed.model
+        pks = list(seed.values_list('pk', flat=True))
+    else:
+        model = seed
+        using = using or router.db_for_read(model)
+        pks = [model._meta.pk.to_python(pk) for pk in pks]
+
+    # Models as keys, {pk: object} dictionaries as values
+    collected = {}
+    # Models as keys, sets of the primary keys to fetch next as values
+    level = {model: set(pks)}
+    while level:
+        next_level = {}
+        def refer(target, pk):
+            if pk is not None and pk not in collected.get(target, {}):
+                next_level.setdefault(target, set()).add(pk)
+
+        # Foreign keys pointing to fields other than the primary key, as
+        # (model, fieldname) tuples as keys and sets of values as values
+        other_keys = {}
+        for model, model_pks in level.items():
+            objects = {}
+            for pks in chunked(model_pks, SQLITE_MAX_PARAMS):
+                objects.update(model._default_manager.db_manager(using).in_bulk(pks))
+            collected.setdefault(model, {}).update(objects)
+            for field in model._meta.fields:
+                if field.rel is None:
+                    continue
+                target = field.rel.to
+                to_field = field.rel.field_name
+                for obj in objects.values():
+                    value = getattr(obj, field.attname)
+                    if to_field == target._meta.pk.name:
+                        refer(target, value)
+                    elif value is not None:
+                        other_keys.setdefault((target, to_field), set()).add(value)
+            for field in model._meta.many_to_many:
+                through = field.rel.through
+                if not through._meta.auto_created or not objects:
+                    continue
+                for pks in chunked(objects.keys(), SQLITE_MAX_PARAMS):
+                    rows = through._default_manager.db_manager(using).filter(
+                        **{'%s__in' % field.m2m_field_name(): pks}).values_list(
+                        field.m2m_reverse_field_name(), flat=True)
+                    for pk in rows:
+                        refer(field.rel.to, pk)
+        for (target, to_field), values in other_keys.items():
+            for chunk in chunked(values, SQLITE_MAX_PARAMS):
+                for pk in target._default_manager.db_manager(using).filter(
+                        **{'%s__in' % to_field: chunk}).values_list('pk', flat=True):
+                    refer(target, pk)
+        level = next_level
+
+    ordered = []
+    for model in _sort_models(collected.keys()):
+        ordered.extend(_sort_objects(model, collected[model]))
+    return ordered
+
+
+def _get_model_dependencies(model):
+    dependencies = set()
+    for field in model._meta.fields:
+        if field.rel is not None:
+            dependencies.add(field.rel.to)
+    for field in model._meta.many_to_many:
+        if field.rel.through._meta.auto_created:
+            dependencies.add(field.rel.to)
+    dependencies.discard(model)
+    return dependencies
+
+
+def _sort_models(model_list):
+    """
+    Orders ``model_list`` so that models come after the models they refer
+    to. Models in reference cycles are placed in the order they were given.
+    """
+    model_list = sorted(model_list, key=lambda m: (m._meta.app_label, m._meta.object_name))
+    ordered = []
+    visiting = set()
+    def visit(model):
+        if model in ordered or model in visiting:
+            return
+        visiting.add(model)
+        for dependency in _get_model_dependencies(model):
+            if dependency in model_list:
+                visit(dependency)
+        visiting.discard(model)
+        ordered.append(model)
+    for model in model_list:
+        visit(model)
+    return ordered
+
+
+def _sort_objects(model, objects):
+    """
+    Orders the objects of ``model``, given as a ``{pk: object}`` dictionary,
+    by primary key, except that objects referring to other objects of the
+    same model through foreign keys come after them.
+    """
+    self_fields = [f for f in model._meta.fields
+        if f.rel is not None and f.rel.to == model and f.rel.field_name == model._meta.pk.name]
+    if not self_fields:
+        return [objects[pk] for pk in sorted(objects)]
+    ordered = []
+    placed = set()
+    def visit(pk):
+        if pk in placed:
+            return
+        placed.add(pk)
+        for field in self_fields:
+            referred = getattr(objects[pk], field.attname)
+            if referred in objects:
+                visit(referred)
+        ordered.append(objects[pk])
+    for pk in sorted(objects):
+        visit(pk)
+    return ordered
@@ -0,0 +1,163 @@
+"""Loading one set of class-based fixtures across several databases"""
+import sys
+import threading
+
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+
+from class_fixtures.exceptions import FixtureUsageError
+from class_fixtures.models import DelayedRelatedObjectLoader, FixtureLoader
+from class_fixtures.utils import get_load_order
+
+
+def router_shard(model, pk):
+    """
+    The default ``shard_for`` function. Asks the database routers where an
+    object of ``model`` with primary key ``pk`` is written, with an unsaved
+    instance of the model as the ``instance`` hint.
+    """
+    return router.db_for_write(model, instance=model(pk=pk))
+
+
+def plan_shards(fixtures, shard_for=router_shard):
+    """
+    Figures out which database each object of ``fixtures`` and their
+    dependencies goes to, by calling ``shard_for`` with the model and the
+    primary key of every object.
+
+    Returns a dictionary with database aliases as keys and ``{fixture: set
+    of primary keys}`` dictionaries as values. Raises FixtureUsageError if an
+    object refers to an object of another Fixture that goes to a different
+    database, since relations can't cross databases.
+    """
+    plan = {}
+    def assign(fixture, pk):
+        alias = shard_for(fixture.model, pk)
+        plan.setdefault(alias, {}).setdefault(fixture, set()).add(pk)
+        return alias
+
+    def check(fixture, pk, alias, values):
+        for value in values:
+            if not isinstance(value, (list, tuple)):
+                value = [value]
+            for v in value:
+                if not isinstance(v, DelayedRelatedObjectLoader):
+                    continue
+                other_model = v.fixture_instance.model
+                other_pk = other_model._meta.pk.to_python(v.pk)
+                other_alias = shard_for(other_model, other_pk)
+                if other_alias != alias:
+                    raise FixtureUsageError('%s %s goes to the "%s" database but '\
+                        'refers to %s %s, which goes to "%s". Relations across '\
+                        'databases are not supported.' % (fixture.model._meta.object_name,
+                        pk, alias, other_model._meta.object_name, other_pk, other_alias))
+
+    for fixture in get_load_order(fixtures):
+        to_python = fixture.model._meta.pk.to_python
+        for pk, definitions in fixture._iter_definitions():
+            pk = to_python(pk)
+            check(fixture, pk, assign(fixture, pk), definitions.values())
+        for random_range in fixture._random_ranges:
+            values = random_range.values.values() + random_range.m2m_values.values()
+            for pk in xrange(random_range.first_pk, random_range.last_pk + 1):
+                check(fixture, pk, assign(fixture, pk), values)
+    return plan
+
+
+def is_in_memory(alias):
+    """
+    Returns True if the ``alias`` database is an in-memory SQLite database,
+    which only the thread that created it can see.
+    """
+    settings_dict = connections[alias].settings_dict
+    name = settings_dict.get('NAME') or ''
+    return settings_dict['ENGINE'] == 'django.db.backends.sqlite3' and \
+        (name in ('', ':memory:') or 'mode=memory' in name)
+
+
+def load_sharded(fixtures, shard_for=None, concurrent=True, lean=False):
+    """
+    Loads ``fixtures`` and their dependencies so that every object goes to
+    the database that ``shard_for`` (see ``plan_shards``) names for it. The
+    objects of each database are loaded in a transaction of their own, and
+    with ``concurrent``, in a thread of its own with its own connection.
+
+    All the references between objects are checked before anything is
+    written. Returns a dictionary with database aliases as keys and the
+    numbers of objects loaded into them as values. If loading into any of
+    the databases fails, the first exception is raised once all the threads
+    have finished; the other databases keep what was loaded into them.
+
+    If any of the databases is an in-memory SQLite database, like those of
+    test runs, the databases are loaded one after another in the calling
+    thread instead, since the connections of other threads would get
+    databases of their own.
+    """
+    plan = plan_shards(fixtures, shard_for or router_shard)
+    if concurrent and [alias for alias in plan if is_in_memory(alias)]:
+        concurrent = False
+    load_order = get_load_order(fixtures)
+    for fixture in load_order:
+        fixture._adding_allowed = False
+    object_counts = {}
+    errors = []
+
+    def load_shard(alias):
+        try:
+            try:
+                object_counts[alias] = _load_shard(load_order, plan[alias], alias, lean)
+            finally:
+                if concurrent:
+                    # The connection belongs to this thread
+                    connections[alias].close()
+        except Exception:
+            errors.append(sys.exc_info())
+
+    if concurrent:
+        threads = [threading.Thread(target=load_shard, args=(alias,)) for alias in plan]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        for alias in plan:
+            load_shard(alias)
+    if errors:
+        exc_type, exc_value, exc_traceback = errors[0]
+        raise exc_type, exc_value, exc_traceback
+    return object_counts
+
+
+def _load_shard(load_order, shard_plan, alias, lean):
+    object_count = 0
+    # Shared by the loads into this database only, see Fixture.load
+    empty_tables = {}
+    written_models = set()
+    transaction.enter_transaction_management(using=alias)
+    transaction.managed(True, using=alias)
+    try:
+        for fixture in load_order:
+            pks = shard_plan.get(fixture)
+            if not pks:
+                continue
+            if router.allow_syncdb(alias, fixture.model):
+                written_models.add(fixture.model)
+                written_models.update(fixture.model._meta.get_parent_list())
+            fl = FixtureLoader(fixture, batch_size=fixture.batch_size, lean=lean,
+                empty_tables=empty_tables, pks=pks)
+            object_count += len(fl.load(using=alias, raw=fixture.raw))
+            fl.create_m2m_relations(using=alias)
+        # As in loaddata, so that later inserts don't collide with the
+        # explicit primary keys of the loaded objects
+        if written_models:
+            connection = connections[alias]
+            cursor = connection.cursor()
+            for line in connection.ops.sequence_reset_sql(no_style(), list(written_models)):
+                cursor.execute(line)
+    except:
+        transaction.rollback(using=alias)
+        transaction.leave_transaction_management(using=alias)
+        raise
+    transaction.commit(using=alias)
+    transaction.leave_transaction_management(using=alias)
+    return object_count
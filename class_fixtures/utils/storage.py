@@ -0,0 +1,169 @@
+"""Compact storage for the object definitions of Fixture instances"""
+from array import array
+
+class _Missing(object):
+    def __reduce__(self):
+        # Unpickle as the module-level instance, since it's compared by
+        # identity.
+        return 'MISSING'
+
+    def __repr__(self):
+        return 'MISSING'
+
+# Marks the rows of a column for which no value was given, since None is a
+# perfectly good field value.
+MISSING = _Missing()
+
+ARRAY_TYPECODES = {
+    int: 'l',
+    float: 'd',
+}
+
+# The number of rows after which a column whose unicode values are mostly
+# distinct stops interning them, see ColumnarStorage._intern
+INTERN_SAMPLE_SIZE = 100
+
+
+class ColumnarStorage(object):
+    """
+    An insertion-ordered mapping of primary keys to definition dictionaries,
+    used as ``Fixture._kwarg_storage``. Instead of keeping a dictionary per
+    object, the values of each field are stored in a column of their own,
+    indexed by the position of the primary key:
+
+    * Field names are stored once per column instead of once per object.
+    * Columns of plain integers or floats are stored in an ``array`` rather
+      than a list of Python objects, until a value of some other type shows
+      up.
+    * Repeated strings are interned, so they're only stored once.
+
+    Dictionaries are rebuilt from the columns when accessed. The ``pk`` key
+    of the definitions is not stored in a column, it's re-added from the
+    primary key index.
+
+    Values that the loader tells apart by their dictionary type are retained
+    as well: definitions stored as a dict subclass (``DelayedMilkmanDelivery``)
+    are returned as instances of that class.
+    """
+    def __init__(self):
+        self._pks = []
+        # PK values as keys, positions in self._pks and the columns as values
+        self._index = {}
+        # Field names as keys, lists or arrays of values as values
+        self._columns = {}
+        # Positions as keys, dict subclasses as values, for definitions that
+        # were not stored as plain dictionaries.
+        self._row_types = {}
+        # Field names as keys, dictionaries of interned unicode values as
+        # values, or None for columns that have stopped interning.
+        self._interned = {}
+
+    def __len__(self):
+        return len(self._pks)
+
+    def __contains__(self, pk):
+        return pk in self._index
+
+    def __iter__(self):
+        return iter(self._pks)
+
+    def __getitem__(self, pk):
+        return self._get_row(self._index[pk])
+
+    def __setitem__(self, pk, definitions):
+        position = self._index.get(pk)
+        if position is None:
+            position = len(self._pks)
+            self._pks.append(pk)
+            self._index[pk] = position
+        if type(definitions) is not dict:
+            self._row_types[position] = type(definitions)
+        else:
+            self._row_types.pop(position, None)
+
+        for fieldname in self._columns.keys():
+            if fieldname not in definitions:
+                self._set_value(fieldname, position, MISSING)
+        for fieldname, value in definitions.iteritems():
+            if fieldname == 'pk':
+                continue
+            value = self._intern(fieldname, position, value)
+            if fieldname not in self._columns:
+                self._columns[fieldname] = self._new_column(value, position)
+            self._set_value(fieldname, position, value)
+
+    def _intern(self, fieldname, position, value):
+        """
+        Returns the instance to store for ``value`` in the column of
+        ``fieldname``. ``str`` values go through the builtin ``intern``,
+        which lets go of them once they're no longer used. ``unicode`` values
+        can't, so each column has a table of its own. Once a column turns
+        out to hold mostly distinct values, its table would only keep
+        another reference to every row, so it's dropped for good.
+        """
+        if type(value) is str:
+            return intern(value)
+        if type(value) is not unicode:
+            return value
+        table = self._interned.setdefault(fieldname, {})
+        if table is None:
+            return value
+        value = table.setdefault(value, value)
+        if position >= INTERN_SAMPLE_SIZE and len(table) > position // 2:
+            self._interned[fieldname] = None
+        return value
+
+    def _new_column(self, value, position):
+        typecode = ARRAY_TYPECODES.get(type(value))
+        if typecode is not None and position == 0:
+            return array(typecode)
+        return [MISSING] * position
+
+    def _set_value(self, fieldname, position, value):
+        column = self._columns[fieldname]
+        if isinstance(column, array):
+            if ARRAY_TYPECODES.get(type(value)) == column.typecode:
+                try:
+                    if position == len(column):
+                        column.append(value)
+                    else:
+                        column[position] = value
+                    return
+                except OverflowError:
+                    pass
+            # Not representable in the array, switch to a list for good
+            column = self._columns[fieldname] = list(column)
+        if position == len(column):
+            column.append(value)
+        else:
+            column[position] = value
+
+    def _get_row(self, position):
+        row_type = self._row_types.get(position, dict)
+        definitions = row_type()
+        for fieldname, column in self._columns.iteritems():
+            value = column[position]
+            if value is not MISSING:
+                definitions[fieldname] = value
+        definitions['pk'] = self._pks[position]
+        return definitions
+
+    def keys(self):
+        return list(self._pks)
+
+    def iterkeys(self):
+        return iter(self._pks)
+
+    def itervalues(self):
+        for position in xrange(len(self._pks)):
+            yield self._get_row(position)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def iteritems(self):
+        for position, pk in enumerate(self._pks):
+            yield pk, self._get_row(position)
+
+    def items(self):
+        return list(self.iteritems())
@@ -0,0 +1,200 @@
+"""Applying the edits of fixture modules to a database as they're saved"""
+from django.core.management.color import no_style
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+
+from class_fixtures.models import FixtureLoader, _hashable_value
+from class_fixtures.utils import get_load_order
+from class_fixtures.utils.db import delete_objects, raw_delete
+from class_fixtures.utils.loaddata import (file_mtime,
+    get_fixtures_from_module, reload_fixture_module, source_file)
+
+
+def module_fixtures(module):
+    """
+    Returns the Fixtures found in ``module`` that were labelled after it,
+    leaving out those imported into it from other modules.
+    """
+    prefix = module.__name__ + '.'
+    return [fixture for fixture in get_fixtures_from_module(module)
+        if fixture.label and fixture.label.startswith(prefix)]
+
+
+def definition_signatures(fixtures):
+    """
+    Returns a dictionary with the models of ``fixtures`` as keys and
+    ``{pk: signature}`` dictionaries as values, where the signatures compare
+    equal for objects that would be written the same way. Each signature is
+    a ``(fieldnames, contents)`` tuple. Dependencies are not included.
+    """
+    signatures = {}
+    for fixture in fixtures:
+        to_python = fixture.model._meta.pk.to_python
+        model_signatures = signatures.setdefault(fixture.model, {})
+        for pk, definitions in fixture._iter_definitions():
+            items = tuple(sorted([(fieldname, _hashable_value(value))
+                for fieldname, value in definitions.items() if fieldname != 'pk']))
+            model_signatures[to_python(pk)] = (tuple([item[0] for item in items]),
+                (type(definitions).__name__, items))
+        for random_range in fixture._random_ranges:
+            fieldnames = tuple(sorted(random_range.values.keys() +
+                random_range.m2m_values.keys() + random_range.factories.keys()))
+            contents = (random_range.first_pk, random_range.last_pk, random_range.seed,
+                tuple(sorted([(fieldname, _hashable_value(value)) for fieldname, value in random_range.values.items()])),
+                tuple(sorted([(fieldname, _hashable_value(value)) for fieldname, value in random_range.m2m_values.items()])))
+            if random_range.factories:
+                # Factories can't be compared, so their objects always count
+                # as changed.
+                contents += (object(),)
+            for pk in xrange(random_range.first_pk, random_range.last_pk + 1):
+                model_signatures[pk] = (fieldnames, contents)
+    return signatures
+
+
+class WatchedModule(object):
+    """
+    A fixture module, along with the modification time of its source file
+    and the signatures of its definitions as of the last time it was loaded.
+    """
+    def __init__(self, module):
+        self.module = module
+        self.filename = source_file(module)
+        self.mtime = file_mtime(self.filename)
+        self.fixtures = module_fixtures(module)
+        self.signatures = definition_signatures(self.fixtures)
+
+    def has_changed(self):
+        return file_mtime(self.filename) != self.mtime
+
+
+class FixtureWatcher(object):
+    """
+    Keeps the objects of fixture ``modules`` in the ``using`` database up to
+    date with their source files. See ``poll``.
+    """
+    def __init__(self, modules, using=DEFAULT_DB_ALIAS):
+        self.watched = [WatchedModule(module) for module in modules]
+        self.using = using
+
+    def poll(self):
+        """
+        Reloads the modules whose source files have changed since the last
+        call, compares their definitions against the previous versions by
+        primary key, and applies the differences to the database in one
+        transaction: objects no longer defined are deleted, and new and
+        changed ones are upserted, i.e. only the changed fields of existing
+        objects are written. The M2M relations that changed objects have
+        through automatically created intermediary tables are written anew.
+
+        Returns None if nothing had changed, or a ``(module names, inserted,
+        updated, deleted)`` tuple. If reloading a module or writing the
+        changes fails, the exception is raised and the database is left as
+        it was. The changes are then applied along with the next edit.
+        """
+        changed = [watched for watched in self.watched if watched.has_changed()]
+        if not changed:
+            return None
+        reloaded = []
+        for watched in changed:
+            # A broken edit is retried when it's saved again
+            watched.mtime = file_mtime(watched.filename)
+            reload_fixture_module(watched.module)
+            fixtures = module_fixtures(watched.module)
+            reloaded.append((watched, fixtures, definition_signatures(fixtures)))
+
+        # Models as keys, sets of primary keys as values
+        deleted = {}
+        # Models as keys, dictionaries with the primary keys of changed
+        # existing objects as keys and the field names of their old and new
+        # definitions as values
+        rewritten = {}
+        # The new Fixtures as keys, sets of the primary keys to upsert as
+        # values
+        selected = {}
+        old_fixtures = []
+        new_fixtures = []
+        for watched, fixtures, signatures in reloaded:
+            old_fixtures.extend(watched.fixtures)
+            new_fixtures.extend(fixtures)
+            changed_pks = {}
+            for model in set(watched.signatures.keys() + signatures.keys()):
+                old = watched.signatures.get(model, {})
+                new = signatures.get(model, {})
+                gone = [pk for pk in old if pk not in new]
+                if gone:
+                    deleted.setdefault(model, set()).update(gone)
+                changed_pks[model] = set([pk for pk in new if old.get(pk) != new[pk]])
+                fieldnames = rewritten.setdefault(model, {})
+                for pk in changed_pks[model]:
+                    if pk in old:
+                        fieldnames[pk] = set(old[pk][0]) | set(new[pk][0])
+            for fixture in fixtures:
+                to_python = fixture.model._meta.pk.to_python
+                pks = set([to_python(pk) for pk in fixture.iter_pks()]) & changed_pks[fixture.model]
+                if pks:
+                    selected[fixture] = pks
+
+        order = []
+        for fixture in get_load_order(old_fixtures + new_fixtures):
+            if fixture.model not in order:
+                order.append(fixture.model)
+        outcomes = {}
+        using = self.using
+        transaction.enter_transaction_management(using=using)
+        transaction.managed(True, using=using)
+        try:
+            for model in reversed(order):
+                if model in deleted:
+                    delete_objects(model, list(deleted[model]), using=using)
+            for model, fieldnames in rewritten.items():
+                self._clear_m2m_relations(model, fieldnames)
+            # See Fixture.load
+            empty_tables = {}
+            for fixture in get_load_order(new_fixtures):
+                if fixture not in selected:
+                    continue
+                fl = FixtureLoader(fixture, batch_size=fixture.batch_size, upsert=True,
+                    outcomes=outcomes, empty_tables=empty_tables, pks=selected[fixture])
+                fl.load(using=using, raw=fixture.raw)
+                fl.create_m2m_relations(using=using)
+            inserted_models = set([model for (model, pk), outcome in outcomes.items() if outcome == 'inserted'])
+            if inserted_models:
+                # As in loaddata
+                cursor = connections[using].cursor()
+                for line in connections[using].ops.sequence_reset_sql(no_style(), list(inserted_models)):
+                    cursor.execute(line)
+        except:
+            transaction.rollback(using=using)
+            transaction.leave_transaction_management(using=using)
+            raise
+        transaction.commit(using=using)
+        transaction.leave_transaction_management(using=using)
+
+        for watched, fixtures, signatures in reloaded:
+            watched.fixtures = fixtures
+            watched.signatures = signatures
+        # Upserts only compare fields, the M2M relations of objects left
+        # "unchanged" may have been rewritten.
+        for model, fieldnames in rewritten.items():
+            for pk in fieldnames:
+                if outcomes.get((model, pk)) == 'unchanged':
+                    outcomes[(model, pk)] = 'updated'
+        outcomes = outcomes.values()
+        return ([watched.module.__name__ for watched in changed], outcomes.count('inserted'),
+            outcomes.count('updated'), sum([len(pks) for pks in deleted.values()]))
+
+    def _clear_m2m_relations(self, model, fieldnames):
+        """
+        Deletes the M2M relations of the changed objects of ``model`` in the
+        automatically created intermediary tables of the M2M fields that
+        their old or new definitions mention, so that the upserts write
+        exactly the relations defined. ``fieldnames`` has primary keys as
+        keys and sets of field names as values.
+        """
+        for field in model._meta.many_to_many:
+            through = field.rel.through
+            if not through._meta.auto_created:
+                continue
+            pks = [pk for pk, names in fieldnames.items() if field.name in names]
+            if pks:
+                raw_delete(through._default_manager.db_manager(self.using).filter(
+                    **{'%s__in' % field.m2m_field_name(): pks}), self.using)